@@ -0,0 +1,14 @@
+"""
+Performance benchmarks for the order book, syncing and processing hot paths.
+
+Run from the project root:
+    python -m benchmarks.run_benchmarks --save      # record a new baseline
+    python -m benchmarks.run_benchmarks --compare   # compare against the saved baseline
+"""
+
+import os
+import sys
+
+# Modules in src/ import each other as top level packages (e.g. `from wb_sockets import ...`),
+# the same way main.py sees them, so src/ has to be importable for the benchmarks too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,45 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.aggregation import AggregatedLadders
+from wb_sockets.processing import to_do_processing_logic
+
+NUM_LEVELS = 5000
+NUM_MESSAGES = 1000
+BUCKET_SIZES = (0.1, 1, 10, 100)
+TOP_N = 10
+
+
+def _reaggregate(levels, bucket_size, is_bid):
+    # What every consumer does today: group all the levels of the side again
+    buckets = {}
+    for price, qty in levels.items():
+        bucket = (price // bucket_size if is_bid else -(-price // bucket_size)) * bucket_size
+        buckets[bucket] = buckets.get(bucket, 0) + qty
+    return sorted(buckets.items(), reverse=is_bid)[:TOP_N]
+
+
+def _register(incremental: bool) -> None:
+    # Per update: apply it, then read the top buckets of both sides at every bucket size
+    @benchmark(f'aggregation.{"ladders" if incremental else "reaggregate"}[{NUM_LEVELS},sizes={len(BUCKET_SIZES)}]')
+    async def _setup():
+        snapshot = make_snapshot(NUM_LEVELS)
+        messages = make_depth_updates(snapshot, NUM_MESSAGES)
+        order_book = await _initialised_order_book(snapshot)
+        ladders = AggregatedLadders(order_book, BUCKET_SIZES) if incremental else None
+
+        async def run():
+            for message in messages:
+                await to_do_processing_logic(order_book, message)
+                for bucket_size in BUCKET_SIZES:
+                    if incremental:
+                        ladders.top(bucket_size, 'bids', TOP_N)
+                        ladders.top(bucket_size, 'asks', TOP_N)
+                    else:
+                        _reaggregate(order_book.ob_bids, bucket_size, True)
+                        _reaggregate(order_book.ob_asks, bucket_size, False)
+        return run, len(messages)
+
+
+_register(False)
+_register(True)
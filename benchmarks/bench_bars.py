@@ -0,0 +1,49 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.bars import BarBuilder, _IntervalBars
+from wb_sockets.processing import to_do_processing_logic
+
+NUM_LEVELS = 5000
+NUM_MESSAGES = 1000
+INTERVALS_MS = (100, 1000, 60000)
+TOP_N = 10
+
+
+def _values_from_snapshot(order_book):
+    # What a downstream consumer does with a full snapshot: copy and sort the book, then derive the values
+    bids = sorted(order_book.ob_bids.items(), reverse=True)
+    asks = sorted(order_book.ob_asks.items())
+    (best_bid, bid_qty), (best_ask, ask_qty) = bids[0], asks[0]
+    top_bids, top_asks = sum(qty for _, qty in bids[:TOP_N]), sum(qty for _, qty in asks[:TOP_N])
+    return ((best_bid + best_ask) / 2, (best_bid * ask_qty + best_ask * bid_qty) / (bid_qty + ask_qty),
+            best_ask - best_bid, (top_bids - top_asks) / (top_bids + top_asks))
+
+
+def _register(incremental: bool) -> None:
+    # Per applied update, bars of every interval included
+    @benchmark(f'bars.{"incremental" if incremental else "from_snapshots"}[{NUM_LEVELS},intervals={len(INTERVALS_MS)}]')
+    async def _setup():
+        snapshot = make_snapshot(NUM_LEVELS)
+        messages = make_depth_updates(snapshot, NUM_MESSAGES)
+        order_book = await _initialised_order_book(snapshot)
+        builder = BarBuilder(INTERVALS_MS, TOP_N)
+        builder.attach(order_book)
+        intervals = [_IntervalBars(interval_ms) for interval_ms in INTERVALS_MS]
+        if not incremental:
+            builder.close()
+
+        async def run():
+            for message in messages:
+                await to_do_processing_logic(order_book, message)
+                if incremental:
+                    builder.record(order_book, message)
+                else:
+                    values = _values_from_snapshot(order_book)
+                    for bars in intervals:
+                        bars.update(message['E'], values)
+        return run, len(messages)
+
+
+_register(False)
+_register(True)
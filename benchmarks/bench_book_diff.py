@@ -0,0 +1,34 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.book_diff import diff_order_books
+from wb_sockets.processing import to_do_processing_logic
+
+BOOK_SIZES = (1000, 5000)
+NUM_MESSAGES = 200
+
+
+async def _prepared_books(num_levels: int):
+    # Two versions of one book, NUM_MESSAGES depth updates apart
+    snapshot = make_snapshot(num_levels)
+    old, new = await _initialised_order_book(snapshot), await _initialised_order_book(snapshot)
+    for message in make_depth_updates(snapshot, NUM_MESSAGES):
+        await to_do_processing_logic(new, message)
+    return old, new
+
+
+def _register(num_levels: int, depth: int | None) -> None:
+    suffix = '' if depth is None else f'_top{depth}'
+
+    @benchmark(f'order_book.diff{suffix}[{num_levels}]')
+    async def _setup():
+        old, new = await _prepared_books(num_levels)
+
+        def run():
+            diff_order_books(old, new, depth)
+        return run, 1
+
+
+for _size in BOOK_SIZES:
+    _register(_size, None)
+    _register(_size, 100)
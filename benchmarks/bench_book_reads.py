@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from wb_sockets.processing import to_do_processing_logic
+
+NUM_LEVELS = 5000
+NUM_MESSAGES = 1000
+READER_COUNTS = (1, 4, 16)
+READS_PER_READER = 2000
+DEPTH = 20
+
+
+class _Writer:
+    """
+    Applies the updates in a loop at full rate on its own thread, as the threaded processing does
+    """
+    def __init__(self, order_book, messages: list[dict]):
+        self.order_book = order_book
+        self.messages = messages
+        self.applied = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name='book-writer', daemon=True)
+
+    async def _run(self):
+        while not self._stop.is_set():
+            for message in self.messages:
+                await to_do_processing_logic(self.order_book, message)
+                self.applied += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _read_concurrently(order_book, num_readers: int) -> None:
+    def read():
+        for _ in range(READS_PER_READER):
+            order_book.top_levels(DEPTH)
+    readers = [threading.Thread(target=read) for _ in range(num_readers)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+
+
+def _register(num_readers: int, published: bool) -> None:
+    # Per consistent read of the top levels, with the writer updating the book all along
+    @benchmark(f'order_book.top_levels[{"published" if published else "seqlock"},readers={num_readers},depth={DEPTH}]')
+    async def _setup():
+        snapshot = make_snapshot(NUM_LEVELS)
+        order_book = await _initialised_order_book(snapshot)
+        if published:
+            order_book.publish_top_levels(DEPTH)
+        writer = _Writer(order_book, make_depth_updates(snapshot, NUM_MESSAGES))
+
+        def run():
+            writer.start()
+            try:
+                _read_concurrently(order_book, num_readers)
+            finally:
+                writer.stop()
+        return run, num_readers * READS_PER_READER
+
+
+for _published in (False, True):
+    for _num_readers in READER_COUNTS:
+        _register(_num_readers, _published)
+
+
+async def _main():
+    snapshot = make_snapshot(NUM_LEVELS)
+    messages = make_depth_updates(snapshot, NUM_MESSAGES)
+    for published, num_readers in ((False, 0), (True, 0), *((published, num_readers) for published in (False, True)
+                                                            for num_readers in READER_COUNTS)):
+        order_book = await _initialised_order_book(snapshot)
+        if published:
+            order_book.publish_top_levels(DEPTH)
+        writer = _Writer(order_book, messages)
+        started = time.perf_counter()
+        writer.start()
+        if num_readers:
+            _read_concurrently(order_book, num_readers)
+        else:
+            time.sleep(0.5)
+        writer.stop()
+        elapsed = time.perf_counter() - started
+        print(f'{"published" if published else "seqlock":<10} readers={num_readers:<3} reads/s {num_readers * READS_PER_READER / elapsed:>10.0f}   '
+              f'updates/s {writer.applied / elapsed:>8.0f}   retries {order_book.read_retries}')
+
+
+if __name__ == '__main__':
+    # Read throughput next to the update rate the writer keeps, and how often a read had to start again
+    asyncio.run(_main())
@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import tempfile
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot
+from src.order_book.columnar_store import ColumnarReader, ColumnarWriter
+
+DEPTH = 20
+NUM_ROWS = 20000
+QUERY_ROWS = 1000
+NUM_QUERIES = 100
+
+
+def _json_row(order_book, update_id):
+    # The JSON dump per update the store replaces
+    return json.dumps({'u': update_id, 'E': update_id,
+                       'bids': [[price, order_book.ob_bids[price]] for price in order_book.ob_bids_prices[:-DEPTH - 1:-1]],
+                       'asks': [[price, order_book.ob_asks[price]] for price in order_book.ob_asks_prices[:DEPTH]]})
+
+
+@benchmark(f'columnar_store.json_dump[depth={DEPTH}]')
+async def _setup_json_dump():
+    order_book = await _initialised_order_book(make_snapshot(1000))
+    directory = tempfile.mkdtemp(prefix='lob_bench_')
+
+    def run():
+        try:
+            with open(os.path.join(directory, 'books.jsonl'), 'w') as dump:
+                for update_id in range(NUM_ROWS):
+                    dump.write(_json_row(order_book, update_id) + '\n')
+        finally:
+            shutil.rmtree(directory)
+    return run, NUM_ROWS
+
+
+@benchmark(f'columnar_store.record[depth={DEPTH}]')
+async def _setup_record():
+    # Time the event loop spends per update, the rows are written on the writer thread
+    order_book = await _initialised_order_book(make_snapshot(1000))
+    directory = tempfile.mkdtemp(prefix='lob_bench_')
+    writer = ColumnarWriter(directory, DEPTH, capacity = NUM_ROWS, max_pending = NUM_ROWS)
+
+    def run():
+        try:
+            for update_id in range(NUM_ROWS):
+                order_book.last_update_id = update_id
+                writer.record(order_book, {'E': update_id})
+        finally:
+            writer.close()
+            shutil.rmtree(directory)
+    return run, NUM_ROWS
+
+
+def _register_query(columnar: bool) -> None:
+    @benchmark(f'columnar_store.{"by_update_id" if columnar else "json_scan"}[{NUM_ROWS},rows={QUERY_ROWS}]')
+    async def _setup():
+        order_book = await _initialised_order_book(make_snapshot(1000))
+        directory = tempfile.mkdtemp(prefix='lob_bench_')
+        writer = ColumnarWriter(directory, DEPTH, capacity = NUM_ROWS, max_pending = NUM_ROWS)
+        with open(os.path.join(directory, 'books.jsonl'), 'w') as dump:
+            for update_id in range(NUM_ROWS):
+                order_book.last_update_id = update_id
+                writer.record(order_book, {'E': update_id})
+                dump.write(_json_row(order_book, update_id) + '\n')
+        writer.close()
+        first = NUM_ROWS // 2
+
+        def run():
+            try:
+                if columnar:
+                    # Opening the store is part of every query
+                    for _ in range(NUM_QUERIES):
+                        reader = ColumnarReader(directory)
+                        rows = reader.by_update_id(first, first + QUERY_ROWS - 1)
+                        assert len(rows['update_id']) == QUERY_ROWS
+                        del rows
+                        reader.close()
+                else:
+                    with open(os.path.join(directory, 'books.jsonl')) as dump:
+                        rows = [row for row in map(json.loads, dump) if first <= row['u'] < first + QUERY_ROWS]
+                    assert len(rows) == QUERY_ROWS
+            finally:
+                shutil.rmtree(directory)
+        return run, NUM_QUERIES if columnar else 1
+
+
+_register_query(False)
+_register_query(True)
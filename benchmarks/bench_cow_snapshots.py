@@ -0,0 +1,81 @@
+import asyncio
+import tracemalloc
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from wb_sockets.processing import to_do_processing_logic
+
+NUM_LEVELS = 5000
+NUM_MESSAGES = 1000
+NUM_SNAPSHOTS = 2000
+# Readers alive at once in the update and memory runs, one snapshot taken every SNAPSHOT_EVERY updates
+READERS = 8
+SNAPSHOT_EVERY = 10
+
+
+def _copy(order_book) -> tuple:
+    # What a reader needs today to iterate the whole book while it's updated
+    return (order_book.last_update_id, dict(order_book.ob_bids), list(order_book.ob_bids_prices),
+            dict(order_book.ob_asks), list(order_book.ob_asks_prices))
+
+
+def _register_snapshot(cow: bool) -> None:
+    # Per snapshot of the whole book
+    @benchmark(f'order_book.{"take_snapshot" if cow else "copy"}[{NUM_LEVELS}]')
+    async def _setup():
+        order_book = await _initialised_order_book(make_snapshot(NUM_LEVELS))
+        order_book.enable_snapshots()
+
+        def run():
+            for _ in range(NUM_SNAPSHOTS):
+                order_book.take_snapshot() if cow else _copy(order_book)
+        return run, NUM_SNAPSHOTS
+
+
+def _register_updates(cow: bool) -> None:
+    # Per applied update, with READERS snapshots alive and a new one every SNAPSHOT_EVERY updates
+    @benchmark(f'order_book.updates_with_snapshots[{"cow" if cow else "copy"},readers={READERS}]')
+    async def _setup():
+        snapshot = make_snapshot(NUM_LEVELS)
+        messages = make_depth_updates(snapshot, NUM_MESSAGES)
+        order_book = await _initialised_order_book(snapshot)
+        if cow:
+            order_book.enable_snapshots()
+
+        async def run():
+            alive = []
+            for index, message in enumerate(messages):
+                await to_do_processing_logic(order_book, message)
+                if index % SNAPSHOT_EVERY == 0:
+                    alive = [*alive[-READERS + 1:], order_book.take_snapshot() if cow else _copy(order_book)]
+        return run, len(messages)
+
+
+for _cow in (False, True):
+    _register_snapshot(_cow)
+    _register_updates(_cow)
+
+
+async def _retained_bytes(cow: bool) -> int:
+    snapshot = make_snapshot(NUM_LEVELS)
+    messages = make_depth_updates(snapshot, READERS * 100)
+    order_book = await _initialised_order_book(snapshot)
+    if cow:
+        order_book.enable_snapshots()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    alive = []
+    for index, message in enumerate(messages):
+        if index % 100 == 0:
+            alive.append(order_book.take_snapshot() if cow else _copy(order_book))
+        await to_do_processing_logic(order_book, message)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return retained
+
+
+if __name__ == '__main__':
+    # Memory held by READERS snapshots taken 100 updates apart (the book itself is about the same in both runs)
+    for _cow in (False, True):
+        print(f'{"cow" if _cow else "copy":<5} {READERS} snapshots alive: '
+              f'{asyncio.run(_retained_bytes(_cow)) / 1024:.0f} KiB retained')
@@ -0,0 +1,66 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.depth_index import DepthIndex
+from wb_sockets.processing import to_do_processing_logic
+
+NUM_LEVELS = 5000
+NUM_QUERIES = 2000
+NUM_MESSAGES = 1000
+# 3 BTC fills within the first levels, 5000 BTC walks about 2000 of the 5000 levels (2.5 BTC per level on average)
+QUANTITIES = (3, 100, 5000)
+
+
+def _naive_vwap(order_book, quantity):
+    # The walk over ob_asks_prices the index replaces
+    filled = notional = 0.0
+    for price in order_book.ob_asks_prices:
+        take = min(order_book.ob_asks[price], quantity - filled)
+        filled += take
+        notional += take * price
+        if filled >= quantity:
+            break
+    return notional / filled
+
+
+def _register_queries(quantity: float) -> None:
+    @benchmark(f'depth_index.naive_vwap[{NUM_LEVELS},qty={quantity}]')
+    async def _setup_naive():
+        order_book = await _initialised_order_book(make_snapshot(NUM_LEVELS))
+
+        def run():
+            for _ in range(NUM_QUERIES):
+                _naive_vwap(order_book, quantity)
+        return run, NUM_QUERIES
+
+    @benchmark(f'depth_index.vwap[{NUM_LEVELS},qty={quantity}]')
+    async def _setup_index():
+        order_book = await _initialised_order_book(make_snapshot(NUM_LEVELS))
+        index = DepthIndex(order_book)
+
+        def run():
+            for _ in range(NUM_QUERIES):
+                index.vwap('asks', quantity)
+        return run, NUM_QUERIES
+
+
+def _register_updates(with_index: bool) -> None:
+    # Cost of keeping the index valid, per applied update
+    @benchmark(f'depth_index.{"apply_indexed" if with_index else "apply"}[{NUM_LEVELS}]')
+    async def _setup():
+        snapshot = make_snapshot(NUM_LEVELS)
+        messages = make_depth_updates(snapshot, NUM_MESSAGES)
+        order_book = await _initialised_order_book(snapshot)
+        if with_index:
+            DepthIndex(order_book)
+
+        async def run():
+            for message in messages:
+                await to_do_processing_logic(order_book, message)
+        return run, len(messages)
+
+
+for _quantity in QUANTITIES:
+    _register_queries(_quantity)
+_register_updates(False)
+_register_updates(True)
@@ -0,0 +1,51 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.diff_feed import DiffFeed
+
+SUBSCRIBER_COUNTS = (1, 10, 100)
+NUM_MESSAGES = 2000
+
+
+async def _prepared_feed(num_subscribers: int, max_pending: int):
+    snapshot = make_snapshot(1000)
+    messages = make_depth_updates(snapshot, NUM_MESSAGES + 1)
+    order_book = await _initialised_order_book(snapshot)
+    feed = DiffFeed()
+    # The first publish sets the book, every subscriber then takes its snapshot
+    feed.publish(messages[0], order_book)
+    subscribers = [feed.subscribe(max_pending = max_pending) for _ in range(num_subscribers)]
+    for subscriber in subscribers:
+        subscriber.get_nowait()
+    return feed, order_book, messages[1:], subscribers
+
+
+def _register_fan_out(num_subscribers: int) -> None:
+    # Subscribers keeping up: every diff is queued and read once per subscriber
+    @benchmark(f'diff_feed.fan_out[subscribers={num_subscribers}]')
+    async def _setup():
+        feed, order_book, messages, subscribers = await _prepared_feed(num_subscribers, 1000)
+
+        def run():
+            for message in messages:
+                feed.publish(message, order_book)
+                for subscriber in subscribers:
+                    subscriber.get_nowait()
+        return run, len(messages)
+
+
+def _register_slow_subscribers(num_subscribers: int) -> None:
+    # Subscribers that never read: the producer's cost includes the conflation
+    @benchmark(f'diff_feed.fan_out_slow[subscribers={num_subscribers}]')
+    async def _setup():
+        feed, order_book, messages, subscribers = await _prepared_feed(num_subscribers, 100)
+
+        def run():
+            for message in messages:
+                feed.publish(message, order_book)
+        return run, len(messages)
+
+
+for _count in SUBSCRIBER_COUNTS:
+    _register_fan_out(_count)
+    _register_slow_subscribers(_count)
@@ -0,0 +1,55 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.history import BookHistory
+from wb_sockets.processing import to_do_processing_logic
+
+NUM_LEVELS = 5000
+NUM_MESSAGES = 20000
+NUM_QUERIES = 50
+
+
+async def _recorded_history(checkpoint_every: int) -> BookHistory:
+    snapshot = make_snapshot(NUM_LEVELS)
+    order_book = await _initialised_order_book(snapshot)
+    history = BookHistory(checkpoint_every)
+    history.attach(order_book)
+    for message in make_depth_updates(snapshot, NUM_MESSAGES):
+        await to_do_processing_logic(order_book, message)
+    return history
+
+
+def _register_queries(checkpoint_every: int) -> None:
+    # checkpoint_every >= NUM_MESSAGES is a replay from the start of the history
+    @benchmark(f'history.book_at[{NUM_MESSAGES},checkpoint_every={checkpoint_every}]')
+    async def _setup():
+        history = await _recorded_history(checkpoint_every)
+        first, last = history.first_update_id, history.last_update_id
+        update_ids = [first + (last - first) * (index + 1) // NUM_QUERIES for index in range(NUM_QUERIES)]
+
+        def run():
+            for update_id in update_ids:
+                history.book_at(update_id)
+        return run, NUM_QUERIES
+
+
+def _register_recording(with_history: bool) -> None:
+    # Cost of recording, per applied update (checkpoints included)
+    @benchmark(f'history.{"apply_recorded" if with_history else "apply"}[{NUM_LEVELS}]')
+    async def _setup():
+        snapshot = make_snapshot(NUM_LEVELS)
+        messages = make_depth_updates(snapshot, 1000)
+        order_book = await _initialised_order_book(snapshot)
+        if with_history:
+            BookHistory(checkpoint_every = 1000).attach(order_book)
+
+        async def run():
+            for message in messages:
+                await to_do_processing_logic(order_book, message)
+        return run, len(messages)
+
+
+_register_queries(NUM_MESSAGES)
+_register_queries(1000)
+_register_recording(False)
+_register_recording(True)
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from collections import deque
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+# Imported the way main.py sees them, so the hot path sampling of setup_logger applies to their loggers
+from utils.logger import setup_logger
+from wb_sockets.processing import ws_processing
+
+NUM_MESSAGES = 5000
+LOG_LEVELS = {'off': None, 'info': logging.INFO, 'debug_sampled': logging.DEBUG}
+
+
+async def _drain(order_book, buffer: deque) -> None:
+    # ws_processing never returns, run it until only the last message (which waits for its successor) is left
+    task = asyncio.create_task(ws_processing(order_book, buffer))
+    while len(buffer) > 1:
+        await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def _register_throughput(name: str, level) -> None:
+    @benchmark(f'processing.ws_processing_throughput[logging={name}]')
+    async def _setup():
+        snapshot = make_snapshot(1000)
+        frames = [json.dumps(message) for message in make_depth_updates(snapshot, NUM_MESSAGES)]
+        order_book = await _initialised_order_book(snapshot)
+        buffer = deque(frames)
+
+        async def run():
+            root = logging.getLogger()
+            saved_handlers, saved_level = list(root.handlers), root.level
+            listener = None
+            if level is None:
+                root.setLevel(logging.CRITICAL)
+            else:
+                log_file = os.path.join(tempfile.gettempdir(), 'local_order_book_bench.log')
+                listener = setup_logger(level, log_file, console=False)
+            try:
+                await _drain(order_book, buffer)
+            finally:
+                if listener is not None:
+                    listener.stop()
+                for handler in list(root.handlers):
+                    root.removeHandler(handler)
+                for handler in saved_handlers:
+                    root.addHandler(handler)
+                root.setLevel(saved_level)
+        return run, len(frames) - 1
+
+
+for _name, _level in LOG_LEVELS.items():
+    _register_throughput(_name, _level)
@@ -0,0 +1,36 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.microstructure import MicrostructureMetrics
+from wb_sockets.processing import to_do_processing_logic
+
+BOOK_SIZES = (1000, 5000)
+NUM_MESSAGES = 1000
+
+
+def _register(num_levels: int, mode: str) -> None:
+    # apply       - updates only, the baseline
+    # incremental - updates with the metrics maintained from the touched levels
+    # recompute   - updates with the metrics rebuilt from the whole book after every update
+    @benchmark(f'microstructure.{mode}[{num_levels}]')
+    async def _setup():
+        snapshot = make_snapshot(num_levels)
+        messages = make_depth_updates(snapshot, NUM_MESSAGES)
+        order_book = await _initialised_order_book(snapshot)
+        metrics = None
+        if mode != 'apply':
+            metrics = MicrostructureMetrics(order_book, top_n = 20, band_bps = (10, 100), reconcile_every = 0)
+            if mode == 'recompute':
+                metrics.close()
+
+        async def run():
+            for message in messages:
+                await to_do_processing_logic(order_book, message)
+                if mode == 'recompute':
+                    metrics._recompute()
+        return run, len(messages)
+
+
+for _size in BOOK_SIZES:
+    for _mode in ('apply', 'incremental', 'recompute'):
+        _register(_size, _mode)
@@ -0,0 +1,76 @@
+import copy
+from benchmarks.harness import benchmark
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.order_book_class import OrderBook
+
+SNAPSHOT_SIZES = (20, 1000, 5000)
+NUM_MESSAGES = 2000
+
+
+async def _initialised_order_book(snapshot: dict) -> OrderBook:
+    # Same steps as create_and_save_local_order_book, without saving the snapshot to disk
+    order_book = OrderBook(copy.deepcopy(snapshot))
+    order_book.ob_bids, order_book.ob_asks = await order_book.extract_order_book_bids_asks()
+    order_book.ob_bids_prices, order_book.ob_asks_prices = await order_book.extract_order_book_prices()
+    return order_book
+
+
+def _register_construction(num_levels: int) -> None:
+    @benchmark(f'order_book.construct[{num_levels}]')
+    def _setup():
+        snapshot = make_snapshot(num_levels)
+        repeats = max(1, 20000 // num_levels)
+
+        async def run():
+            for _ in range(repeats):
+                await _initialised_order_book(snapshot)
+        return run, repeats
+
+
+def _register_update_order_book(num_levels: int) -> None:
+    @benchmark(f'order_book.update_order_book[{num_levels}]')
+    async def _setup():
+        snapshot = make_snapshot(num_levels)
+        messages = make_depth_updates(snapshot, NUM_MESSAGES)
+        order_book = await _initialised_order_book(snapshot)
+
+        async def run():
+            for message in messages:
+                await order_book.update_order_book(message)
+        return run, len(messages)
+
+
+def _register_update_price_lists(num_levels: int) -> None:
+    @benchmark(f'order_book.update_price_lists[{num_levels}]')
+    async def _setup():
+        snapshot = make_snapshot(num_levels)
+        messages = make_depth_updates(snapshot, NUM_MESSAGES)
+        order_book = await _initialised_order_book(snapshot)
+
+        async def run():
+            for message in messages:
+                await order_book.update_price_lists(message)
+        return run, len(messages)
+
+
+def _register_sort_and_trim(num_levels: int) -> None:
+    @benchmark(f'order_book.sort_and_trim[{num_levels}]')
+    async def _setup():
+        snapshot = make_snapshot(num_levels)
+        order_book = await _initialised_order_book(snapshot)
+        for message in make_depth_updates(snapshot, 200):
+            await order_book.update_order_book(message)
+        repeats = max(1, 20000 // num_levels)
+
+        async def run():
+            for _ in range(repeats):
+                await order_book.sort_updated_order_book()
+                await order_book.trim_order_book()
+        return run, repeats
+
+
+for _size in SNAPSHOT_SIZES:
+    _register_construction(_size)
+    _register_update_order_book(_size)
+    _register_update_price_lists(_size)
+    _register_sort_and_trim(_size)
@@ -0,0 +1,60 @@
+import json
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.order_book.order_book_class import OrderBook
+from wb_sockets.processing import to_do_processing_logic, partial_depth_diff
+
+NUM_LEVELS = 5000
+NUM_MESSAGES = 1000
+PARTIAL_LEVELS = (5, 20)
+
+
+def _top_payload(order_book, levels: int) -> dict:
+    bids = order_book.ob_bids_prices[:-levels - 1:-1]
+    asks = order_book.ob_asks_prices[:levels]
+    return {'lastUpdateId': order_book.last_update_id,
+            'bids': [[f'{price:.8f}', f'{order_book.ob_bids[price]:.8f}'] for price in bids],
+            'asks': [[f'{price:.8f}', f'{order_book.ob_asks[price]:.8f}'] for price in asks]}
+
+
+async def _frames(levels: int = 0) -> tuple[list[str], list[str]]:
+    # One frame per 100 ms of the stream: the diff of the full-book stream, or the top levels it leads to
+    snapshot = make_snapshot(NUM_LEVELS)
+    messages = make_depth_updates(snapshot, NUM_MESSAGES)
+    order_book = await _initialised_order_book(snapshot)
+    frames = []
+    for message in messages:
+        await to_do_processing_logic(order_book, message)
+        frames.append(json.dumps(_top_payload(order_book, levels)) if levels else json.dumps(message))
+    return snapshot, frames
+
+
+# Per 100 ms window of one symbol: parse the frame and apply it
+@benchmark(f'partial_depth.full_book[{NUM_LEVELS}]')
+async def _setup_full():
+    snapshot, frames = await _frames()
+    order_book = await _initialised_order_book(snapshot)
+
+    async def run():
+        for frame in frames:
+            await to_do_processing_logic(order_book, json.loads(frame))
+    return run, len(frames)
+
+
+def _register_partial(levels: int) -> None:
+    @benchmark(f'partial_depth.partial_book[{levels}]')
+    async def _setup():
+        snapshot, frames = await _frames(levels)
+        order_book = OrderBook({'lastUpdateId': None})
+
+        async def run():
+            for frame in frames:
+                message = partial_depth_diff(order_book, json.loads(frame))
+                if message is not None:
+                    await to_do_processing_logic(order_book, message)
+        return run, len(frames)
+
+
+for _levels in PARTIAL_LEVELS:
+    _register_partial(_levels)
@@ -0,0 +1,52 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.wb_sockets.processing import to_do_processing_logic
+
+# Fixed total work: NUM_SYMBOLS busy symbols, each applying NUM_MESSAGES updates to its own book.
+# Compare wall_per_op between the worker counts (--metric wall_per_op): with enough cores it should
+# drop close to 1/workers. cpu_per_op only counts the coordinating process and isn't meaningful here.
+NUM_SYMBOLS = 8
+NUM_MESSAGES = 2000
+NUM_LEVELS = 1000
+WORKER_COUNTS = (1, 2, 4)
+
+
+async def _apply_symbol(seed: int) -> int:
+    snapshot = make_snapshot(NUM_LEVELS, seed=seed)
+    messages = make_depth_updates(snapshot, NUM_MESSAGES, seed=seed)
+    order_book = await _initialised_order_book(snapshot)
+    for message in messages:
+        await to_do_processing_logic(order_book, message)
+    return len(messages)
+
+
+def _symbol_worker(seed: int) -> int:
+    # Runs in a worker process, like a shard owning the book of one symbol
+    return asyncio.run(_apply_symbol(seed))
+
+
+def _warm_up(_) -> None:
+    return None
+
+
+def _register_sharded_apply(workers: int) -> None:
+    @benchmark(f'sharding.apply_throughput[workers={workers}]')
+    def _setup():
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        # Process start-up is not part of the measured work
+        list(executor.map(_warm_up, range(workers)))
+
+        def run():
+            try:
+                list(executor.map(_symbol_worker, range(NUM_SYMBOLS)))
+            finally:
+                executor.shutdown()
+        return run, NUM_SYMBOLS * NUM_MESSAGES
+
+
+for _workers in WORKER_COUNTS:
+    _register_sharded_apply(_workers)
@@ -0,0 +1,38 @@
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot
+from src.order_book.snapshot_server import SnapshotCache, capture_levels, encode_depth
+
+DEPTHS = (20, 1000, 5000)
+NUM_REQUESTS = 2000
+
+
+def _register_encode(depth: int) -> None:
+    @benchmark(f'snapshot_server.encode[depth={depth}]')
+    async def _setup():
+        order_book = await _initialised_order_book(make_snapshot(5000))
+        repeats = max(1, NUM_REQUESTS * 20 // depth)
+
+        def run():
+            for _ in range(repeats):
+                encode_depth(*capture_levels(order_book, depth))
+        return run, repeats
+
+
+def _register_cache_hit(depth: int) -> None:
+    # A burst of identical requests between two updates: one encode, the rest are cache hits
+    @benchmark(f'snapshot_server.cached_burst[depth={depth}]')
+    async def _setup():
+        order_book = await _initialised_order_book(make_snapshot(5000))
+        order_book.last_update_id = 1
+        cache = SnapshotCache()
+
+        async def run():
+            for _ in range(NUM_REQUESTS):
+                await cache.get('BTCUSDT', order_book, depth)
+        return run, NUM_REQUESTS
+
+
+for _depth in DEPTHS:
+    _register_encode(_depth)
+    _register_cache_hit(_depth)
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot, make_depth_updates
+from src.utils.metrics import LatencyHistogram
+from wb_sockets.ingesting import ws_ingestion
+from wb_sockets.processing import ws_processing
+from wb_sockets.threaded_processing import SpscRing, ws_threaded_processing
+
+NUM_LEVELS = 5000
+# Synthetic burst load: bursts of heavy updates sent back to back, with a pause between bursts
+NUM_BURSTS = 5
+BURST_SIZE = 200
+LEVELS_PER_MESSAGE = 200
+FRAME_INTERVAL_S = 0.0005
+BURST_PAUSE_S = 0.1
+
+
+class _SentFrame(str):
+    sent_at: float
+
+
+class _BurstWebSocket:
+    """
+    Stand-in for the WebSocket connection: a sender thread delivers the frames on a fixed schedule, independent
+    of the event loop, and the receive latency of a frame is how long after its delivery ws_ingestion got it
+    """
+    def __init__(self, frames: list[str]):
+        self.frames = frames
+        self.latency = LatencyHistogram()
+        self._queue: asyncio.Queue | None = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+        def send():
+            for burst in range(NUM_BURSTS):
+                for frame in self.frames[burst * BURST_SIZE:(burst + 1) * BURST_SIZE]:
+                    sent = _SentFrame(frame)
+                    sent.sent_at = time.perf_counter()
+                    loop.call_soon_threadsafe(self._queue.put_nowait, sent)
+                    time.sleep(FRAME_INTERVAL_S)
+                time.sleep(BURST_PAUSE_S)
+
+        threading.Thread(target=send, name='burst-sender', daemon=True).start()
+
+    async def recv(self) -> str:
+        frame = await self._queue.get()
+        self.latency.record((time.perf_counter() - frame.sent_at) * 1e6)
+        return str(frame)
+
+
+async def burst_run(threaded: bool) -> tuple[LatencyHistogram, float]:
+    """
+    Runs the ingestion and the processing (inline on the event loop or on a dedicated thread) through the bursts
+    Returns:
+        tuple - receive latency histogram, wall time in seconds until the last update was applied
+    """
+    snapshot = make_snapshot(NUM_LEVELS)
+    messages = make_depth_updates(snapshot, NUM_BURSTS * BURST_SIZE, levels_per_message = LEVELS_PER_MESSAGE)
+    order_book = await _initialised_order_book(snapshot)
+    websocket = _BurstWebSocket([json.dumps(message) for message in messages])
+    buffer = SpscRing() if threaded else deque()
+    process = ws_threaded_processing if threaded else ws_processing
+    started = time.perf_counter()
+    websocket.start()
+    tasks = [asyncio.create_task(ws_ingestion(websocket, buffer)), asyncio.create_task(process(order_book, buffer))]
+    # ws_processing keeps the last frame until the next one arrives
+    while order_book.last_update_id != messages[-2]['u']:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return websocket.latency, elapsed
+
+
+def _register(threaded: bool) -> None:
+    # Wall time per frame of the whole run, the receive latency percentiles are printed by running this module
+    @benchmark(f'processing.burst[{"threaded" if threaded else "inline"},levels={LEVELS_PER_MESSAGE}]')
+    def _setup():
+        async def run():
+            await burst_run(threaded)
+        return run, NUM_BURSTS * BURST_SIZE
+
+
+_register(False)
+_register(True)
+
+
+if __name__ == '__main__':
+    for _threaded in (False, True):
+        _latency, _elapsed = asyncio.run(burst_run(_threaded))
+        print(f'{"threaded" if _threaded else "inline":<10} receive latency {_latency.snapshot()}, '
+              f'all applied after {_elapsed:.2f}s')
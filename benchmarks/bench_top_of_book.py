@@ -0,0 +1,67 @@
+import os
+from benchmarks.harness import benchmark
+from benchmarks.bench_order_book import _initialised_order_book
+from benchmarks.datasets import make_snapshot
+from src.order_book.top_of_book import TopOfBookPublisher, TopOfBookReader
+
+DEPTHS = (1, 20, 100)
+NUM_OPS = 20000
+
+
+def _segment(depth: int) -> str:
+    return f'lob_bench_{os.getpid()}_{depth}'
+
+
+def _register_publish(depth: int) -> None:
+    @benchmark(f'top_of_book.publish[depth={depth}]')
+    async def _setup():
+        order_book = await _initialised_order_book(make_snapshot(1000))
+        publisher = TopOfBookPublisher('BENCH', depth, name = _segment(depth))
+
+        def run():
+            try:
+                for _ in range(NUM_OPS):
+                    publisher.publish(order_book)
+            finally:
+                publisher.close()
+        return run, NUM_OPS
+
+
+def _register_read(depth: int) -> None:
+    @benchmark(f'top_of_book.read[depth={depth}]')
+    async def _setup():
+        order_book = await _initialised_order_book(make_snapshot(1000))
+        publisher = TopOfBookPublisher('BENCH', depth, name = _segment(depth))
+        publisher.publish(order_book)
+        reader = TopOfBookReader('BENCH', name = publisher.name)
+
+        def run():
+            try:
+                for _ in range(NUM_OPS):
+                    reader.read()
+            finally:
+                reader.close()
+                publisher.close()
+        return run, NUM_OPS
+
+
+@benchmark('top_of_book.best_bid_ask')
+async def _setup_best_bid_ask():
+    order_book = await _initialised_order_book(make_snapshot(1000))
+    publisher = TopOfBookPublisher('BENCH', 20, name = _segment(20))
+    publisher.publish(order_book)
+    reader = TopOfBookReader('BENCH', name = publisher.name)
+
+    def run():
+        try:
+            for _ in range(NUM_OPS):
+                reader.best_bid_ask()
+        finally:
+            reader.close()
+            publisher.close()
+    return run, NUM_OPS
+
+
+for _depth in DEPTHS:
+    _register_publish(_depth)
+    _register_read(_depth)
@@ -0,0 +1,50 @@
+import json
+from collections import deque
+from benchmarks.harness import benchmark
+from benchmarks.datasets import make_snapshot, make_depth_updates, load_sample_frames
+from src.wb_sockets.processing import is_continuous
+from src.wb_sockets.syncing import find_matching_message
+
+GAP_COUNTS = (0, 1, 2, 3)
+BUFFER_SIZES = (1000, 10000, 50000)
+CALLS = 2000
+
+
+def _register_is_continuous(num_gaps: int) -> None:
+    @benchmark(f'processing.is_continuous[gaps={num_gaps}]')
+    def _setup():
+        messages = make_depth_updates(make_snapshot(20), 2)
+        curr_msg, next_msg = messages
+        faulty_msg = dict(next_msg, U=next_msg['U'] - 10**6, u=next_msg['u'] - 10**6)
+        frames = [json.dumps(faulty_msg)] * num_gaps + [json.dumps(next_msg)]
+        buffers = [deque(frames) for _ in range(CALLS)]
+
+        async def run():
+            for buffer in buffers:
+                await is_continuous(curr_msg, buffer)
+        return run, CALLS
+
+
+def _register_find_matching_message(buffer_size: int) -> None:
+    @benchmark(f'syncing.find_matching_message[{buffer_size}]')
+    def _setup():
+        snapshot = make_snapshot(20)
+        messages = make_depth_updates(snapshot, buffer_size, levels_per_message=3)
+        frames = [json.dumps(message) for message in messages]
+        # Sprinkle recorded non-depthUpdate frames over the buffer, they have to be skipped too
+        sample_frames = load_sample_frames()
+        for position in range(0, len(frames), 100):
+            frames.insert(position, sample_frames[position % len(sample_frames)])
+        # The snapshot is aligned with the last message, so the whole buffer has to be scanned
+        order_book_last_update_id = messages[-1]['U']
+        buffer = deque(frames)
+
+        async def run():
+            await find_matching_message(order_book_last_update_id, buffer)
+        return run, len(frames)
+
+
+for _num_gaps in GAP_COUNTS:
+    _register_is_continuous(_num_gaps)
+for _size in BUFFER_SIZES:
+    _register_find_matching_message(_size)
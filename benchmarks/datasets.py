@@ -0,0 +1,103 @@
+import json
+import os
+import random
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PATH = os.path.join(PROJECT_DIR, 'data', 'sample.json')
+
+MID_PRICE = 113678.85
+TICK = 0.01
+FIRST_UPDATE_ID = 74105025814
+
+
+def make_snapshot(num_levels: int, seed: int = 42) -> dict:
+    """
+    Builds a synthetic Binance REST API snapshot with the requested number of levels on each side.
+    Prices are spaced by a random number of ticks away from the mid price, so the ladder looks
+    like a real BTCUSDT book (dense at the top, sparse further away).
+    Args:
+        num_levels (int): number of bid levels and number of ask levels
+        seed (int): seed for the random generator, so every run gets the same book
+    Returns:
+        dict - snapshot in the /api/v3/depth format
+    """
+    rng = random.Random(seed)
+    bids, asks = [], []
+    bid_price, ask_price = MID_PRICE, MID_PRICE + TICK
+    for _ in range(num_levels):
+        bids.append([f'{bid_price:.8f}', f'{rng.uniform(0.0001, 5):.8f}'])
+        asks.append([f'{ask_price:.8f}', f'{rng.uniform(0.0001, 5):.8f}'])
+        bid_price -= TICK * rng.randint(1, 3)
+        ask_price += TICK * rng.randint(1, 3)
+    return {'lastUpdateId': FIRST_UPDATE_ID - 1, 'bids': bids, 'asks': asks}
+
+
+def make_depth_updates(snapshot: dict, num_messages: int, levels_per_message: int = 10, seed: int = 7) -> list[dict]:
+    """
+    Builds a continuous stream of depth update messages (no gaps between 'u' and the next 'U')
+    which touches the levels of the given snapshot. Roughly a third of the changes delete a level,
+    a third update an existing level and a third add a new level next to an existing one.
+    Args:
+        snapshot (dict): snapshot returned by make_snapshot
+        num_messages (int): number of messages in the stream
+        levels_per_message (int): number of price levels changed by a single message on each side
+        seed (int): seed for the random generator
+    Returns:
+        list[dict] - depth update messages in the WebSocket stream format
+    """
+    rng = random.Random(seed)
+    bid_prices = [float(price) for price, _ in snapshot['bids']]
+    ask_prices = [float(price) for price, _ in snapshot['asks']]
+    # Most of the real traffic is close to the top of the book
+    top = max(1, min(len(bid_prices), 200))
+
+    def _side_changes(prices: list[float], direction: int) -> list[list[str]]:
+        changes = []
+        for _ in range(levels_per_message):
+            price = prices[rng.randrange(top)]
+            action = rng.random()
+            if action < 0.33:
+                qty = 0.0
+            elif action < 0.66:
+                qty = rng.uniform(0.0001, 5)
+            else:
+                price += direction * TICK / 2
+                qty = rng.uniform(0.0001, 5)
+            changes.append([f'{price:.8f}', f'{qty:.8f}'])
+        return changes
+
+    messages = []
+    first_id = FIRST_UPDATE_ID
+    event_time = 1754423900214
+    for _ in range(num_messages):
+        last_id = first_id + rng.randint(1, 30)
+        messages.append({'e': 'depthUpdate',
+                         'E': event_time,
+                         's': 'BTCUSDT',
+                         'U': first_id,
+                         'u': last_id,
+                         'b': _side_changes(bid_prices, -1),
+                         'a': _side_changes(ask_prices, 1)})
+        first_id = last_id + 1
+        event_time += 100
+    return messages
+
+
+def load_sample_frames() -> list[str]:
+    """
+    Reads data/sample.json, which is a recording of raw frames written back to back
+    (each frame is a JSON encoded string). These are non-depthUpdate frames, which
+    the syncing and processing code has to skip.
+    Returns:
+        list[str] - raw frames as they would arrive from the WebSocket
+    """
+    with open(SAMPLE_PATH) as file:
+        raw = file.read()
+    decoder = json.JSONDecoder()
+    frames, position = [], 0
+    while position < len(raw):
+        frame, position = decoder.raw_decode(raw, position)
+        frames.append(frame if isinstance(frame, str) else json.dumps(frame))
+        while position < len(raw) and raw[position].isspace():
+            position += 1
+    return frames
@@ -0,0 +1,121 @@
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import time
+from collections import namedtuple
+
+BenchmarkCase = namedtuple('BenchmarkCase', ['name', 'setup'])
+BenchmarkResult = namedtuple('BenchmarkResult', ['name', 'ops', 'wall_per_op', 'cpu_per_op', 'repeats'])
+Comparison = namedtuple('Comparison', ['name', 'baseline', 'current', 'ratio', 'status'])
+
+REGISTRY: list[BenchmarkCase] = []
+
+
+def benchmark(name: str):
+    """
+    Registers a benchmark. The decorated function does all the preparation work (building books,
+    buffers, message streams) and returns a tuple (run, ops), where run is a callable or a
+    coroutine function doing the measured work and ops is the number of operations it performs.
+    Only run() is timed, the setup is called again before every repeat so each repeat starts
+    from the same state.
+    """
+    def _register(setup):
+        REGISTRY.append(BenchmarkCase(name, setup))
+        return setup
+    return _register
+
+
+def _time_once(run, loop) -> tuple[float, float]:
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    if inspect.iscoroutinefunction(run):
+        loop.run_until_complete(run())
+    else:
+        run()
+    return time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def run_case(case: BenchmarkCase, repeats: int = 5) -> BenchmarkResult:
+    """
+    Runs a registered benchmark several times and keeps the median wall and CPU time per operation.
+    CPU time is reported next to the wall time because some coroutines (e.g. find_matching_message)
+    sleep on the event loop, and the sleep is not the cost we want to optimise.
+    Args:
+        case (BenchmarkCase): benchmark from the REGISTRY
+        repeats (int): number of timed runs
+    Returns:
+        BenchmarkResult
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        walls, cpus = [], []
+        for _ in range(repeats):
+            prepared = case.setup()
+            run, ops = loop.run_until_complete(prepared) if inspect.iscoroutine(prepared) else prepared
+            wall, cpu = _time_once(run, loop)
+            walls.append(wall / ops)
+            cpus.append(cpu / ops)
+    finally:
+        loop.close()
+    return BenchmarkResult(case.name, ops, statistics.median(walls), statistics.median(cpus), repeats)
+
+
+def run_all(name_filter: str = None, repeats: int = 5) -> list[BenchmarkResult]:
+    results = []
+    for case in REGISTRY:
+        if name_filter and name_filter not in case.name:
+            continue
+        result = run_case(case, repeats)
+        print(f'{result.name:<60} wall {result.wall_per_op * 1e6:>12.2f} us/op   cpu {result.cpu_per_op * 1e6:>12.2f} us/op')
+        results.append(result)
+    return results
+
+
+def save_results(results: list[BenchmarkResult], path: str) -> None:
+    """
+    Saves benchmark results as a JSON baseline: metadata about the machine plus one entry per benchmark.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    payload = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'machine': platform.platform(),
+               'results': {result.name: result._asdict() for result in results}}
+    with open(path, 'w') as file:
+        json.dump(payload, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)['results']
+
+
+def compare_results(results: list[BenchmarkResult], baseline: dict, tolerance: float = 0.15,
+                    metric: str = 'cpu_per_op') -> list[Comparison]:
+    """
+    Compares fresh results with a saved baseline.
+    Args:
+        results (list[BenchmarkResult]): results of the current run
+        baseline (dict): 'results' section of a saved baseline file
+        tolerance (float): relative change below which the difference is treated as noise
+        metric (str): 'cpu_per_op' or 'wall_per_op'
+    Returns:
+        list[Comparison] - status is one of 'regression', 'improvement', 'ok' or 'new'
+    """
+    comparisons = []
+    for result in results:
+        current = getattr(result, metric)
+        previous = baseline.get(result.name, {}).get(metric)
+        if not previous:
+            comparisons.append(Comparison(result.name, None, current, None, 'new'))
+            continue
+        ratio = current / previous
+        if ratio > 1 + tolerance:
+            status = 'regression'
+        elif ratio < 1 - tolerance:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparisons.append(Comparison(result.name, previous, current, ratio, status))
+    return comparisons
@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+from benchmarks.harness import run_all, save_results, load_results, compare_results
+from benchmarks.datasets import PROJECT_DIR
+# Importing the modules registers their benchmarks
+import benchmarks.bench_order_book  # noqa: F401
+import benchmarks.bench_wb_sockets  # noqa: F401
+import benchmarks.bench_logging  # noqa: F401
+import benchmarks.bench_sharding  # noqa: F401
+import benchmarks.bench_top_of_book  # noqa: F401
+import benchmarks.bench_snapshot_server  # noqa: F401
+import benchmarks.bench_diff_feed  # noqa: F401
+import benchmarks.bench_book_diff  # noqa: F401
+import benchmarks.bench_microstructure  # noqa: F401
+import benchmarks.bench_depth_index  # noqa: F401
+import benchmarks.bench_aggregation  # noqa: F401
+import benchmarks.bench_history  # noqa: F401
+import benchmarks.bench_columnar_store  # noqa: F401
+import benchmarks.bench_bars  # noqa: F401
+import benchmarks.bench_partial_depth  # noqa: F401
+import benchmarks.bench_threaded_processing  # noqa: F401
+import benchmarks.bench_book_reads  # noqa: F401
+import benchmarks.bench_cow_snapshots  # noqa: F401
+
+DEFAULT_BASELINE = os.path.join(PROJECT_DIR, 'data', 'benchmarks', 'baseline.json')
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Order book performance benchmarks')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare the results with the saved baseline')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='path to the baseline JSON file')
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this string')
+    parser.add_argument('--repeats', type=int, default=5, help='number of timed runs per benchmark')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='relative change treated as noise')
+    parser.add_argument('--metric', choices=['cpu_per_op', 'wall_per_op'], default='cpu_per_op')
+    args = parser.parse_args(argv)
+
+    results = run_all(args.filter, args.repeats)
+
+    exit_code = 0
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f'No baseline found at {args.baseline}, run with --save first')
+            return 2
+        comparisons = compare_results(results, load_results(args.baseline), args.tolerance, args.metric)
+        print()
+        for comparison in comparisons:
+            if comparison.status == 'new':
+                print(f'{comparison.name:<60} NEW')
+                continue
+            print(f'{comparison.name:<60} {comparison.ratio:>6.2f}x  {comparison.status.upper()}')
+        if any(comparison.status == 'regression' for comparison in comparisons):
+            exit_code = 1
+
+    if args.save:
+        save_results(results, args.baseline)
+        print(f'Baseline saved to {args.baseline}')
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,42 +1,181 @@
+import argparse
 import asyncio
-import websockets
-from order_book.orchestrator import orchestrator
-from wb_sockets import run_the_subscriber
+import logging
+from order_book.startup import concurrent_startup
+from order_book.supervisor import BookSupervisor
+from order_book.book_manager import BookManager
+from order_book.sharding import ShardCoordinator
+from order_book.snapshot_server import SnapshotServer
+from wb_sockets.syncing import DEFAULT_SYMBOL
+from utils.metrics import pipeline_metrics, log_metrics_periodically
+from utils.profiling import get_profiler
+from utils.logger import setup_logger
+
+logger = logging.getLogger('main')
 
 uri = 'wss://stream.binance.com:9443/ws/btcusdt@depth'
 
-async def run_code():
+async def run_code(run_time: float = 1, threaded_processing: bool = False):
+    # Set LOB_PROFILE=stages (or full) to profile the run, see utils/profiling.py
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.start()
     try:
-        async with websockets.connect(uri) as websocket:
-            print("Connected to server")
-
-            try:
-                await asyncio.wait_for(run_the_subscriber(websocket), timeout = 5)
-            except asyncio.TimeoutError:
-                print('Can\'t subscribe to the requested channel')
-                return
-            
-            ws_ingestion_task, ws_processing_task, order_book = await orchestrator(websocket)
+        # Connecting, subscribing and fetching the snapshot overlap, see order_book/startup.py
+        async with concurrent_startup(uri, pipeline_metrics, profiler, threaded_processing = threaded_processing) as started:
+            logger.info('Cold start timings (ms): %s', started.timings._asdict())
+            metrics_task = asyncio.create_task(log_metrics_periodically(pipeline_metrics))
                         
             try: 
-                tasks =[ws_ingestion_task, ws_processing_task]
-                await asyncio.wait_for(asyncio.gather(*tasks), timeout = 1)
+                tasks =[started.ws_ingestion_task, started.ws_processing_task]
+                await asyncio.wait_for(asyncio.gather(*tasks), timeout = run_time)
 
             except asyncio.TimeoutError:
-                print('Run time has ended')
-                for task in tasks:
-                    task.cancel()
-                #Wait for tasks completion - in this case TimeOut error
-                await asyncio.gather(ws_ingestion_task, ws_processing_task, return_exceptions=True)
+                logger.info('Run time has ended')
+            finally:
+                metrics_task.cancel()
+                await asyncio.gather(metrics_task, return_exceptions=True)
             
-            print('All done')
+            logger.info('Pipeline metrics: %s', pipeline_metrics.format_line())
+            logger.info('All done')
 
+    except asyncio.TimeoutError:
+        logger.error('Can\'t subscribe to the requested channel or sync with the order book snapshot')
     except Exception as e:
-        print(f"Something went wrong: {e}")
+        logger.exception("Something went wrong: %s", e)
+    finally:
+        logger.info("WebSocket connection closed")
+        if profiler is not None:
+            logger.info('Profiles saved: %s', profiler.dump())
+
+
+async def run_forever(connections: int = 1, serve_port: int = None, threaded_processing: bool = False):
+    # Production mode: reconnects, resubscribes and resyncs until the process is stopped
+    # serve_port - also serve the book at http://127.0.0.1:<serve_port>/api/v3/depth, see order_book/snapshot_server.py
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.start()
+    supervisor = BookSupervisor(uri, pipeline_metrics, profiler, connections = connections,
+                                threaded_processing = threaded_processing)
+    server = None
+    if serve_port is not None:
+        server = SnapshotServer(lambda symbol: supervisor.order_book if symbol == DEFAULT_SYMBOL else None, port = serve_port)
+        await server.start()
+    metrics_task = asyncio.create_task(log_metrics_periodically(pipeline_metrics))
+    try:
+        await supervisor.run()
+    finally:
+        metrics_task.cancel()
+        await asyncio.gather(metrics_task, return_exceptions=True)
+        logger.info('Supervisor stats: %s', supervisor.snapshot())
+        if server is not None:
+            logger.info('Snapshot server stats: %s', server.snapshot())
+            await server.stop()
+        if profiler is not None:
+            logger.info('Profiles saved: %s', profiler.dump())
+
+
+async def run_many(symbols: list[str], publish_depth: int = 0, serve_port: int = None, report_interval: float = 10,
+                   audit_limit: int = 0, record_dir: str = None, partial_depth: dict = None):
+    # Many symbols over one combined-stream connection, each symbol syncs and resyncs on its own
+    # publish_depth > 0 also shares the top levels of every book via shared memory, see order_book/top_of_book.py
+    # audit_limit > 0 compares the books with REST snapshots of that many levels, see order_book/drift_audit.py
+    # record_dir stores the top levels after every update in columnar files, see order_book/columnar_store.py
+    # partial_depth (symbol -> 5/10/20) runs those symbols from partial depth streams, without snapshot sync
+    manager = BookManager(symbols, publish_depth = publish_depth, partial_depth = partial_depth,
+                          audit_options = {'limit': audit_limit} if audit_limit else None,
+                          record_options = {'directory': record_dir} if record_dir else None)
+    server = None
+    if serve_port is not None:
+        server = SnapshotServer(manager.order_book, port = serve_port, default_symbol = symbols[0])
+        await server.start()
+
+    async def report():
+        while True:
+            await asyncio.sleep(report_interval)
+            stats = manager.snapshot()
+            logger.info('Book manager: %d/%d live, routed=%d, routing cpu=%.3fs',
+                        stats['live'], len(symbols), stats['routed'], stats['routing_cpu_s'])
+            for symbol, values in stats['symbols'].items():
+                logger.info('%s: live=%s applied=%d resyncs=%d memory=%.1fKiB cpu=%.3fs',
+                            symbol, values['is_live'], values['messages_applied'], values['resyncs'],
+                            values['memory_bytes'] / 1024, values['cpu_s'])
+
+    report_task = asyncio.create_task(report())
+    try:
+        await manager.run()
+    finally:
+        report_task.cancel()
+        await asyncio.gather(report_task, return_exceptions=True)
+        logger.info('Book manager stats: %s', manager.snapshot())
+        if server is not None:
+            logger.info('Snapshot server stats: %s', server.snapshot())
+            await server.stop()
+
+
+async def run_sharded(symbols: list[str], workers: int, publish_depth: int = 0, report_interval: float = 10,
+                      audit_limit: int = 0, record_dir: str = None, partial_depth: dict = None):
+    # Symbols sharded over worker processes, each running its own BookManager, see order_book/sharding.py
+    coordinator = ShardCoordinator(symbols, workers, {'publish_depth': publish_depth,
+                                                      'partial_depth': partial_depth,
+                                                      'audit_options': {'limit': audit_limit} if audit_limit else None,
+                                                      'record_options': {'directory': record_dir} if record_dir else None})
+    coordinator.start()
+
+    async def report():
+        while True:
+            await asyncio.sleep(report_interval)
+            stats = coordinator.snapshot()
+            logger.info('Shards: totals %s, rebalances=%d, restarts=%d',
+                        stats['totals'], stats['rebalances'], stats['restarts'])
+            for worker in stats['workers']:
+                logger.info('Worker %d (pid %s, alive=%s): %d/%d live, applied=%d cpu=%.3fs',
+                            worker['worker_id'], worker['pid'], worker['alive'], worker['live'],
+                            len(worker['symbols']), worker['messages_applied'], worker['cpu_s'])
+
+    report_task = asyncio.create_task(report())
+    try:
+        await coordinator.run()
+    finally:
+        report_task.cancel()
+        await asyncio.gather(report_task, return_exceptions=True)
+
+
+# Worker processes are spawned and re-import this module, so the entry point has to be guarded
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local copy of the Binance order book')
+    parser.add_argument('--forever', action='store_true', help='keep the book alive indefinitely, reconnecting when needed')
+    parser.add_argument('--run-time', type=float, default=1, help='seconds to run for when not in --forever mode')
+    parser.add_argument('--threaded-processing', action='store_true', help='parse and apply the updates on a dedicated thread, so bursts don\'t delay the socket reads')
+    parser.add_argument('--connections', type=int, default=1, help='number of redundant connections to the depth stream (--forever mode)')
+    parser.add_argument('--symbols', nargs='+', help='maintain the books of several symbols over one combined stream, e.g. --symbols BTCUSDT ETHUSDT')
+    parser.add_argument('--workers', type=int, default=1, help='shard --symbols over this many worker processes')
+    parser.add_argument('--serve-port', type=int, default=None, help='serve the book(s) in the /api/v3/depth shape on this local port (--forever or --symbols mode)')
+    parser.add_argument('--publish-depth', type=int, default=0, help='publish the top N levels of every --symbols book to shared memory')
+    parser.add_argument('--audit-limit', type=int, default=0, help='audit the --symbols books against REST snapshots of this many levels')
+    parser.add_argument('--partial', nargs='+', default=[], metavar='SYMBOL:LEVELS',
+                        help='run these --symbols in partial-book mode from their top 5/10/20 levels stream, e.g. --partial ETHUSDT:10')
+    parser.add_argument('--record-dir', default=None, help='record the top levels of every --symbols book after every update to columnar files in this directory')
+    args = parser.parse_args()
+    partial_depth = {symbol.upper(): int(levels) for symbol, levels in (entry.split(':') for entry in args.partial)}
+
+    # Logging runs on a background thread, stopping the listener flushes the remaining records
+    log_listener = setup_logger()
+    try:
+        if args.symbols and args.workers > 1:
+            asyncio.run(run_sharded(args.symbols, args.workers, args.publish_depth, audit_limit = args.audit_limit,
+                                    record_dir = args.record_dir, partial_depth = partial_depth))
+        elif args.symbols:
+            asyncio.run(run_many(args.symbols, args.publish_depth, args.serve_port, audit_limit = args.audit_limit,
+                                 record_dir = args.record_dir, partial_depth = partial_depth))
+        elif args.forever:
+            asyncio.run(run_forever(args.connections, args.serve_port, args.threaded_processing))
+        else:
+            asyncio.run(run_code(args.run_time, args.threaded_processing)) #Creates the event loop and runs coroutines  
+    except KeyboardInterrupt:
+        logger.info('Stopped by user')
     finally:
-        print("WebSocket connection closed")
-        
-asyncio.run(run_code()) #Creates the event loop and runs coroutines  
+        log_listener.stop()
 
 
 
@@ -0,0 +1,109 @@
+import bisect
+import logging
+from order_book.order_book_class import OrderBook
+
+logger = logging.getLogger(__name__)
+
+# Prices and quantities are aggregated as integers in units of 1e-8, so a bucket whose levels are all removed
+# goes back to exactly 0 and disappears
+PRICE_SCALE = 10 ** 8
+QTY_SCALE = 10 ** 8
+
+
+class _Ladder:
+    """
+    One side of the book grouped into buckets of one size: bucket index -> quantity, and the sorted bucket indexes.
+    Bids are grouped down (100.37 -> 100 with a bucket of 1) and asks up (100.37 -> 101), so a bucket never
+    looks better than the levels in it.
+    """
+    __slots__ = ('is_bid', 'size_units', 'quantities', 'keys')
+
+    def __init__(self, is_bid: bool, size_units: int):
+        self.is_bid = is_bid
+        self.size_units = size_units
+        self.quantities: dict[int, int] = {}
+        self.keys: list[int] = []  # always sorted ASC
+
+    def bucket(self, price: float) -> int:
+        price_units = round(price * PRICE_SCALE)
+        return price_units // self.size_units if self.is_bid else -(-price_units // self.size_units)
+
+    def add(self, bucket: int, delta: int) -> None:
+        quantities = self.quantities
+        total = quantities.get(bucket, 0) + delta
+        if total:
+            if bucket not in quantities:
+                bisect.insort(self.keys, bucket)
+            quantities[bucket] = total
+        elif bucket in quantities:
+            del quantities[bucket]
+            self.keys.pop(bisect.bisect_left(self.keys, bucket))
+
+    def top(self, n: int) -> list[tuple[float, float]]:
+        keys = self.keys[:-n - 1:-1] if self.is_bid else self.keys[:n]
+        size_units, quantities = self.size_units, self.quantities
+        return [(key * size_units / PRICE_SCALE, quantities[key] / QTY_SCALE) for key in keys]
+
+
+class AggregatedLadders:
+    """
+    The book grouped into coarser price buckets (e.g. 0.1, 1, 10 and 100 USDT), maintained from the levels every
+    update touches (OrderBook level listener) instead of being re-aggregated by every consumer:
+    a touched level changes exactly one bucket per bucket size and side, and reading the top N buckets
+    is a slice of the sorted bucket list, independent of the book depth.
+    """
+    def __init__(self, order_book: OrderBook, bucket_sizes=(0.1, 1, 10, 100)):
+        self.order_book = order_book
+        self.bucket_sizes = tuple(bucket_sizes)
+        self.ladders = {}
+        for bucket_size in self.bucket_sizes:
+            size_units = round(bucket_size * PRICE_SCALE)
+            if size_units <= 0:
+                raise ValueError(f'Bucket size {bucket_size} is too small')
+            self.ladders[bucket_size] = {'bids': _Ladder(True, size_units), 'asks': _Ladder(False, size_units)}
+        self.rebuild()
+        order_book.add_level_listener(self._on_update)
+
+    def close(self) -> None:
+        self.order_book.remove_level_listener(self._on_update)
+
+    def rebuild(self) -> None:
+        """
+        Aggregates the whole book again, e.g. after it was changed outside of the apply path
+        """
+        for sides in self.ladders.values():
+            for name, levels in (('bids', self.order_book.ob_bids), ('asks', self.order_book.ob_asks)):
+                ladder = sides[name]
+                ladder.quantities, ladder.keys = {}, []
+                for price, qty in levels.items():
+                    ladder.add(ladder.bucket(price), round(qty * QTY_SCALE))
+
+    def _on_update(self, order_book: OrderBook, bid_changes: list, ask_changes: list) -> None:
+        for name, changes in (('bids', bid_changes), ('asks', ask_changes)):
+            deltas = [(price, round(new_qty * QTY_SCALE) - round(old_qty * QTY_SCALE))
+                      for price, old_qty, new_qty in changes if new_qty != old_qty]
+            if not deltas:
+                continue
+            for sides in self.ladders.values():
+                ladder = sides[name]
+                for price, delta in deltas:
+                    ladder.add(ladder.bucket(price), delta)
+
+    def top(self, bucket_size: float, side: str, n: int = 10) -> list[tuple[float, float]]:
+        """
+        Args:
+            bucket_size (float): one of the bucket sizes the ladders were created with
+            side (str): 'bids' or 'asks'
+            n (int): number of buckets
+        Returns:
+            list - [(bucket price, quantity)] of the n best non-empty buckets, best first
+        """
+        return self.ladders[bucket_size][side].top(n)
+
+    def ladder(self, bucket_size: float, side: str) -> list[tuple[float, float]]:
+        """
+        Returns:
+            list - [(bucket price, quantity)] of every non-empty bucket of the side, best first
+        """
+        ladder = self.ladders[bucket_size][side]
+        return ladder.top(len(ladder.keys))
@@ -0,0 +1,167 @@
+import logging
+import math
+import os
+from collections import namedtuple
+from order_book.columnar_store import BAR_LAYOUT, ColumnarWriter
+from order_book.microstructure import MicrostructureMetrics
+from order_book.order_book_class import OrderBook
+
+logger = logging.getLogger(__name__)
+
+# Values of the book a bar is built from, all read from MicrostructureMetrics
+BAR_VALUES = ('mid', 'microprice', 'spread', 'imbalance')
+
+# One value over a bar: twap is its average weighted by the time (event time) each value was in effect
+OHLC = namedtuple('OHLC', ['open', 'high', 'low', 'close', 'twap'])
+# A completed bar: start_time in ms of event time, updates applied during the bar, an OHLC per BAR_VALUES
+Bar = namedtuple('Bar', ['interval_ms', 'start_time', 'updates', *BAR_VALUES])
+
+
+class _ValueBar:
+    __slots__ = ('open', 'high', 'low', 'close', 'weighted', 'covered_ms', 'last_time')
+
+    def start(self, value: float | None, time_ms: int) -> None:
+        self.open = self.high = self.low = self.close = value
+        self.weighted = 0.0
+        self.covered_ms = 0
+        self.last_time = time_ms
+
+    def update(self, value: float | None, time_ms: int) -> None:
+        # The previous value was in effect until now
+        if self.close is not None:
+            self.weighted += self.close * (time_ms - self.last_time)
+            self.covered_ms += time_ms - self.last_time
+        self.last_time = time_ms
+        if value is None:
+            # An empty side has no mid etc., the last value stays in effect
+            return
+        if self.open is None:
+            self.open = self.high = self.low = value
+        elif value > self.high:
+            self.high = value
+        elif value < self.low:
+            self.low = value
+        self.close = value
+
+    def finish(self, end_ms: int) -> OHLC:
+        self.update(None, end_ms)
+        twap = self.weighted / self.covered_ms if self.covered_ms else self.close
+        return OHLC(self.open, self.high, self.low, self.close, twap)
+
+
+class _IntervalBars:
+    """
+    The bar in progress for one interval: O(1) per update, whatever the interval
+    """
+    def __init__(self, interval_ms: int):
+        self.interval_ms = interval_ms
+        self.start_time: int | None = None
+        self.updates = 0
+        self.values = [_ValueBar() for _ in BAR_VALUES]
+        self.emitted = 0
+
+    def update(self, time_ms: int, values: tuple) -> Bar | None:
+        """
+        Returns:
+            Bar - the previous bar if this update is the first one after its end
+        """
+        completed = None
+        if self.start_time is None:
+            self.start_time = time_ms - time_ms % self.interval_ms
+            for value_bar, value in zip(self.values, values):
+                value_bar.start(value, time_ms)
+        elif time_ms >= self.start_time + self.interval_ms:
+            end = self.start_time + self.interval_ms
+            completed = Bar(self.interval_ms, self.start_time, self.updates,
+                            *(value_bar.finish(end) for value_bar in self.values))
+            self.emitted += 1
+            # Intervals without updates are skipped; the new bar opens with the values in effect at its start
+            self.start_time = time_ms - time_ms % self.interval_ms
+            self.updates = 0
+            for value_bar in self.values:
+                value_bar.start(value_bar.close, self.start_time)
+        time_ms = max(time_ms, self.values[0].last_time)
+        for value_bar, value in zip(self.values, values):
+            value_bar.update(value, time_ms)
+        self.updates += 1
+        return completed
+
+
+class BarBuilder:
+    """
+    Time bars of the book's mid, microprice, spread and top-N imbalance for several intervals at once
+    (e.g. 100 ms, 1 s and 1 min), driven by the event time 'E' of the applied updates: record() is called
+    by the processing loop after every update and costs O(1) per interval - the values come from
+    MicrostructureMetrics, maintained from the touched levels, instead of being derived from full snapshots.
+    A bar is completed by the first update after its end and emitted to the listeners (listener(bar))
+    and, with store_directory set, to a columnar store per interval (store_directory/bars_<interval>ms,
+    see columnar_store.BAR_LAYOUT).
+    """
+    def __init__(self, intervals_ms = (100, 1000, 60000), top_n: int = 10, store_directory: str = None):
+        self.intervals_ms = tuple(intervals_ms)
+        self.top_n = top_n
+        self.store_directory = store_directory
+        self.metrics: MicrostructureMetrics | None = None
+        self.listeners: list = []
+        self._bars = [_IntervalBars(interval_ms) for interval_ms in self.intervals_ms]
+        # Opened with the first completed bar, so a builder that is never fed doesn't start writer threads
+        self._writers: dict[int, ColumnarWriter] = {}
+
+    def add_listener(self, listener) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener) -> None:
+        self.listeners.remove(listener)
+
+    def attach(self, order_book: OrderBook) -> None:
+        """
+        Follows a (newly synced) book, the bars in progress continue
+        """
+        if self.metrics is not None:
+            self.metrics.close()
+        self.metrics = MicrostructureMetrics(order_book, self.top_n, band_bps = ())
+
+    def record(self, order_book: OrderBook, message: dict) -> None:
+        """
+        Args:
+            order_book (OrderBook): the book the update was applied to, attached on first use
+            message (dict): the applied update, bars are driven by its event time 'E'
+        """
+        event_time = message.get('E')
+        if event_time is None:
+            return
+        if self.metrics is None or self.metrics.order_book is not order_book:
+            self.attach(order_book)
+        metrics = self.metrics
+        values = (metrics.mid, metrics.microprice, metrics.spread, metrics.imbalance)
+        for bars in self._bars:
+            completed = bars.update(event_time, values)
+            if completed is not None:
+                self._emit(completed)
+
+    def _emit(self, bar: Bar) -> None:
+        for listener in self.listeners:
+            try:
+                listener(bar)
+            except Exception as e:
+                logger.warning('Bar listener failed: %s', e)
+        if self.store_directory is not None:
+            writer = self._writers.get(bar.interval_ms)
+            if writer is None:
+                writer = ColumnarWriter(os.path.join(self.store_directory, f'bars_{bar.interval_ms}ms'),
+                                        depth = 0, layout = BAR_LAYOUT)
+                self._writers[bar.interval_ms] = writer
+            writer.append((bar.start_time, bar.updates,
+                           *([math.nan if value is None else value for value in ohlc] for ohlc in bar[3:])))
+
+    def close(self) -> None:
+        if self.metrics is not None:
+            self.metrics.close()
+            self.metrics = None
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    def snapshot(self) -> dict:
+        return {'bars': {bars.interval_ms: bars.emitted for bars in self._bars},
+                'stored': {interval_ms: writer.snapshot()['rows'] for interval_ms, writer in self._writers.items()}}
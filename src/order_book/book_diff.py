@@ -0,0 +1,121 @@
+from collections import namedtuple
+
+# Levels of one side, best first: added [(price, qty)], removed [(price, old qty)],
+# changed [(price, old qty, new qty)], unchanged - number of levels equal in both books
+SideDiff = namedtuple('SideDiff', ['added', 'removed', 'changed', 'unchanged'])
+
+
+class BookDifference(namedtuple('BookDifference', ['bids', 'asks', 'depth'])):
+    """
+    Result of diff_order_books: what has to change to turn the old book into the new one
+    """
+    __slots__ = ()
+
+    @property
+    def is_equal(self) -> bool:
+        return not any(side.added or side.removed or side.changed for side in (self.bids, self.asks))
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict - counts per side plus the quantity added, removed and the total absolute quantity change
+        """
+        summary = {}
+        for name, side in (('bids', self.bids), ('asks', self.asks)):
+            summary[name] = {'added': len(side.added),
+                             'removed': len(side.removed),
+                             'changed': len(side.changed),
+                             'unchanged': side.unchanged,
+                             'qty_added': sum(qty for _, qty in side.added),
+                             'qty_removed': sum(qty for _, qty in side.removed),
+                             'abs_qty_change': (sum(qty for _, qty in side.added) + sum(qty for _, qty in side.removed)
+                                                + sum(abs(new - old) for _, old, new in side.changed))}
+        summary['is_equal'] = self.is_equal
+        return summary
+
+    def levels(self) -> tuple[dict[float, float], dict[float, float]]:
+        """
+        Returns:
+            tuple - ({price: qty}, {price: qty}) for bids and asks with qty 0 for removed levels,
+            the same format as the levels of a depth update / diff_feed.BookDiff
+        """
+        result = []
+        for side in (self.bids, self.asks):
+            levels = {price: 0.0 for price, _ in side.removed}
+            levels.update(side.added)
+            levels.update((price, new) for price, _, new in side.changed)
+            result.append(levels)
+        return tuple(result)
+
+
+def _boundary(prices: list[float], descending: bool, depth: int) -> float:
+    # Price of the depth-th best level, or the worst level when the side is shallower
+    if not prices:
+        return None
+    index = max(len(prices) - depth, 0) if descending else min(depth, len(prices)) - 1
+    return prices[index]
+
+
+def _diff_side(old_prices: list[float], old_levels: dict, new_prices: list[float], new_levels: dict,
+               descending: bool, depth: int | None) -> SideDiff:
+    """
+    Merges the two ascending price lists best first in a single pass, reading them in place by index
+    """
+    added, removed, changed, unchanged = [], [], [], 0
+    n_old, n_new = len(old_prices), len(new_prices)
+    if descending:
+        i, j, step, i_end, j_end = n_old - 1, n_new - 1, -1, -1, -1
+    else:
+        i, j, step, i_end, j_end = 0, 0, 1, n_old, n_new
+
+    limit = None
+    if depth is not None:
+        old_boundary = _boundary(old_prices, descending, depth)
+        new_boundary = _boundary(new_prices, descending, depth)
+        # Compare down to the shallower of the two depth-th levels, so levels that only dropped out of one
+        # book's top N (but are still in the book) don't show up as added or removed
+        bounds = [bound for bound in (old_boundary, new_boundary) if bound is not None]
+        if bounds:
+            limit = max(bounds) if descending else min(bounds)
+
+    while i != i_end or j != j_end:
+        old_price = old_prices[i] if i != i_end else None
+        new_price = new_prices[j] if j != j_end else None
+        if new_price is None or (old_price is not None and (old_price > new_price if descending else old_price < new_price)):
+            price = old_price
+        else:
+            price = new_price
+        if limit is not None and (price < limit if descending else price > limit):
+            break
+        if price == old_price and price == new_price:
+            old_qty, new_qty = old_levels[price], new_levels[price]
+            if old_qty == new_qty:
+                unchanged += 1
+            else:
+                changed.append((price, old_qty, new_qty))
+            i += step
+            j += step
+        elif price == old_price:
+            removed.append((price, old_levels[price]))
+            i += step
+        else:
+            added.append((price, new_levels[price]))
+            j += step
+    return SideDiff(added, removed, changed, unchanged)
+
+
+def diff_order_books(old, new, depth: int = None) -> BookDifference:
+    """
+    Difference between two order books (or two versions of one), computed by merging their sorted
+    price lists in linear time without copying them.
+    Args:
+        old, new: OrderBook instances (or anything with ob_bids/ob_asks and sorted ob_bids_prices/ob_asks_prices)
+        depth (int, optional): only compare the top `depth` levels of every side, e.g. the limit of a REST snapshot
+    Returns:
+        BookDifference - added / removed / changed levels per side, best first, plus summary() and levels()
+    """
+    if depth is not None and depth < 1:
+        raise ValueError('depth has to be at least 1')
+    return BookDifference(_diff_side(old.ob_bids_prices, old.ob_bids, new.ob_bids_prices, new.ob_bids, True, depth),
+                          _diff_side(old.ob_asks_prices, old.ob_asks, new.ob_asks_prices, new.ob_asks, False, depth),
+                          depth)
@@ -0,0 +1,469 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+import aiohttp
+import websockets
+from order_book.order_book_class import OrderBook
+from order_book.supervisor import backoff_delay
+from order_book.diff_feed import DiffFeed
+from order_book.bars import BarBuilder
+from order_book.columnar_store import ColumnarWriter
+from order_book.drift_audit import BookDriftException, DriftAuditor
+from order_book.history import BookHistory
+from order_book.snapshot_scheduler import DEFAULT_WEIGHT_BUDGET, SnapshotScheduler
+from order_book.top_of_book import TopOfBookPublisher
+from utils.metrics import PipelineMetrics
+from utils.profiling import StageProfiler
+from wb_sockets import FrameRouter, ws_routed_ingestion, combined_stream_uri, find_matching_message, ws_processing
+from wb_sockets.processing import ws_partial_processing
+from wb_sockets.routing import COMBINED_STREAM_URI, DEPTH_STREAM_SUFFIX, symbol_stream
+from wb_sockets.subscribing import send_stream_request
+from wb_sockets.syncing import fetch_order_book_snapshot, get_first_depth_update_id
+
+logger = logging.getLogger(__name__)
+
+# Stage of the shared ingestion in the CPU report, its time isn't attributed to any symbol
+ROUTING_STAGE = 'routing'
+
+
+def estimate_book_bytes(order_book: OrderBook | None, buffer: deque[str]) -> int:
+    """
+    Shallow estimate of the memory held for one symbol: level dicts and price lists (with their floats),
+    the snapshot content and the frames waiting in the buffer. Cheap enough to call on every report,
+    unlike tracemalloc, and good enough to find the symbols that dominate the process memory.
+    """
+    size = sys.getsizeof(buffer) + sum(sys.getsizeof(frame) for frame in buffer)
+    if order_book is None:
+        return size
+    float_size = sys.getsizeof(0.0)
+    for side in (order_book.ob_bids, order_book.ob_asks):
+        size += sys.getsizeof(side) + 2 * float_size * len(side)
+    for prices in (order_book.ob_bids_prices, order_book.ob_asks_prices):
+        size += sys.getsizeof(prices)
+    if order_book.content:
+        for side_key in ('bids', 'asks'):
+            levels = order_book.content.get(side_key, ())
+            size += sys.getsizeof(levels) + sum(sys.getsizeof(level) + sys.getsizeof(level[0]) + sys.getsizeof(level[1])
+                                                for level in levels)
+    return size
+
+
+class SymbolBook:
+    """
+    State of one symbol in the BookManager: its buffer, metrics and the last valid OrderBook
+    """
+    def __init__(self, symbol: str, partial_levels: int = 0):
+        self.symbol = symbol.upper()
+        # > 0: partial-book mode, the top levels come from <symbol>@depth<N>@100ms and only the newest frame is kept
+        self.partial_levels = partial_levels
+        self.buffer: deque[str] = deque(maxlen=1) if partial_levels else deque()
+        self.metrics = PipelineMetrics()
+        # Last valid book, stays readable while the symbol resyncs
+        self.order_book: OrderBook | None = None
+        self.is_live = False
+        # time.monotonic() since when the symbol has no live book, None while live
+        self.stale_since: float | None = time.monotonic()
+        self.syncs = 0
+        self.last_error: str | None = None
+        # Shared-memory top of book for other processes, created by the BookManager when publish_depth is set
+        self.publisher: TopOfBookPublisher | None = None
+        # Live level diffs for local subscribers, see BookManager.subscribe
+        self.feed = DiffFeed()
+        # Set by BookManager.request_resync to drop the current book and sync again
+        self.resync_requested = asyncio.Event()
+        # Point-in-time history of the book, created by the BookManager when history_options is set
+        self.history: BookHistory | None = None
+        # Columnar store of the top levels, created by the BookManager when record_options is set
+        self.recorder: ColumnarWriter | None = None
+        # Time bars of the book, created by the BookManager when bar_options is set
+        self.bars: BarBuilder | None = None
+
+
+class BookManager:
+    """
+    Maintains the order books of many symbols over a single combined-stream connection.
+    The frames are routed by their 's' field into per-symbol buffers, and every symbol runs its own
+    sync -> process loop: a gap in one symbol resyncs only that symbol, the others keep processing.
+    Snapshot requests share one pooled REST session and go through a SnapshotScheduler: at most
+    max_concurrent_snapshots run at once, within snapshot_weight_budget of the REST weight limit, longest
+    stale and busiest symbols first, so a cold start or mass resync of hundreds of symbols doesn't stall on 429s.
+    With publish_depth set, every book also publishes its top levels to shared memory (see top_of_book.py).
+    With audit_options set (a dict of DriftAuditor arguments, {} for the defaults), a background DriftAuditor
+    compares the books with REST snapshots and resyncs the symbols that drifted.
+    With history_options set (a dict of BookHistory arguments, {} for the defaults), every symbol records
+    checkpoints and updates of its book, queried with book_at().
+    With record_options set (a dict of ColumnarWriter arguments), the top levels after every update are appended
+    to a columnar store in record_options['directory']/<SYMBOL>, see columnar_store.py.
+    Symbols in partial_depth (symbol -> 5, 10 or 20 levels) run in partial-book mode: they subscribe to the
+    partial depth stream and every payload replaces their top levels, without REST snapshots or continuity checks.
+    With bar_options set (a dict of BarBuilder arguments, {} for the defaults), every symbol builds time bars
+    (add listeners with books[symbol].bars.add_listener); a store_directory gets a subdirectory per symbol.
+    add_symbol / remove_symbol change the symbols while running: the stream is (un)subscribed on the live
+    connection and only that symbol's book is created or dropped, the other symbols keep processing.
+    """
+    def __init__(self, symbols, base_uri: str = COMBINED_STREAM_URI, stream_suffix: str = DEPTH_STREAM_SUFFIX,
+                 partial_depth: dict = None, max_concurrent_snapshots: int = 5, snapshot_weight_budget: float = DEFAULT_WEIGHT_BUDGET,
+                 sync_timeout: float = 10,
+                 backoff_base: float = 0.5, backoff_cap: float = 30, publish_depth: int = 0,
+                 audit_options: dict = None, history_options: dict = None,
+                 record_options: dict = None, bar_options: dict = None, connect = websockets.connect):
+        self.partial_depth = {symbol.upper(): levels for symbol, levels in (partial_depth or {}).items()}
+        self.history_options = history_options
+        self.bar_options = bar_options
+        self.books = {book.symbol: book for book in (self._new_book(symbol, self.partial_depth.get(symbol.upper(), 0))
+                                                     for symbol in symbols)}
+        self.base_uri = base_uri
+        self.stream_suffix = stream_suffix
+        self.uri = combined_stream_uri(self.books, base_uri, stream_suffix, self.partial_depth)
+        self.max_concurrent_snapshots = max_concurrent_snapshots
+        self.snapshot_weight_budget = snapshot_weight_budget
+        self.sync_timeout = sync_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.connect = connect
+        self.publish_depth = publish_depth
+        self.audit_options = audit_options
+        self.record_options = record_options
+        self.auditor: DriftAuditor | None = None
+        # Per-symbol CPU time: every symbol's task is its own stage
+        self.profiler = StageProfiler('stages')
+        self.router = FrameRouter({symbol: book.buffer for symbol, book in self.books.items()},
+                                  {symbol: book.metrics for symbol, book in self.books.items()})
+        self.reconnects = 0
+        self.scheduler: SnapshotScheduler | None = None
+        # Time it took until every symbol was live again, after the last time some of them went stale
+        self.last_resync: dict | None = None
+        self._resync_started = None
+        self._resync_symbols = set()
+        self._session = None
+        # Set while run() is active: publishers and recorders of added symbols are opened right away
+        self._outputs_open = False
+        # Live combined connection and the task of every symbol on it, for add_symbol / remove_symbol
+        self._websocket = None
+        self._symbol_tasks: dict[str, asyncio.Task] = {}
+        self._request_id = 1
+        self._stopping = False
+
+    def _new_book(self, symbol: str, partial_levels: int = 0) -> SymbolBook:
+        book = SymbolBook(symbol, partial_levels)
+        if self.history_options is not None:
+            book.history = BookHistory(**self.history_options)
+        if self.bar_options is not None:
+            options = dict(self.bar_options)
+            if options.get('store_directory'):
+                options['store_directory'] = os.path.join(options['store_directory'], book.symbol)
+            book.bars = BarBuilder(**options)
+        return book
+
+    def _open_outputs(self, book: SymbolBook) -> None:
+        if self.publish_depth:
+            book.publisher = TopOfBookPublisher(book.symbol, self.publish_depth)
+        if self.record_options is not None:
+            options = dict(self.record_options)
+            directory = options.pop('directory')
+            book.recorder = ColumnarWriter(os.path.join(directory, book.symbol), **options)
+
+    @staticmethod
+    def _close_outputs(book: SymbolBook) -> None:
+        if book.bars is not None:
+            book.bars.close()
+        if book.recorder is not None:
+            book.recorder.close()
+            book.recorder = None
+        if book.publisher is not None:
+            book.publisher.close()
+            book.publisher = None
+
+    def _close_all_outputs(self) -> None:
+        self._outputs_open = False
+        for book in self.books.values():
+            self._close_outputs(book)
+
+    def order_book(self, symbol: str) -> OrderBook | None:
+        """
+        Returns:
+            OrderBook - the last valid book of the symbol, None until it first synced
+        """
+        return self.books[symbol.upper()].order_book
+
+    def book_at(self, symbol: str, update_id: int) -> OrderBook:
+        """
+        Returns:
+            OrderBook - the symbol's book as of update_id, from its history (see history.py)
+        Raises:
+            KeyError: no history is recorded or update_id is outside of it
+        """
+        history = self.books[symbol.upper()].history
+        if history is None:
+            raise KeyError(f'No history is recorded for {symbol}')
+        return history.book_at(update_id)
+
+    def subscribe(self, symbol: str, max_pending: int = 1000, max_conflated_levels: int = 10000):
+        """
+        Returns:
+            DiffSubscriber - a snapshot of the symbol's book followed by its level diffs (see diff_feed.py)
+        """
+        return self.books[symbol.upper()].feed.subscribe(max_pending, max_conflated_levels)
+
+    def request_resync(self, symbol: str, report = None) -> None:
+        """
+        Makes the symbol drop its current book and sync again, e.g. as the DriftAuditor's on_drift callback
+        """
+        self.books[symbol.upper()].resync_requested.set()
+
+    async def add_symbol(self, symbol: str, partial_levels: int = 0) -> None:
+        """
+        Starts maintaining the book of one more symbol: subscribes its stream on the live connection
+        and syncs it, without touching the other symbols. Later connections include it in their URI.
+        Args:
+            symbol (str): trading pair
+            partial_levels (int): 5, 10 or 20 to run the symbol in partial-book mode
+        """
+        symbol = symbol.upper()
+        if symbol in self.books:
+            return
+        partial_depth = {**self.partial_depth, symbol: partial_levels} if partial_levels else self.partial_depth
+        # Raises before anything changes when the connection can't carry one more stream
+        uri = combined_stream_uri([*self.books, symbol], self.base_uri, self.stream_suffix, partial_depth)
+        book = self._new_book(symbol, partial_levels)
+        if self._outputs_open:
+            self._open_outputs(book)
+        self.books[symbol] = book
+        self.router.buffers[symbol] = book.buffer
+        self.router.metrics[symbol] = book.metrics
+        self.partial_depth, self.uri = partial_depth, uri
+        self._mark_stale(book)
+        if self._websocket is not None:
+            await self._send_stream_request('SUBSCRIBE', book)
+            self._symbol_tasks[symbol] = asyncio.create_task(
+                self.profiler.wrap_coroutine(symbol, self._run_symbol(book)))
+        logger.info('Added %s', symbol)
+
+    async def remove_symbol(self, symbol: str) -> None:
+        """
+        Stops maintaining the book of a symbol: unsubscribes its stream on the live connection and drops its book,
+        without touching the other symbols
+        Raises:
+            ValueError: for the last symbol, the manager is stopped instead
+        """
+        symbol = symbol.upper()
+        if symbol not in self.books:
+            return
+        if len(self.books) == 1:
+            raise ValueError(f'{symbol} is the last symbol of the manager, stop the manager instead')
+        book = self.books.pop(symbol)
+        task = self._symbol_tasks.pop(symbol, None)
+        if task is not None:
+            await self._cancel(task)
+        self.router.buffers.pop(symbol, None)
+        self.router.metrics.pop(symbol, None)
+        self.partial_depth = {other: levels for other, levels in self.partial_depth.items() if other != symbol}
+        self.uri = combined_stream_uri(self.books, self.base_uri, self.stream_suffix, self.partial_depth)
+        self._resync_symbols.discard(symbol)
+        if self._websocket is not None:
+            await self._send_stream_request('UNSUBSCRIBE', book)
+        self._close_outputs(book)
+        logger.info('Removed %s', symbol)
+
+    async def _send_stream_request(self, method: str, book: SymbolBook) -> None:
+        self._request_id += 1
+        try:
+            await send_stream_request(self._websocket, method, [symbol_stream(book.symbol, self.stream_suffix,
+                                                                              book.partial_levels)], self._request_id)
+        except websockets.ConnectionClosed as e:
+            # The next connection is opened with the updated URI
+            logger.warning('%s %s not sent, the connection is closed: %s', method, book.symbol, e)
+
+    def stop(self) -> None:
+        self._stopping = True
+        if self.auditor is not None:
+            self.auditor.stop()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict - per-symbol state, counters, estimated memory and CPU time, plus the shared routing stats
+        """
+        cpu = self.profiler.report()
+        symbols = {}
+        for symbol, book in self.books.items():
+            apply_latency = book.metrics.histograms['apply'].snapshot()
+            symbols[symbol] = {'is_live': book.is_live,
+                               'partial_levels': book.partial_levels,
+                               'syncs': book.syncs,
+                               'resyncs': book.metrics.resyncs,
+                               'messages_applied': book.metrics.messages_applied,
+                               'buffer_len': len(book.buffer),
+                               'memory_bytes': estimate_book_bytes(book.order_book, book.buffer),
+                               'cpu_s': cpu.get(symbol, {}).get('cpu_s', 0.0),
+                               'apply_p99_ms': apply_latency['p99_ms'],
+                               'last_error': book.last_error}
+        return {'symbols': symbols,
+                'live': sum(book.is_live for book in self.books.values()),
+                'routed': self.router.routed,
+                'unrouted': self.router.unrouted,
+                'routing_cpu_s': cpu.get(ROUTING_STAGE, {}).get('cpu_s', 0.0),
+                'reconnects': self.reconnects,
+                'last_resync': self.last_resync,
+                'snapshots': self.scheduler.snapshot() if self.scheduler is not None else None,
+                'audit': self.auditor.snapshot() if self.auditor is not None else None}
+
+    async def run(self, session: aiohttp.ClientSession = None) -> None:
+        """
+        Infinite function (until stop() is called) which keeps all the books running, reconnecting
+        with jittered backoff when the combined stream fails
+        Args:
+            session (aiohttp.ClientSession, optional): pooled REST session, created (and closed) here if not given
+        """
+        attempt = 0
+        async with contextlib.AsyncExitStack() as stack:
+            self._session = session if session is not None else await stack.enter_async_context(aiohttp.ClientSession())
+            self.scheduler = SnapshotScheduler(self._session, self.snapshot_weight_budget, self.max_concurrent_snapshots)
+            stack.push_async_callback(self.scheduler.close)
+            # Closes the outputs of the symbols present at the end, removed symbols closed theirs already
+            stack.callback(self._close_all_outputs)
+            self._outputs_open = True
+            for book in self.books.values():
+                self._open_outputs(book)
+            if self.audit_options is not None:
+                self.auditor = DriftAuditor(self.books, self._session, on_drift = self.request_resync, **self.audit_options)
+                audit_task = asyncio.create_task(self.auditor.run())
+                stack.push_async_callback(self._cancel, audit_task)
+            while not self._stopping:
+                try:
+                    await self._run_connection()
+                    attempt = 0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error('Combined stream failed: %s', e)
+                if self._stopping:
+                    break
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                attempt += 1
+                self.reconnects += 1
+                logger.info('Reconnecting the combined stream in %.2fs (attempt %d)', delay, attempt)
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _cancel(task: asyncio.Task) -> None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def _run_connection(self) -> None:
+        for book in self.books.values():
+            # Frames of the previous connection can't be continued, every symbol syncs again
+            book.buffer.clear()
+            self._mark_stale(book)
+        async with self.connect(self.uri) as websocket:
+            logger.info('Connected to the combined stream for %d symbols', len(self.books))
+            ingestion_task = asyncio.create_task(
+                self.profiler.wrap_coroutine(ROUTING_STAGE, ws_routed_ingestion(websocket, self.router)))
+            self._symbol_tasks = {symbol: asyncio.create_task(self.profiler.wrap_coroutine(symbol, self._run_symbol(book)))
+                                  for symbol, book in self.books.items()}
+            self._websocket = websocket
+            try:
+                while not self._stopping and not ingestion_task.done():
+                    await asyncio.wait([ingestion_task], timeout = 0.5)
+                if ingestion_task.done():
+                    ingestion_task.result()
+            finally:
+                self._websocket = None
+                tasks = [ingestion_task, *self._symbol_tasks.values()]
+                self._symbol_tasks = {}
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _sync(self, book: SymbolBook) -> OrderBook:
+        # Wait for the symbol's first update before queueing its snapshot, so quiet symbols don't hold up the others
+        await asyncio.wait_for(get_first_depth_update_id(book.buffer), timeout = self.sync_timeout)
+
+        def request(symbol):
+            return self.scheduler.fetch(symbol, stale_since = book.stale_since, traffic = book.buffer.__len__)
+        snapshot, order_book_last_update_id = await asyncio.wait_for(
+            fetch_order_book_snapshot(book.buffer, self._session, symbol = book.symbol, request = request),
+            timeout = self.sync_timeout)
+        await asyncio.wait_for(find_matching_message(order_book_last_update_id, book.buffer), timeout = self.sync_timeout)
+        order_book = OrderBook(snapshot)
+        await order_book.extract_order_book_prices()
+        return order_book
+
+    async def _sync_partial(self, book: SymbolBook) -> OrderBook:
+        # Partial-book mode: the first payload has the same shape as a REST snapshot and is the book
+        async def first_payload():
+            while not book.buffer:
+                await asyncio.sleep(0.01)
+            return json.loads(book.buffer.pop())
+        order_book = OrderBook(await asyncio.wait_for(first_payload(), timeout = self.sync_timeout))
+        await order_book.extract_order_book_prices()
+        return order_book
+
+    def _mark_stale(self, book: SymbolBook) -> None:
+        if book.is_live or book.stale_since is None:
+            book.stale_since = time.monotonic()
+        book.is_live = False
+        if self._resync_started is None:
+            self._resync_started = book.stale_since
+        self._resync_symbols.add(book.symbol)
+
+    def _mark_live(self, book: SymbolBook) -> None:
+        book.is_live = True
+        book.stale_since = None
+        if self._resync_started is not None and all(other.is_live for other in self.books.values()):
+            self.last_resync = {'symbols': len(self._resync_symbols),
+                                'duration_s': time.monotonic() - self._resync_started}
+            logger.info('%d symbols resynced in %.2fs', self.last_resync['symbols'], self.last_resync['duration_s'])
+            self._resync_started = None
+            self._resync_symbols = set()
+
+    async def _process(self, book: SymbolBook, order_book: OrderBook) -> None:
+        # ws_processing until it fails or a resync is requested, both end by raising
+        book.resync_requested.clear()
+        process = ws_partial_processing if book.partial_levels else ws_processing
+        processing = asyncio.create_task(self.profiler.wrap_coroutine(
+            book.symbol, process(order_book, book.buffer, book.metrics, book.publisher, book.feed,
+                                 book.recorder, book.bars)))
+        resync = asyncio.create_task(book.resync_requested.wait())
+        try:
+            await asyncio.wait([processing, resync], return_when = asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (processing, resync):
+                task.cancel()
+            await asyncio.gather(processing, resync, return_exceptions=True)
+        if processing.done() and not processing.cancelled():
+            processing.result()
+        book.metrics.record_resync()
+        raise BookDriftException(f'{book.symbol} resync requested')
+
+    async def _run_symbol(self, book: SymbolBook) -> None:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                order_book = await (self._sync_partial(book) if book.partial_levels else self._sync(book))
+                book.order_book = order_book
+                if book.history is not None:
+                    book.history.attach(order_book)
+                if book.publisher is not None:
+                    book.publisher.publish(order_book)
+                self._mark_live(book)
+                book.syncs += 1
+                attempt = 0
+                logger.info('%s synced in %.1f ms', book.symbol, (time.perf_counter() - started) * 1000)
+                await self._process(book, order_book)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # ws_processing already counted a continuity gap as a resync
+                self._mark_stale(book)
+                book.last_error = repr(e)
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                attempt += 1
+                logger.warning('%s resyncing in %.2fs: %r', book.symbol, delay, e)
+                await asyncio.sleep(delay)
@@ -0,0 +1,289 @@
+import bisect
+import logging
+import math
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional: without it the reader returns flat memoryviews instead of arrays, still without copies
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# A store is a directory with one file per column plus header.bin (little endian):
+#   header: magic, version, depth (uint32), layout (uint32), committed rows (uint64)
+#   columns: fixed-width rows, see LAYOUTS. In a book store update_id and event_time are one int64 per row,
+#   the level columns `depth` doubles per row (best first, NaN where the side has fewer levels)
+# The files are preallocated and doubled when full. The writer fills a row in every column before it
+# increments the committed rows in the header, so a reader never sees a row that is being written
+# (as for top_of_book.py, this relies on the stores becoming visible in program order, which holds on x86-64).
+HEADER = struct.Struct('<4sIIIQ')
+MAGIC = b'LOBC'
+VERSION = 1
+HEADER_FILE = 'header.bin'
+# Column layouts by the id stored in the header: (name, struct format, values per row, None for `depth` values)
+BOOK_LAYOUT = 0
+BAR_LAYOUT = 1
+LAYOUTS = {
+    # Top-N book states, see ColumnarWriter.record
+    BOOK_LAYOUT: (('update_id', 'q', 1), ('event_time', 'q', 1),
+                  ('bid_price', 'd', None), ('bid_qty', 'd', None), ('ask_price', 'd', None), ('ask_qty', 'd', None)),
+    # Time bars, see bars.py: open, high, low, close and time-weighted average of every value
+    BAR_LAYOUT: (('start_time', 'q', 1), ('updates', 'q', 1),
+                 ('mid', 'd', 5), ('microprice', 'd', 5), ('spread', 'd', 5), ('imbalance', 'd', 5)),
+}
+_NUMPY_DTYPES = {'q': '<i8', 'd': '<f8'}
+
+
+def _column_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f'{name}.bin')
+
+
+def _read_header(directory: str) -> tuple[int, int, int]:
+    with open(os.path.join(directory, HEADER_FILE), 'rb') as header_file:
+        magic, version, depth, layout, rows = HEADER.unpack(header_file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or layout not in LAYOUTS:
+        raise ValueError(f'{directory} is not a columnar book store (version {VERSION})')
+    return depth, layout, rows
+
+
+def _widths(layout: int, depth: int) -> dict[str, int]:
+    return {name: depth if width is None else width for name, _, width in LAYOUTS[layout]}
+
+
+class ColumnarWriter:
+    """
+    Writer stage of a columnar store of top-N book states for research: fed by the processing loop
+    (record() after every applied update), it appends to memory-mapped, preallocated column files on its own thread.
+    record() only copies the top levels and queues them, so the event loop never waits for the disk;
+    when the thread falls max_pending rows behind the new rows are dropped and counted.
+    With interval_ms set, only the first update of every interval of event time is recorded.
+    An existing store of the same depth and layout is appended to. Other stages append rows of their own
+    layout with append(), e.g. the BarBuilder.
+    """
+    def __init__(self, directory: str, depth: int = 20, capacity: int = 1 << 16, interval_ms: int = 0,
+                 max_pending: int = 100000, layout: int = BOOK_LAYOUT):
+        self.directory = directory
+        self.depth = depth
+        self.layout = layout
+        self.interval_ms = interval_ms
+        self.recorded = 0
+        self.dropped = 0
+        self._last_interval = None
+        os.makedirs(directory, exist_ok=True)
+        header_path = os.path.join(directory, HEADER_FILE)
+        if os.path.exists(header_path):
+            stored_depth, stored_layout, self.rows = _read_header(directory)
+            if (stored_depth, stored_layout) != (depth, layout):
+                raise ValueError(f'{directory} stores {stored_depth} levels of layout {stored_layout}, not {depth} of {layout}')
+        else:
+            self.rows = 0
+            with open(header_path, 'wb') as header_file:
+                header_file.write(HEADER.pack(MAGIC, VERSION, depth, layout, 0))
+        self._header_file = open(header_path, 'r+b')
+        self._header = mmap.mmap(self._header_file.fileno(), HEADER.size)
+        self._columns = LAYOUTS[layout]
+        widths = _widths(layout, depth)
+        self._packers = {name: struct.Struct(f'<{widths[name]}{fmt}') for name, fmt, _ in self._columns}
+        self._files, self._maps = {}, {}
+        self.capacity = max(capacity, self.rows, 1)
+        for name, _, _ in self._columns:
+            path = _column_path(directory, name)
+            self._files[name] = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self._map_columns()
+        self._padding = [math.nan] * max(self._packers[name].size // 8 for name in self._packers)
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, name=f'columnar-writer-{os.path.basename(directory)}',
+                                        daemon=True)
+        self._thread.start()
+
+    def _map_columns(self) -> None:
+        for name, column_file in self._files.items():
+            size = self.capacity * self._packers[name].size
+            if os.fstat(column_file.fileno()).st_size < size:
+                # Sparse on most file systems, the blocks are only allocated as rows are written
+                column_file.truncate(size)
+            if name in self._maps:
+                self._maps[name].close()
+            self._maps[name] = mmap.mmap(column_file.fileno(), size)
+
+    def record(self, order_book, message: dict = None) -> None:
+        """
+        Queues the current top levels of the book, called on the event loop after every applied update
+        Args:
+            order_book (OrderBook): book with up-to-date price lists
+            message (dict, optional): the applied update, its event time 'E' is recorded (receive time if absent)
+        """
+        event_time = message.get('E') if message else None
+        if event_time is None:
+            event_time = time.time_ns() // 1_000_000
+        if self.interval_ms:
+            interval = event_time // self.interval_ms
+            if interval == self._last_interval:
+                return
+            self._last_interval = interval
+        depth = self.depth
+        bid_prices = order_book.ob_bids_prices[:-depth - 1:-1]
+        ask_prices = order_book.ob_asks_prices[:depth]
+        bids, asks = order_book.ob_bids, order_book.ob_asks
+        self.append((order_book.last_update_id or 0, event_time,
+                     bid_prices, [bids[price] for price in bid_prices],
+                     ask_prices, [asks[price] for price in ask_prices]))
+
+    def append(self, row: tuple) -> None:
+        """
+        Queues a row: one value per column of the layout, a sequence for the multi-value columns
+        (padded with NaN when shorter than the column)
+        """
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            row = self._queue.get()
+            if row is None:
+                return
+            try:
+                self._write(row)
+            except Exception as e:
+                self.dropped += 1
+                logger.error('Columnar store %s failed to write a row: %s', self.directory, e)
+
+    def _write(self, row: tuple) -> None:
+        if self.rows == self.capacity:
+            self.capacity *= 2
+            self._map_columns()
+        rows = self.rows
+        for (name, _, width), values in zip(self._columns, row):
+            packer = self._packers[name]
+            if width == 1:
+                packer.pack_into(self._maps[name], rows * packer.size, values)
+            else:
+                packer.pack_into(self._maps[name], rows * packer.size, *values, *self._padding[len(values):packer.size // 8])
+        self.rows = rows + 1
+        HEADER.pack_into(self._header, 0, MAGIC, VERSION, self.depth, self.layout, self.rows)
+        self.recorded += 1
+
+    def close(self) -> None:
+        """
+        Writes the queued rows and closes the files
+        """
+        self._queue.put(None)
+        self._thread.join()
+        for name, column_map in self._maps.items():
+            column_map.flush()
+            column_map.close()
+            self._files[name].close()
+        self._header.flush()
+        self._header.close()
+        self._header_file.close()
+
+    def snapshot(self) -> dict:
+        return {'rows': self.rows,
+                'capacity': self.capacity,
+                'recorded': self.recorded,
+                'dropped': self.dropped,
+                'pending': self._queue.qsize()}
+
+
+class ColumnarReader:
+    """
+    Reader of a columnar store, from any process, also while the writer appends: slices of the columns
+    over a range of rows, update ids or event times, as views on the memory-mapped files (no parsing, no copies).
+    With numpy the views are arrays, of shape (rows,) for the scalar columns (e.g. update_id / event_time)
+    and (rows, values per row) for the others (e.g. (rows, depth) for the level columns); without it they are
+    flat memoryviews (row after row for the multi-value columns).
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.depth, self.layout, _ = _read_header(directory)
+        self._header_file = open(os.path.join(directory, HEADER_FILE), 'rb')
+        self._header = mmap.mmap(self._header_file.fileno(), HEADER.size, access=mmap.ACCESS_READ)
+        self._columns = LAYOUTS[self.layout]
+        self._widths = _widths(self.layout, self.depth)
+        self._row_sizes = {name: 8 * width for name, width in self._widths.items()}
+        self._files = {name: open(_column_path(directory, name), 'rb') for name, _, _ in self._columns}
+        self._maps, self._views, self._mapped_rows = {}, {}, 0
+        # Mappings replaced after the writer grew the files, kept open as long as views of them may be in use
+        self._retired = []
+        self._map_columns()
+
+    @property
+    def rows(self) -> int:
+        return HEADER.unpack_from(self._header, 0)[4]
+
+    def _map_columns(self) -> None:
+        self._retired.extend(self._maps.values())
+        sizes = {name: os.fstat(column_file.fileno()).st_size for name, column_file in self._files.items()}
+        self._mapped_rows = min(sizes[name] // self._row_sizes[name] for name in self._files)
+        for name, fmt, _ in self._columns:
+            column_map = mmap.mmap(self._files[name].fileno(), sizes[name], access=mmap.ACCESS_READ)
+            self._maps[name] = column_map
+            self._views[name] = memoryview(column_map).cast(fmt)
+
+    def _committed_rows(self) -> int:
+        rows = self.rows
+        if rows > self._mapped_rows:
+            self._map_columns()
+        return rows
+
+    def slice_rows(self, start: int, end: int) -> dict:
+        """
+        Returns:
+            dict - column name -> view of the rows start to end (exclusive), clipped to the committed rows
+        """
+        rows = self._committed_rows()
+        start, end = max(0, min(start, rows)), max(0, min(end, rows))
+        end = max(start, end)
+        columns = {}
+        for name, fmt, _ in self._columns:
+            width = self._widths[name]
+            if np is not None:
+                array = np.frombuffer(self._maps[name], dtype=_NUMPY_DTYPES[fmt], count=end * width)
+                columns[name] = array.reshape(end, width)[start:end] if width > 1 else array[start:end]
+            else:
+                columns[name] = self._views[name][start * width:end * width]
+        return columns
+
+    def _search(self, name: str, first: int, last: int) -> tuple[int, int]:
+        # Rows with first <= value <= last in a non-decreasing scalar column
+        rows = self._committed_rows()
+        values = self._views[name][:rows]
+        return bisect.bisect_left(values, first), bisect.bisect_right(values, last)
+
+    def by_update_id(self, first: int, last: int) -> dict:
+        """
+        Returns:
+            dict - column name -> view of the rows with first <= update_id <= last (book stores)
+        """
+        return self.slice_rows(*self._search('update_id', first, last))
+
+    def by_event_time(self, start_ms: int, end_ms: int) -> dict:
+        """
+        Returns:
+            dict - column name -> view of the rows with start_ms <= event time <= end_ms (milliseconds):
+            event_time of a book store, start_time of a bar store
+        """
+        column = 'event_time' if self.layout == BOOK_LAYOUT else 'start_time'
+        return self.slice_rows(*self._search(column, start_ms, end_ms))
+
+    def close(self) -> None:
+        """
+        Closes the files; views returned before have to be released first
+        """
+        for view in self._views.values():
+            view.release()
+        for column_map in (*self._maps.values(), *self._retired):
+            column_map.close()
+        for column_file in self._files.values():
+            column_file.close()
+        self._header.close()
+        self._header_file.close()
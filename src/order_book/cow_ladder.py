@@ -0,0 +1,175 @@
+import bisect
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Levels per chunk: a chunk is split in two when it grows past twice this size
+CHUNK_SIZE = 64
+
+
+class _Chunk(list):
+    """
+    Sorted (price, qty) levels of one stretch of a side. epoch: the freeze epoch the chunk was created in,
+    a chunk of an older epoch may be shared with snapshots and is copied before it's changed
+    """
+    __slots__ = ('epoch',)
+
+    def __init__(self, levels = (), epoch: int = 0):
+        super().__init__(levels)
+        self.epoch = epoch
+
+
+class _CowSide:
+    """
+    One side of the book as a list of chunks, ASC by price, plus the first price of every chunk to find them.
+    freeze() hands out the current chunk list and starts a new epoch: the next change copies the chunk list
+    (one entry per chunk) and the chunk it touches, every other chunk stays shared with the snapshot.
+    """
+    __slots__ = ('chunk_size', 'chunks', 'firsts', 'count', 'epoch', 'index_epoch', 'copied_chunks')
+
+    def __init__(self, levels: dict[float, float], chunk_size: int):
+        self.chunk_size = chunk_size
+        items = sorted(levels.items())
+        self.chunks = [_Chunk(items[start:start + chunk_size]) for start in range(0, len(items), chunk_size)]
+        self.firsts = [chunk[0][0] for chunk in self.chunks]
+        self.count = len(items)
+        self.epoch = 0
+        # Epoch of the chunk list itself
+        self.index_epoch = 0
+        self.copied_chunks = 0
+
+    def freeze(self) -> tuple[list, int]:
+        self.epoch += 1
+        return self.chunks, self.count
+
+    def _own_index(self) -> None:
+        if self.index_epoch != self.epoch:
+            self.chunks, self.firsts = list(self.chunks), list(self.firsts)
+            self.index_epoch = self.epoch
+
+    def _own_chunk(self, index: int) -> _Chunk:
+        chunk = self.chunks[index]
+        if chunk.epoch != self.epoch:
+            chunk = self.chunks[index] = _Chunk(chunk, self.epoch)
+            self.copied_chunks += 1
+        return chunk
+
+    def set(self, price: float, qty: float) -> None:
+        """
+        Sets the quantity of a level, qty 0 removes it
+        """
+        chunks = self.chunks
+        if not chunks:
+            if qty:
+                self._own_index()
+                self.chunks.append(_Chunk([(price, qty)], self.epoch))
+                self.firsts.append(price)
+                self.count += 1
+            return
+        index = max(bisect.bisect_right(self.firsts, price) - 1, 0)
+        chunk = chunks[index]
+        position = bisect.bisect_left(chunk, (price,))
+        present = position < len(chunk) and chunk[position][0] == price
+        if not qty and not present:
+            return
+        self._own_index()
+        chunk = self._own_chunk(index)
+        if not qty:
+            del chunk[position]
+            self.count -= 1
+            if not chunk:
+                del self.chunks[index], self.firsts[index]
+            elif position == 0:
+                self.firsts[index] = chunk[0][0]
+        elif present:
+            chunk[position] = (price, qty)
+        else:
+            chunk.insert(position, (price, qty))
+            self.count += 1
+            if position == 0:
+                self.firsts[index] = price
+            if len(chunk) > 2 * self.chunk_size:
+                half = len(chunk) // 2
+                tail = _Chunk(chunk[half:], self.epoch)
+                del chunk[half:]
+                self.chunks.insert(index + 1, tail)
+                self.firsts.insert(index + 1, tail[0][0])
+
+
+class FrozenBook:
+    """
+    Immutable view of an OrderBook as of one version (see OrderBook.take_snapshot): it shares the chunks
+    of the live book's ladders that didn't change since, so it costs nothing to take and stays valid
+    however long it's kept and iterated, e.g. by a checkpoint, a diff or a deep snapshot being served.
+    """
+    __slots__ = ('version', 'last_update_id', 'num_bids', 'num_asks', '_bid_chunks', '_ask_chunks')
+
+    def __init__(self, version: int, last_update_id: int | None, bid_chunks: list, num_bids: int,
+                 ask_chunks: list, num_asks: int):
+        self.version = version
+        self.last_update_id = last_update_id
+        self._bid_chunks, self.num_bids = bid_chunks, num_bids
+        self._ask_chunks, self.num_asks = ask_chunks, num_asks
+
+    def bids(self):
+        """
+        Yields:
+            tuple - (price, qty) of every bid, best (highest) first
+        """
+        for chunk in reversed(self._bid_chunks):
+            yield from reversed(chunk)
+
+    def asks(self):
+        """
+        Yields:
+            tuple - (price, qty) of every ask, best (lowest) first
+        """
+        for chunk in self._ask_chunks:
+            yield from chunk
+
+    def top(self, side: str, depth: int) -> list[tuple[float, float]]:
+        """
+        Returns:
+            list - the first `depth` (price, qty) of 'bids' or 'asks', best first
+        """
+        return list(itertools.islice(self.bids() if side == 'bids' else self.asks(), depth))
+
+
+class CowLadders:
+    """
+    Chunked copy-on-write copy of both sides of an OrderBook, maintained from the levels every update touches
+    (OrderBook level listener). freeze() is O(1); until the next freeze an update copies the chunk it changes
+    (chunk_size to 2 x chunk_size levels) and, once, the chunk list of its side, so the memory held by the
+    snapshots alive is bounded by the chunks changed while they were alive, not by their number times the book.
+    """
+    def __init__(self, order_book, chunk_size: int = CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError(f'Chunk size {chunk_size} is too small')
+        self.order_book = order_book
+        self.sides = {'bids': _CowSide(order_book.ob_bids, chunk_size), 'asks': _CowSide(order_book.ob_asks, chunk_size)}
+        self.freezes = 0
+        order_book.add_level_listener(self._on_update)
+
+    def close(self) -> None:
+        self.order_book.remove_level_listener(self._on_update)
+
+    def _on_update(self, order_book, bid_changes: list, ask_changes: list) -> None:
+        for side, changes in ((self.sides['bids'], bid_changes), (self.sides['asks'], ask_changes)):
+            for price, _, new_qty in changes:
+                side.set(price, new_qty)
+
+    def freeze(self) -> FrozenBook:
+        """
+        Called between two updates, see OrderBook.take_snapshot
+        """
+        self.freezes += 1
+        bid_chunks, num_bids = self.sides['bids'].freeze()
+        ask_chunks, num_asks = self.sides['asks'].freeze()
+        return FrozenBook(self.order_book.version, self.order_book.last_update_id, bid_chunks, num_bids,
+                          ask_chunks, num_asks)
+
+    def snapshot(self) -> dict:
+        return {'freezes': self.freezes,
+                'chunks': sum(len(side.chunks) for side in self.sides.values()),
+                'copied_chunks': sum(side.copied_chunks for side in self.sides.values())}
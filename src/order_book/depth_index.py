@@ -0,0 +1,230 @@
+import logging
+import math
+from collections import namedtuple
+from functools import reduce
+from order_book.order_book_class import OrderBook
+
+logger = logging.getLogger(__name__)
+
+# Prices and quantities are indexed as integers in units of 1e-8 (Binance sends 8 decimals),
+# so the cumulative sums are exact
+PRICE_SCALE = 10 ** 8
+QTY_SCALE = 10 ** 8
+# Free ticks kept above the best price when a side is (re)built, so the touch can move before the next rebuild
+MIN_HEADROOM = 1024
+
+# Result of walking one side for a quantity: quantity - what the side can fill (less than asked when it's too thin),
+# average_price - VWAP of that fill, worst_price - the last level it reaches
+Fill = namedtuple('Fill', ['quantity', 'average_price', 'worst_price'])
+
+
+class _SideIndex:
+    """
+    Fenwick trees of quantity and notional over a price grid of one side, best price first.
+    Slot i is the price origin - i * tick for bids and origin + i * tick for asks, so every level has a fixed
+    slot and inserting or removing a level is a point update - unlike positions in the sorted price list.
+    """
+    def __init__(self, is_bid: bool, max_slots: int):
+        self.is_bid = is_bid
+        self.max_slots = max_slots
+        self.tick = None
+        # True while the tick comes from a single price: it's only a placeholder, the next level rebuilds the side
+        self.provisional = False
+        self.origin = 0
+        self.size = 0
+        # 1-based trees
+        self.qty = [0]
+        self.notional = [0]
+        self.rebuilds = 0
+
+    def _slot(self, price_units: int) -> int:
+        offset = self.origin - price_units if self.is_bid else price_units - self.origin
+        return offset // self.tick
+
+    def _price_units(self, slot: int) -> int:
+        return self.origin - slot * self.tick if self.is_bid else self.origin + slot * self.tick
+
+    def rebuild(self, levels: dict[float, float]) -> None:
+        units = sorted(round(price * PRICE_SCALE) for price in levels)
+        if not units:
+            self.size, self.qty, self.notional = 0, [0], [0]
+            return
+        # The tick is the largest step all the prices are multiples of (relative to each other),
+        # it takes two prices to infer one
+        known_tick = 0 if self.provisional else self.tick or 0
+        tick = reduce(math.gcd, (high - low for low, high in zip(units, units[1:])), known_tick)
+        self.provisional = not tick
+        tick = tick or 1
+        best, worst = (units[-1], units[0]) if self.is_bid else (units[0], units[-1])
+        span = abs(best - worst) // tick + 1
+        headroom = max(MIN_HEADROOM, span // 4)
+        self.tick = tick
+        self.origin = best + headroom * tick if self.is_bid else best - headroom * tick
+        self.size = min(span + 2 * headroom, self.max_slots)
+        qty, notional = [0] * (self.size + 1), [0] * (self.size + 1)
+        for price, level_qty in levels.items():
+            price_units = round(price * PRICE_SCALE)
+            slot = self._slot(price_units)
+            if slot < self.size:
+                qty_units = round(level_qty * QTY_SCALE)
+                qty[slot + 1] += qty_units
+                notional[slot + 1] += qty_units * price_units
+        # Linear-time Fenwick construction
+        for index in range(1, self.size + 1):
+            parent = index + (index & -index)
+            if parent <= self.size:
+                qty[parent] += qty[index]
+                notional[parent] += notional[index]
+        self.qty, self.notional = qty, notional
+        self.rebuilds += 1
+
+    def update(self, price: float, old_qty: float, new_qty: float) -> bool:
+        """
+        Returns:
+            bool - False when the price doesn't fit the grid (above the headroom, below the end of a grid that can
+                   still grow, or off the tick), the side needs a rebuild
+        """
+        if old_qty == new_qty:
+            return True
+        if self.tick is None or self.provisional:
+            return False
+        price_units = round(price * PRICE_SCALE)
+        if (price_units - self.origin) % self.tick:
+            return False
+        slot = self._slot(price_units)
+        if slot < 0:
+            return False
+        if slot >= self.size:
+            # Deeper than the grid reaches: rebuilt to cover it, unless the grid is already at max_slots
+            return self.size >= self.max_slots
+        delta = round(new_qty * QTY_SCALE) - round(old_qty * QTY_SCALE)
+        if delta:
+            notional_delta = delta * price_units
+            index = slot + 1
+            qty, notional, size = self.qty, self.notional, self.size
+            while index <= size:
+                qty[index] += delta
+                notional[index] += notional_delta
+                index += index & -index
+        return True
+
+    def prefix(self, slots: int) -> tuple[int, int]:
+        # Quantity and notional of the first `slots` slots
+        qty = notional = 0
+        index = min(slots, self.size)
+        while index > 0:
+            qty += self.qty[index]
+            notional += self.notional[index]
+            index -= index & -index
+        return qty, notional
+
+    def fill(self, qty_units: int) -> tuple[int, int, int | None]:
+        """
+        Fenwick descent to the slot where the cumulative quantity reaches qty_units
+        Returns:
+            tuple - filled quantity and notional (units), price units of the last level reached (None if nothing filled)
+        """
+        position, remaining, notional = 0, qty_units, 0
+        step = 1 << self.size.bit_length() if self.size else 0
+        while step:
+            following = position + step
+            if following <= self.size and self.qty[following] < remaining:
+                position = following
+                remaining -= self.qty[following]
+                notional += self.notional[following]
+            step >>= 1
+        if position >= self.size:
+            # The side is too thin: everything it has, down to its last non-empty slot
+            filled = qty_units - remaining
+            if not filled:
+                return 0, 0, None
+            return filled, notional, self._price_units(self._last_slot())
+        price_units = self._price_units(position)
+        return qty_units, notional + remaining * price_units, price_units
+
+    def _last_slot(self) -> int:
+        # Deepest slot with a quantity: the first slot whose prefix holds the whole side
+        total, _ = self.prefix(self.size)
+        position, remaining = 0, total
+        step = 1 << self.size.bit_length()
+        while step:
+            following = position + step
+            if following <= self.size and self.qty[following] < remaining:
+                position = following
+                remaining -= self.qty[following]
+            step >>= 1
+        return position
+
+
+class DepthIndex:
+    """
+    Cumulative-depth index of both sides of an OrderBook for the execution questions asked many times
+    between two updates - average fill price for a quantity, quantity resting before a price and the price
+    a quantity reaches - in O(log n) instead of a walk over the price list.
+    It follows the book through an OrderBook level listener: a touched level is a Fenwick point update.
+    A side is rebuilt from the book (O(levels + slots)) only when its best price moves past the headroom
+    kept above it, a level lands past the end of the grid or a price off the inferred tick arrives;
+    levels more than max_slots ticks from the grid's origin aren't indexed.
+    """
+    def __init__(self, order_book: OrderBook, max_slots: int = 1 << 20):
+        self.order_book = order_book
+        self.sides = {'bids': _SideIndex(True, max_slots), 'asks': _SideIndex(False, max_slots)}
+        self.sides['bids'].rebuild(order_book.ob_bids)
+        self.sides['asks'].rebuild(order_book.ob_asks)
+        order_book.add_level_listener(self._on_update)
+
+    def close(self) -> None:
+        self.order_book.remove_level_listener(self._on_update)
+
+    @property
+    def rebuilds(self) -> int:
+        return sum(side.rebuilds for side in self.sides.values())
+
+    def _on_update(self, order_book: OrderBook, bid_changes: list, ask_changes: list) -> None:
+        for name, changes, levels in (('bids', bid_changes, order_book.ob_bids), ('asks', ask_changes, order_book.ob_asks)):
+            side = self.sides[name]
+            for price, old_qty, new_qty in changes:
+                if not side.update(price, old_qty, new_qty):
+                    # The book already holds the new state of every level, rebuild from it
+                    side.rebuild(levels)
+                    break
+
+    def vwap(self, side: str, quantity: float) -> Fill:
+        """
+        Args:
+            side (str): 'asks' to buy, 'bids' to sell
+            quantity (float): quantity to fill
+        Returns:
+            Fill - filled quantity (less than asked if the side is too thin), its average and worst price
+        """
+        filled, notional, worst = self.sides[side].fill(round(quantity * QTY_SCALE))
+        if not filled:
+            return Fill(0.0, None, None)
+        return Fill(filled / QTY_SCALE, notional / filled / PRICE_SCALE, worst / PRICE_SCALE)
+
+    def price_for_quantity(self, side: str, quantity: float) -> float | None:
+        """
+        Returns:
+            float - worst price reached when filling quantity from the side, None if the side is too thin
+        """
+        qty_units = round(quantity * QTY_SCALE)
+        if qty_units <= 0:
+            return None
+        filled, _, worst = self.sides[side].fill(qty_units)
+        if filled < qty_units:
+            return None
+        return worst / PRICE_SCALE
+
+    def quantity_to_price(self, side: str, price: float) -> float:
+        """
+        Returns:
+            float - quantity resting at prices at or better than price (bids >= price, asks <= price)
+        """
+        index = self.sides[side]
+        if index.tick is None:
+            return 0.0
+        slot = index._slot(round(price * PRICE_SCALE))
+        if slot < 0:
+            return 0.0
+        qty, _ = index.prefix(slot + 1)
+        return qty / QTY_SCALE
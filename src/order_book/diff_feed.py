@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Changed levels of one or more consecutive depth updates: {price: qty}, qty 0 removes the level.
+# Applying it to a book at first_update_id - 1 gives the book at final_update_id.
+BookDiff = namedtuple('BookDiff', ['first_update_id', 'final_update_id', 'bids', 'asks'])
+# Full book sent instead of diffs when a subscriber has to start over: {price: qty} per side
+BookSnapshot = namedtuple('BookSnapshot', ['last_update_id', 'bids', 'asks'])
+
+
+def _parse_side(levels) -> dict[float, float]:
+    return {float(price): float(qty) for price, qty in levels}
+
+
+class DiffSubscriber:
+    """
+    Bounded queue of one subscriber. The producer never waits for it:
+    - up to max_pending diffs are queued as they are;
+    - when the queue is full, all pending diffs are conflated into one (per price level the latest
+      quantity wins), so memory grows with the number of changed levels, not with the number of updates;
+    - when even the conflated diff touches more than max_conflated_levels levels, the subscriber is too far
+      behind: its diffs are dropped and its next item is a BookSnapshot, followed by diffs from there on.
+    A subscriber created with with_snapshot=False skips the initial snapshot and only gets the diffs published
+    from then on, e.g. to watch which levels change for a while; it still gets a snapshot after a reset.
+    """
+    def __init__(self, feed: 'DiffFeed', max_pending: int = 1000, max_conflated_levels: int = 10000,
+                 with_snapshot: bool = True):
+        self.feed = feed
+        self.max_pending = max_pending
+        self.max_conflated_levels = max_conflated_levels
+        self.pending: deque[BookDiff] = deque()
+        self.needs_snapshot = with_snapshot
+        self.delivered = 0
+        self.conflations = 0
+        self.resets = 0
+        # True while pending[0] is a conflated diff whose dicts belong to this subscriber (updated in place)
+        self._owns_head = False
+        self._ready = asyncio.Event()
+
+    def offer(self, diff: BookDiff) -> None:
+        if self.needs_snapshot:
+            # The snapshot taken when the subscriber reads next already contains this diff
+            return
+        pending = self.pending
+        pending.append(diff)
+        if len(pending) > self.max_pending:
+            conflated = self._conflate()
+            if len(conflated.bids) + len(conflated.asks) > self.max_conflated_levels:
+                self.reset()
+                return
+            pending.clear()
+            pending.append(conflated)
+            self.conflations += 1
+        self._ready.set()
+
+    def _conflate(self) -> BookDiff:
+        pending = self.pending
+        if self._owns_head:
+            # Merge into the previous conflated diff instead of copying its (possibly many) levels again
+            head = pending.popleft()
+            bids, asks = head.bids, head.asks
+        else:
+            head = pending[0]
+            bids, asks = {}, {}
+        for diff in pending:
+            bids.update(diff.bids)
+            asks.update(diff.asks)
+        self._owns_head = True
+        return BookDiff(head.first_update_id, pending[-1].final_update_id, bids, asks)
+
+    def reset(self) -> None:
+        """
+        Drops the pending diffs, the next item will be a snapshot
+        """
+        self.pending.clear()
+        self._owns_head = False
+        if not self.needs_snapshot:
+            self.resets += 1
+        self.needs_snapshot = True
+        self._ready.set()
+
+    def get_nowait(self) -> BookDiff | BookSnapshot | None:
+        """
+        Returns:
+            BookSnapshot when (re)starting, otherwise the next BookDiff, or None when nothing is pending
+        """
+        if self.needs_snapshot:
+            snapshot = self.feed.take_snapshot()
+            if snapshot is None:
+                return None
+            self.needs_snapshot = False
+            self.delivered += 1
+            return snapshot
+        if not self.pending:
+            self._ready.clear()
+            return None
+        self.delivered += 1
+        self._owns_head = False
+        return self.pending.popleft()
+
+    async def get(self) -> BookDiff | BookSnapshot:
+        while True:
+            item = self.get_nowait()
+            if item is not None:
+                return item
+            await self._ready.wait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> BookDiff | BookSnapshot:
+        return await self.get()
+
+    def snapshot(self) -> dict:
+        return {'pending': len(self.pending),
+                'delivered': self.delivered,
+                'conflations': self.conflations,
+                'resets': self.resets}
+
+
+class DiffFeed:
+    """
+    Publish/subscribe layer fed by ws_processing: every applied depth update is turned into one BookDiff
+    (parsed once, shared by all subscribers) and offered to every subscriber's bounded queue.
+    When the stream isn't continuous for the subscribers (the book was resynced and replaced, or update IDs
+    jump), every subscriber starts over from a snapshot.
+    """
+    def __init__(self, snapshot_depth: int = None):
+        # Levels per side in the snapshots, None for the whole book
+        self.snapshot_depth = snapshot_depth
+        self.subscribers: list[DiffSubscriber] = []
+        self.order_book = None
+        self.last_final_update_id = None
+        self.published = 0
+
+    def subscribe(self, max_pending: int = 1000, max_conflated_levels: int = 10000,
+                  with_snapshot: bool = True) -> DiffSubscriber:
+        subscriber = DiffSubscriber(self, max_pending, max_conflated_levels, with_snapshot)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: DiffSubscriber) -> None:
+        self.subscribers.remove(subscriber)
+
+    def publish(self, message: dict, order_book) -> None:
+        """
+        Called by ws_processing after the depth update message was applied to order_book
+        Args:
+            message (dict): the applied depth update
+            order_book (OrderBook): the book it was applied to
+        """
+        previous_book, previous_final_update_id = self.order_book, self.last_final_update_id
+        self.order_book, self.last_final_update_id = order_book, message['u']
+        if not self.subscribers:
+            return
+        if order_book is not previous_book or message['U'] != previous_final_update_id + 1:
+            # The subscribers' view can't be continued with this diff
+            for subscriber in self.subscribers:
+                subscriber.reset()
+            return
+        diff = BookDiff(message['U'], message['u'], _parse_side(message.get('b', ())), _parse_side(message.get('a', ())))
+        self.published += 1
+        for subscriber in self.subscribers:
+            subscriber.offer(diff)
+
+    def take_snapshot(self) -> BookSnapshot | None:
+        """
+        Returns:
+            BookSnapshot of the current book, None before the first published update
+        """
+        order_book = self.order_book
+        if order_book is None:
+            return None
+        depth = self.snapshot_depth
+        if depth is None:
+            bids, asks = dict(order_book.ob_bids), dict(order_book.ob_asks)
+        else:
+            bids = {price: order_book.ob_bids[price] for price in order_book.ob_bids_prices[:-depth - 1:-1]}
+            asks = {price: order_book.ob_asks[price] for price in order_book.ob_asks_prices[:depth]}
+        return BookSnapshot(self.last_final_update_id, bids, asks)
+
+    def snapshot(self) -> dict:
+        return {'published': self.published,
+                'subscribers': [subscriber.snapshot() for subscriber in self.subscribers]}
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from collections import namedtuple
+import aiohttp
+from order_book.book_diff import diff_order_books
+from order_book.order_book_class import OrderBook
+from wb_sockets.syncing import REQUEST_WEIGHT_LIMIT, depth_request_weight, request_depth_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Result of one audit. drift_levels - levels that differ between the REST snapshot and the local book at the
+# same update ID, excluded_levels - levels skipped because the stream changed them after the snapshot
+DriftReport = namedtuple('DriftReport', ['symbol', 'last_update_id', 'local_update_id', 'drift_levels',
+                                         'excluded_levels', 'compared_levels', 'difference'])
+
+
+class BookDriftException(Exception):
+    """Raised when the drift auditor found the local book too far from the REST snapshot and asked for a resync"""
+
+
+class DriftAuditor:
+    """
+    Low-priority background check that the local books still match Binance.
+    Every audit fetches a REST snapshot of one symbol and compares it with the local book without pausing
+    ws_processing:
+    - a diff subscription (without the initial snapshot) is opened before the request, so every level the stream
+      changes while the request is in flight is known;
+    - once the local book has applied the snapshot's lastUpdateId, the two books are compared over the snapshot's
+      depth, skipping the levels changed by updates after lastUpdateId - what remains is the book at the same
+      update ID on both sides. The comparison is synchronous, so no update is applied in the middle of it;
+    - a symbol with at least drift_threshold differing levels is reported through on_drift (e.g. to resync it).
+    Symbols are audited round robin. The pause between audits keeps the snapshot requests within weight_budget
+    (a fraction of the IP weight limit per minute) and grows when Binance reports a high used weight or answers 429.
+    """
+    def __init__(self, books: dict, session: aiohttp.ClientSession = None, limit: int = 20,
+                 min_interval: float = 1, max_interval: float = 300, weight_budget: float = 0.05,
+                 high_water: float = 0.5, drift_threshold: int = 1, align_timeout: float = 5, on_drift = None):
+        """
+        Args:
+            books (dict): symbol -> state with order_book, feed (DiffFeed) and is_live, e.g. BookManager.books
+            session (aiohttp.ClientSession, optional): pooled REST session, created in run() if not given
+            limit (int): levels per side of the audit snapshots, also the compared depth
+            min_interval, max_interval (float): bounds of the pause between two audits, seconds
+            weight_budget (float): share of REQUEST_WEIGHT_LIMIT the audits may use
+            high_water (float): share of REQUEST_WEIGHT_LIMIT used by the IP above which the audits slow down
+            drift_threshold (int): differing levels that make a symbol drifted
+            align_timeout (float): how long to wait for the local book to reach the snapshot's lastUpdateId
+            on_drift (callable, optional): on_drift(symbol, report) for every drifted symbol
+        """
+        self.books = books
+        self.session = session
+        self.limit = limit
+        self.request_weight = depth_request_weight(limit)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.weight_budget = weight_budget
+        self.high_water = high_water
+        self.drift_threshold = drift_threshold
+        self.align_timeout = align_timeout
+        self.on_drift = on_drift
+
+        self.audits = 0
+        self.drifted = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_used_weight = None
+        self.last_reports: dict[str, DriftReport] = {}
+        # Multiplier of the budget interval, doubled while Binance reports a high used weight
+        self._slowdown = 1
+        self._stopping = False
+
+    @property
+    def interval(self) -> float:
+        """
+        Pause between two audits: the time the budget needs to pay for one request, times the current slowdown
+        """
+        budget_interval = 60 * self.request_weight / (self.weight_budget * REQUEST_WEIGHT_LIMIT)
+        return min(max(budget_interval * self._slowdown, self.min_interval), self.max_interval)
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    def snapshot(self) -> dict:
+        return {'audits': self.audits,
+                'drifted': self.drifted,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'interval_s': self.interval,
+                'last_used_weight': self.last_used_weight,
+                'drift_levels': {symbol: report.drift_levels for symbol, report in self.last_reports.items()}}
+
+    def _adapt(self, used_weight: int | None) -> None:
+        self.last_used_weight = used_weight
+        if used_weight is None:
+            return
+        if used_weight > self.high_water * REQUEST_WEIGHT_LIMIT:
+            self._slowdown = min(self._slowdown * 2, self.max_interval)
+        else:
+            self._slowdown = max(self._slowdown / 2, 1)
+
+    async def _wait_for_update_id(self, order_book: OrderBook, last_update_id: int) -> bool:
+        deadline = time.monotonic() + self.align_timeout
+        while order_book.last_update_id is None or order_book.last_update_id < last_update_id:
+            if time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    async def audit(self, symbol: str, order_book: OrderBook, feed) -> DriftReport | None:
+        """
+        Compares the order book with a REST snapshot at the same update ID
+        Args:
+            symbol (str): trading pair of the book
+            order_book (OrderBook): the live book, kept up to date by ws_processing
+            feed (DiffFeed): the feed ws_processing publishes the book's updates to
+        Returns:
+            DriftReport, or None when the audit couldn't be aligned (the book was resynced meanwhile,
+            it lags behind the snapshot for more than align_timeout, or the snapshot is older than the book)
+        """
+        subscriber = feed.subscribe(max_conflated_levels = float('inf'), with_snapshot = False)
+        try:
+            local_update_id = order_book.last_update_id
+            content, used_weight = await request_depth_snapshot(self.session, symbol, self.limit)
+            self._adapt(used_weight)
+            snapshot_book = OrderBook(content)
+            await snapshot_book.extract_order_book_prices()
+            last_update_id = snapshot_book.last_update_id
+
+            if local_update_id is None or local_update_id > last_update_id:
+                logger.debug('%s audit skipped: snapshot lastUpdateId=%s is older than the book (%s)',
+                             symbol, last_update_id, local_update_id)
+                return None
+            if not await self._wait_for_update_id(order_book, last_update_id):
+                logger.info('%s audit skipped: the book didn\'t reach lastUpdateId=%s', symbol, last_update_id)
+                return None
+            if subscriber.resets or feed.order_book is not order_book:
+                return None
+
+            # From here on nothing is awaited, so the book doesn't change under the comparison
+            touched_bids, touched_asks = set(), set()
+            for diff in subscriber.pending:
+                if diff.final_update_id > last_update_id:
+                    touched_bids.update(diff.bids)
+                    touched_asks.update(diff.asks)
+            difference = diff_order_books(snapshot_book, order_book, self.limit)
+            drift_levels, excluded_levels, compared_levels = 0, 0, 0
+            for side, touched in ((difference.bids, touched_bids), (difference.asks, touched_asks)):
+                compared_levels += side.unchanged
+                for level in (*side.added, *side.removed, *side.changed):
+                    compared_levels += 1
+                    if level[0] in touched:
+                        excluded_levels += 1
+                    else:
+                        drift_levels += 1
+            return DriftReport(symbol, last_update_id, order_book.last_update_id, drift_levels,
+                               excluded_levels, compared_levels, difference)
+        finally:
+            feed.unsubscribe(subscriber)
+
+    async def _audit_next(self, symbol: str) -> None:
+        book = self.books.get(symbol)
+        if book is None:
+            # Removed from the manager since the round started
+            return
+        # Partial-book symbols are replaced by every payload, they can't drift
+        if not book.is_live or book.order_book is None or getattr(book, 'partial_levels', 0):
+            return
+        try:
+            report = await self.audit(symbol, book.order_book, book.feed)
+        except aiohttp.ClientResponseError as e:
+            self.errors += 1
+            if e.status in (418, 429):
+                # Rate limited: back off as far as allowed, the limit is shared with the resyncs
+                self._slowdown = self.max_interval
+            logger.warning('%s audit failed: %s', symbol, e)
+            return
+        except aiohttp.ClientError as e:
+            self.errors += 1
+            logger.warning('%s audit failed: %s', symbol, e)
+            return
+        if report is None:
+            self.skipped += 1
+            return
+        self.audits += 1
+        self.last_reports[symbol] = report
+        if report.drift_levels >= self.drift_threshold:
+            self.drifted += 1
+            logger.warning('%s drifted from the REST snapshot: %d levels differ at lastUpdateId=%s (%d excluded)',
+                           symbol, report.drift_levels, report.last_update_id, report.excluded_levels)
+            if self.on_drift is not None:
+                self.on_drift(symbol, report)
+        else:
+            logger.debug('%s matches the REST snapshot at lastUpdateId=%s', symbol, report.last_update_id)
+
+    async def run(self) -> None:
+        """
+        Infinite function (until stop() is called) auditing the symbols one after another
+        """
+        own_session = self.session is None
+        if own_session:
+            self.session = aiohttp.ClientSession()
+        try:
+            while not self._stopping:
+                for symbol in list(self.books):
+                    if self._stopping:
+                        break
+                    await asyncio.sleep(self.interval)
+                    await self._audit_next(symbol)
+        finally:
+            if own_session:
+                await self.session.close()
+                self.session = None
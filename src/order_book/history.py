@@ -0,0 +1,215 @@
+import bisect
+import logging
+from array import array
+from order_book.order_book_class import OrderBook
+
+logger = logging.getLogger(__name__)
+
+
+class _Checkpoint:
+    """
+    Full state of a book at one update id, as sorted price and quantity columns per side
+    (16 bytes a level instead of a dict entry with two float objects)
+    """
+    __slots__ = ('update_id', 'bid_prices', 'bid_qtys', 'ask_prices', 'ask_qtys')
+
+    def __init__(self, order_book: OrderBook):
+        self.update_id = order_book.last_update_id
+        self.bid_prices = array('d', order_book.ob_bids_prices)
+        self.bid_qtys = array('d', (order_book.ob_bids[price] for price in order_book.ob_bids_prices))
+        self.ask_prices = array('d', order_book.ob_asks_prices)
+        self.ask_qtys = array('d', (order_book.ob_asks[price] for price in order_book.ob_asks_prices))
+
+    def restore(self) -> OrderBook:
+        order_book = OrderBook({'lastUpdateId': self.update_id})
+        order_book.ob_bids = dict(zip(self.bid_prices, self.bid_qtys))
+        order_book.ob_asks = dict(zip(self.ask_prices, self.ask_qtys))
+        order_book.ob_bids_prices = list(self.bid_prices)
+        order_book.ob_asks_prices = list(self.ask_prices)
+        return order_book
+
+
+class _Segment:
+    """
+    A checkpoint and the updates applied after it until the next checkpoint:
+    update_ids[i] is the 'u' of the i-th update, changes[i] its touched levels ((price, new qty) per side).
+    resynced: the checkpoint is a new snapshot, not the state the previous segment's updates lead to
+    """
+    __slots__ = ('checkpoint', 'resynced', 'update_ids', 'changes')
+
+    def __init__(self, checkpoint: _Checkpoint, resynced: bool):
+        self.checkpoint = checkpoint
+        self.resynced = resynced
+        self.update_ids: list[int] = []
+        self.changes: list[tuple[tuple, tuple]] = []
+
+
+def _apply_changes(levels: dict[float, float], prices: list[float], changes: tuple) -> None:
+    for price, qty in changes:
+        if qty == 0:
+            if levels.pop(price, None) is not None:
+                prices.pop(bisect.bisect_left(prices, price))
+        else:
+            if price not in levels:
+                bisect.insort(prices, price)
+            levels[price] = qty
+
+
+class BookHistory:
+    """
+    Point-in-time history of one symbol's book for post-trade analysis and backtests: "the book as of update id X"
+    without replaying the day. It follows the live book through an OrderBook level listener and records
+    - a compact checkpoint of the whole book every checkpoint_every updates,
+    - between checkpoints, the levels every update touched, indexed by its update id.
+    book_at(X) binary-searches the last checkpoint at or below X and applies only the updates after it,
+    so a query costs one checkpoint restore plus at most checkpoint_every updates however long the history is.
+    After a resync attach() the new book: its snapshot becomes a checkpoint and replaces the history after it.
+    """
+    def __init__(self, checkpoint_every: int = 1000, max_checkpoints: int = None):
+        """
+        Args:
+            checkpoint_every (int): updates between two checkpoints, bounds the query latency
+            max_checkpoints (int, optional): checkpoints kept, the oldest segment is dropped beyond it; unbounded if not given
+        """
+        self.checkpoint_every = checkpoint_every
+        self.max_checkpoints = max_checkpoints
+        self.order_book: OrderBook | None = None
+        self.segments: list[_Segment] = []
+        # update_id of every segment's checkpoint, ASC
+        self._checkpoint_ids: list[int] = []
+        self._since_checkpoint = 0
+
+    # Recording
+
+    def attach(self, order_book: OrderBook) -> None:
+        """
+        Starts recording a (newly synced) book from its current state
+        """
+        self.detach()
+        self.order_book = order_book
+        self._start_segment(resynced = bool(self.segments))
+        order_book.add_level_listener(self._on_update)
+
+    def detach(self) -> None:
+        if self.order_book is not None:
+            self.order_book.remove_level_listener(self._on_update)
+            self.order_book = None
+
+    def checkpoint(self) -> None:
+        """
+        Records the full state of the attached book and starts a new segment
+        """
+        self._start_segment(resynced = False)
+
+    def _start_segment(self, resynced: bool) -> None:
+        checkpoint = _Checkpoint(self.order_book)
+        if checkpoint.update_id is None:
+            raise ValueError('The book has no update id to checkpoint at')
+        if resynced:
+            # The new snapshot may be at or before updates recorded from the previous book: the snapshot wins
+            while self._checkpoint_ids and self._checkpoint_ids[-1] >= checkpoint.update_id:
+                self._checkpoint_ids.pop()
+                self.segments.pop()
+            if self.segments:
+                last = self.segments[-1]
+                cut = bisect.bisect_left(last.update_ids, checkpoint.update_id)
+                del last.update_ids[cut:], last.changes[cut:]
+        self.segments.append(_Segment(checkpoint, resynced))
+        self._checkpoint_ids.append(checkpoint.update_id)
+        self._since_checkpoint = 0
+        if self.max_checkpoints and len(self.segments) > self.max_checkpoints:
+            del self.segments[0], self._checkpoint_ids[0]
+
+    def _on_update(self, order_book: OrderBook, bid_changes: list, ask_changes: list) -> None:
+        segment = self.segments[-1]
+        segment.update_ids.append(order_book.last_update_id)
+        segment.changes.append((tuple((price, new_qty) for price, _, new_qty in bid_changes),
+                                tuple((price, new_qty) for price, _, new_qty in ask_changes)))
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self._start_segment(resynced = False)
+
+    # Querying
+
+    @property
+    def first_update_id(self) -> int | None:
+        return self._checkpoint_ids[0] if self._checkpoint_ids else None
+
+    @property
+    def last_update_id(self) -> int | None:
+        if not self.segments:
+            return None
+        last = self.segments[-1]
+        return last.update_ids[-1] if last.update_ids else last.checkpoint.update_id
+
+    def _locate(self, update_id: int) -> tuple[int, int]:
+        # Segment holding the state as of update_id, and how many of its updates lead to it
+        if not self.segments or not self.first_update_id <= update_id <= self.last_update_id:
+            raise KeyError(f'Update id {update_id} is outside the recorded history '
+                           f'({self.first_update_id} - {self.last_update_id})')
+        index = bisect.bisect_right(self._checkpoint_ids, update_id) - 1
+        return index, bisect.bisect_right(self.segments[index].update_ids, update_id)
+
+    def book_at(self, update_id: int) -> OrderBook:
+        """
+        Args:
+            update_id (int): any update id between first_update_id and last_update_id
+        Returns:
+            OrderBook - a new book in the state after the last update with 'u' <= update_id
+        Raises:
+            KeyError: the update id is outside the recorded history
+        """
+        index, count = self._locate(update_id)
+        segment = self.segments[index]
+        checkpoint = segment.checkpoint
+        bids = dict(zip(checkpoint.bid_prices, checkpoint.bid_qtys))
+        asks = dict(zip(checkpoint.ask_prices, checkpoint.ask_qtys))
+        # Plain dict updates, the price lists are sorted once at the end
+        for bid_changes, ask_changes in segment.changes[:count]:
+            for levels, changes in ((bids, bid_changes), (asks, ask_changes)):
+                for price, qty in changes:
+                    if qty == 0:
+                        levels.pop(price, None)
+                    else:
+                        levels[price] = qty
+        order_book = OrderBook({'lastUpdateId': segment.update_ids[count - 1] if count else checkpoint.update_id})
+        order_book.ob_bids, order_book.ob_asks = bids, asks
+        order_book.ob_bids_prices, order_book.ob_asks_prices = sorted(bids), sorted(asks)
+        return order_book
+
+    def states(self, start_id: int, end_id: int = None):
+        """
+        Streams the book through a range of updates for backtests: the state as of start_id,
+        then the state after every recorded update up to end_id (the end of the history if not given).
+        The yielded OrderBook is updated in place between two states, copy what has to be kept.
+        Yields:
+            OrderBook
+        """
+        index, count = self._locate(start_id)
+        order_book = self.book_at(start_id)
+        yield order_book
+        end_id = self.last_update_id if end_id is None else end_id
+        while index < len(self.segments):
+            segment = self.segments[index]
+            if count is None:
+                count = 0
+                if segment.checkpoint.update_id > end_id:
+                    return
+                if segment.resynced:
+                    # The checkpoint is a new snapshot, it replaces the state reached so far
+                    order_book = segment.checkpoint.restore()
+                    yield order_book
+            for update_id, (bid_changes, ask_changes) in zip(segment.update_ids[count:], segment.changes[count:]):
+                if update_id > end_id:
+                    return
+                _apply_changes(order_book.ob_bids, order_book.ob_bids_prices, bid_changes)
+                _apply_changes(order_book.ob_asks, order_book.ob_asks_prices, ask_changes)
+                order_book.last_update_id = update_id
+                yield order_book
+            index, count = index + 1, None
+
+    def snapshot(self) -> dict:
+        return {'checkpoints': len(self.segments),
+                'updates': sum(len(segment.update_ids) for segment in self.segments),
+                'first_update_id': self.first_update_id,
+                'last_update_id': self.last_update_id}
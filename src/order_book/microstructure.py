@@ -0,0 +1,230 @@
+import bisect
+import logging
+import math
+from order_book.order_book_class import OrderBook
+
+logger = logging.getLogger(__name__)
+
+# Quantities are summed as integers in units of 1e-8 (Binance sends 8 decimals), so the running sums
+# don't accumulate floating point error however many updates they go through
+QTY_SCALE = 10 ** 8
+
+
+def _units(qty: float) -> int:
+    return round(qty * QTY_SCALE)
+
+
+class _RangeSum:
+    """
+    Sum of the quantities of one side's levels at or better than a threshold price:
+    bids at prices >= threshold, asks at prices <= threshold.
+    Touched levels change the sum by their delta; moving the threshold adds or subtracts only the levels it crosses.
+    """
+    __slots__ = ('is_bid', 'threshold', 'total')
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.threshold = math.inf if is_bid else -math.inf
+        self.total = 0
+
+    def apply(self, deltas: list[tuple[float, int]]) -> None:
+        # deltas: (price, new - old quantity in QTY_SCALE units) of the touched levels
+        threshold = self.threshold
+        if self.is_bid:
+            self.total += sum(delta for price, delta in deltas if price >= threshold)
+        else:
+            self.total += sum(delta for price, delta in deltas if price <= threshold)
+
+    def _slice(self, prices: list[float], lower: float, upper: float) -> tuple[int, int]:
+        # Index range of the prices between two thresholds, on the side each threshold includes
+        if self.is_bid:
+            return bisect.bisect_left(prices, lower), bisect.bisect_left(prices, upper)
+        return bisect.bisect_right(prices, lower), bisect.bisect_right(prices, upper)
+
+    def move(self, threshold: float, prices: list[float], levels: dict[float, float]) -> None:
+        old = self.threshold
+        if threshold == old:
+            return
+        self.threshold = threshold
+        # Bids gain levels when the threshold goes down, asks when it goes up
+        gains = threshold < old if self.is_bid else threshold > old
+        start, end = self._slice(prices, min(threshold, old), max(threshold, old))
+        crossed = sum(_units(levels[prices[index]]) for index in range(start, end))
+        self.total += crossed if gains else -crossed
+
+    def recompute(self, prices: list[float], levels: dict[float, float]) -> int:
+        if self.is_bid:
+            start, end = bisect.bisect_left(prices, self.threshold), len(prices)
+        else:
+            start, end = 0, bisect.bisect_right(prices, self.threshold)
+        return sum(_units(levels[prices[index]]) for index in range(start, end))
+
+
+class MicrostructureMetrics:
+    """
+    Spread, mid, microprice, top-N imbalance and depth within X bps of the mid of one OrderBook, kept up to date
+    from the levels every update touches (OrderBook level listener) instead of being rebuilt from the whole book:
+    - the top-N and band depths are running sums over a threshold price (the N-th best level, mid -/+ X bps);
+      a touched level changes them by its quantity delta, a moved threshold by the few levels it crosses;
+    - every value is a plain attribute or an O(1) property, readable at any time;
+    - the sums are integers (QTY_SCALE), so they stay exact, and every reconcile_every updates they are
+      compared with a full recompute anyway - a mismatch is logged, counted and corrected.
+    """
+    def __init__(self, order_book: OrderBook, top_n: int = 10, band_bps: tuple = (10, 50), reconcile_every: int = 10000):
+        self.order_book = order_book
+        self.top_n = top_n
+        self.band_bps = tuple(band_bps)
+        self.reconcile_every = reconcile_every
+        self.best_bid = self.best_ask = None
+        self.best_bid_qty = self.best_ask_qty = None
+        self.updates = 0
+        self.reconciliations = 0
+        self.mismatches = 0
+        self._top = (_RangeSum(True), _RangeSum(False))
+        self._bands = {bps: (_RangeSum(True), _RangeSum(False)) for bps in self.band_bps}
+        self._recompute()
+        order_book.add_level_listener(self._on_update)
+
+    def close(self) -> None:
+        self.order_book.remove_level_listener(self._on_update)
+
+    # Values
+
+    @property
+    def spread(self) -> float | None:
+        if self.best_bid is None or self.best_ask is None:
+            return None
+        return self.best_ask - self.best_bid
+
+    @property
+    def mid(self) -> float | None:
+        if self.best_bid is None or self.best_ask is None:
+            return None
+        return (self.best_bid + self.best_ask) / 2
+
+    @property
+    def microprice(self) -> float | None:
+        # Mid weighted towards the side with less quantity at the touch, i.e. where the price is more likely to go
+        if self.best_bid is None or self.best_ask is None:
+            return None
+        total = self.best_bid_qty + self.best_ask_qty
+        return (self.best_bid * self.best_ask_qty + self.best_ask * self.best_bid_qty) / total
+
+    @property
+    def imbalance(self) -> float | None:
+        """
+        (bid qty - ask qty) / (bid qty + ask qty) over the top_n levels of each side, from -1 to 1
+        """
+        bids, asks = self._top[0].total, self._top[1].total
+        if bids + asks == 0:
+            return None
+        return (bids - asks) / (bids + asks)
+
+    def top_depth(self) -> tuple[float, float]:
+        """
+        Returns:
+            tuple - bid and ask quantity over the top_n levels of each side
+        """
+        return self._top[0].total / QTY_SCALE, self._top[1].total / QTY_SCALE
+
+    def depth_within(self, bps: float) -> tuple[float, float]:
+        """
+        Returns:
+            tuple - bid quantity at prices >= mid - mid * bps / 10000 and ask quantity at prices <= mid + mid * bps / 10000,
+            for one of the band_bps the metrics were created with
+        """
+        bids, asks = self._bands[bps]
+        return bids.total / QTY_SCALE, asks.total / QTY_SCALE
+
+    def snapshot(self) -> dict:
+        return {'best_bid': self.best_bid,
+                'best_ask': self.best_ask,
+                'spread': self.spread,
+                'mid': self.mid,
+                'microprice': self.microprice,
+                'imbalance': self.imbalance,
+                'top_depth': self.top_depth(),
+                'depth_within_bps': {bps: self.depth_within(bps) for bps in self.band_bps},
+                'updates': self.updates,
+                'reconciliations': self.reconciliations,
+                'mismatches': self.mismatches}
+
+    # Maintenance
+
+    def _thresholds(self) -> tuple:
+        # Top-N thresholds (the N-th best price, every level if the side is shorter) and band thresholds per bps
+        book = self.order_book
+        bid_prices, ask_prices = book.ob_bids_prices, book.ob_asks_prices
+        top = (bid_prices[-self.top_n] if len(bid_prices) >= self.top_n else -math.inf,
+               ask_prices[self.top_n - 1] if len(ask_prices) >= self.top_n else math.inf)
+        mid = self.mid
+        if mid is None:
+            bands = {bps: (math.inf, -math.inf) for bps in self.band_bps}
+        else:
+            bands = {bps: (mid - mid * bps / 10000, mid + mid * bps / 10000) for bps in self.band_bps}
+        return top, bands
+
+    def _read_touch(self) -> None:
+        book = self.order_book
+        if book.ob_bids_prices:
+            self.best_bid = book.ob_bids_prices[-1]
+            self.best_bid_qty = book.ob_bids[self.best_bid]
+        else:
+            self.best_bid = self.best_bid_qty = None
+        if book.ob_asks_prices:
+            self.best_ask = book.ob_asks_prices[0]
+            self.best_ask_qty = book.ob_asks[self.best_ask]
+        else:
+            self.best_ask = self.best_ask_qty = None
+
+    def _range_sums(self):
+        yield from self._top
+        for sums in self._bands.values():
+            yield from sums
+
+    def _with_thresholds(self):
+        # (range sum, its new threshold, prices and levels of its side) for every running sum
+        book = self.order_book
+        top, bands = self._thresholds()
+        thresholds = [*top, *(threshold for bps in self.band_bps for threshold in bands[bps])]
+        for range_sum, threshold in zip(self._range_sums(), thresholds):
+            if range_sum.is_bid:
+                yield range_sum, threshold, book.ob_bids_prices, book.ob_bids
+            else:
+                yield range_sum, threshold, book.ob_asks_prices, book.ob_asks
+
+    def _on_update(self, order_book: OrderBook, bid_changes: list, ask_changes: list) -> None:
+        bid_deltas = [(price, _units(new_qty) - _units(old_qty)) for price, old_qty, new_qty in bid_changes]
+        ask_deltas = [(price, _units(new_qty) - _units(old_qty)) for price, old_qty, new_qty in ask_changes]
+        for range_sum in self._range_sums():
+            range_sum.apply(bid_deltas if range_sum.is_bid else ask_deltas)
+        self._read_touch()
+        for range_sum, threshold, prices, levels in self._with_thresholds():
+            range_sum.move(threshold, prices, levels)
+        self.updates += 1
+        if self.reconcile_every and self.updates % self.reconcile_every == 0:
+            self.reconcile()
+
+    def _recompute(self) -> bool:
+        self._read_touch()
+        matched = True
+        for range_sum, threshold, prices, levels in self._with_thresholds():
+            matched &= range_sum.threshold == threshold
+            range_sum.threshold = threshold
+            total = range_sum.recompute(prices, levels)
+            matched &= range_sum.total == total
+            range_sum.total = total
+        return matched
+
+    def reconcile(self) -> bool:
+        """
+        Recomputes every sum from the whole book and replaces the running values
+        Returns:
+            bool - True if the running values matched the recompute
+        """
+        matched = self._recompute()
+        self.reconciliations += 1
+        if not matched:
+            self.mismatches += 1
+            logger.warning('Microstructure metrics drifted from the book after %d updates, corrected', self.updates)
+        return matched
@@ -1,39 +1,64 @@
 import asyncio
+import logging
 from collections import deque
-from wb_sockets import ws_ingestion, fetch_order_book_snapshot, find_matching_message, ws_processing
+from wb_sockets import ws_ingestion, ws_redundant_ingestion, fetch_order_book_snapshot, find_matching_message, ws_processing
 from order_book.order_book_production import create_and_save_local_order_book
 from order_book.order_book_class import OrderBook
+from utils.profiling import install_order_book_profiling
+from wb_sockets.threaded_processing import SpscRing, ws_threaded_processing
 
+logger = logging.getLogger(__name__)
 
-async def orchestrator(websocket):
-    buffer = deque([])
+
+async def orchestrator(websocket, metrics = None, profiler = None, session = None, prefetched_snapshot = None,
+                       threaded = False):
+    # websocket can also be a list of connections to the same stream: the redundant ingestion
+    # then merges them and keeps the first copy of every update
+    # profiler (StageProfiler, optional) - when profiling is switched on, every stage is wrapped
+    # so its CPU time and call count are collected; when it's None nothing is wrapped
+    # session (aiohttp.ClientSession, optional) - pooled session for the REST snapshot requests
+    # prefetched_snapshot (asyncio.Future, optional) - snapshot request started while connecting
+    # threaded - parse and apply the updates on a dedicated thread fed through an SpscRing, so bursts of
+    # heavy updates don't delay the socket reads, see wb_sockets/threaded_processing.py
+    buffer = SpscRing() if threaded else deque([])
     ws_ingestion_task = None
     ws_processing_task = None
     order_book = None
 
-    ws_ingestion_task = asyncio.create_task(ws_ingestion(websocket, buffer))
+    def _stage(name, coro):
+        return profiler.wrap_coroutine(name, coro) if profiler is not None else coro
+
+    if profiler is not None:
+        install_order_book_profiling(profiler, OrderBook)
+
+    if isinstance(websocket, (list, tuple)):
+        ingestion = ws_redundant_ingestion(websocket, buffer, metrics)
+    else:
+        ingestion = ws_ingestion(websocket, buffer, metrics)
+    ws_ingestion_task = asyncio.create_task(_stage('ws_ingestion', ingestion))
 
     try:
-        snapshot, order_book_last_update_id = await asyncio.wait_for(fetch_order_book_snapshot(buffer), timeout=5)
-        print('Suitable order book fetched, saving it now....')
+        snapshot, order_book_last_update_id = await asyncio.wait_for(_stage('sync', fetch_order_book_snapshot(buffer, session, prefetched_snapshot)), timeout=5)
+        logger.info('Suitable order book fetched, saving it now....')
 
     except asyncio.TimeoutError:
-        print('No suitable order book fetched, can\'t proceed')
-        ws_ingestion.cancel()
+        logger.error('No suitable order book fetched, can\'t proceed')
+        ws_ingestion_task.cancel()
         await asyncio.gather(ws_ingestion_task, return_exceptions=True)
         raise  
 
     try:
-        matching_message = await asyncio.wait_for(find_matching_message(order_book_last_update_id, buffer), timeout = 5)  
-        print(f'Order book snapshot is fetched. Matching message is found {matching_message}. Starting processing') 
+        matching_message = await asyncio.wait_for(_stage('sync', find_matching_message(order_book_last_update_id, buffer)), timeout = 5)  
+        logger.info('Order book snapshot is fetched. Matching message U=%s u=%s is found. Starting processing', matching_message['U'], matching_message['u'])
     except asyncio.TimeoutError:
-        print('No suitable Websocket stream message fetched, can\'t proceed')
-        ws_ingestion.cancel()
+        logger.error('No suitable Websocket stream message fetched, can\'t proceed')
+        ws_ingestion_task.cancel()
         await asyncio.gather(ws_ingestion_task, return_exceptions=True)
         raise 
 
     order_book = await create_and_save_local_order_book(snapshot, order_book_last_update_id)
 
-    ws_processing_task = asyncio.create_task(ws_processing(order_book, buffer))
+    processing = ws_threaded_processing if threaded else ws_processing
+    ws_processing_task = asyncio.create_task(_stage('ws_processing', processing(order_book, buffer, metrics)))
     return ws_ingestion_task, ws_processing_task, order_book
-    
\ No newline at end of file
+    
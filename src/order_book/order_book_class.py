@@ -1,14 +1,24 @@
 import bisect
 import logging
+import time
 from collections import namedtuple
+from order_book.book_diff import diff_order_books
+from order_book.cow_ladder import CHUNK_SIZE, CowLadders, FrozenBook
 
 logger = logging.getLogger(__name__)
 
 PriceChange = namedtuple('PriceChange', ['prices_to_add_or_update', 'prices_to_remove'])
+# Consistent copy of the top levels, see OrderBook.top_levels: bids / asks as lists of (price, qty), best first
+BookView = namedtuple('BookView', ['version', 'last_update_id', 'bids', 'asks'])
+# Attempts of a reader before it gives up, see OrderBook.read
+MAX_READ_RETRIES = 100000
 
 class EmptyOrderBookException(Exception):
     """Raised when the order book snapshot has no asks or bids values"""   
 
+class InconsistentReadException(Exception):
+    """Raised when a reader couldn't get a consistent copy because the writer kept updating the book (or its shared segment)"""
+
 class OrderBook:
     def __init__(self, content:dict = None):
         self.content = content
@@ -16,6 +26,19 @@ class OrderBook:
         self.ob_asks: dict[float, float] = {} 
         self.ob_bids_prices: list[float] = [] # always sorted ASC
         self.ob_asks_prices: list[float] = [] # always sorted ASC
+        # Update ID the book reflects: the snapshot's lastUpdateId, then 'u' of the last applied update
+        self.last_update_id: int | None = content.get('lastUpdateId') if content else None
+        # Called with (order_book, bid_changes, ask_changes) once an update is applied, see add_level_listener
+        self.level_listeners: list = []
+        self._level_changes: dict[str, list] = {'b': [], 'a': []}
+        # Sequence lock for readers on other threads: odd while an update is being applied, see read()
+        self.version = 0
+        self.read_retries = 0
+        # Top levels published after every update when view_depth is set, see publish_top_levels
+        self.view_depth = 0
+        self._view: BookView | None = None
+        # Chunked copy-on-write ladders behind take_snapshot, created by its first call
+        self.cow_ladders: CowLadders | None = None
         
     # Maintaining order book
 
@@ -29,7 +52,7 @@ class OrderBook:
                 raise EmptyOrderBookException ("No bids or asks in the order book snapshot")
         except (TypeError, KeyError, ValueError) as e:
             # Need to raise error as the execution of the code can't be continued 
-            logger.critical (f'Order book snapshot is not valid and can\'t be processed: {e}')
+            logger.critical ('Order book snapshot is not valid and can\'t be processed: %s', e)
             raise 
         return (self.ob_bids, self.ob_asks)    
     
@@ -38,20 +61,24 @@ class OrderBook:
         side = self.ob_bids if book_side == 'b' else self.ob_asks
         try:    
             message_side = {float(price):float(qty) for price,qty in message.get(book_side,[])}
+            changes = self._level_changes[book_side] if self.level_listeners else None
             for price, qty in message_side.items():
+                if changes is not None:
+                    changes.append((price, side.get(price, 0.0), qty))
                 if qty == 0:
                     side.pop(price,None)
                 else:
                     side[price] = qty
         except (TypeError, KeyError, ValueError) as e:
             # No need to raise error as we want to continue execution and simply move to the next message
-            logger.warning(f'Bad message received, skipping: {e}')    
+            logger.warning('Bad message received, skipping: %s', e)    
         return side
     
 
     async def update_order_book(self, message: dict) -> tuple[dict, dict]:
         for side_key in ['b', 'a']:
             await self.update_order_book_side (message, side_key)
+        self.last_update_id = message.get('u', self.last_update_id)
         return self.ob_bids, self.ob_asks
     
 
@@ -93,7 +120,7 @@ class OrderBook:
                 else:
                     prices_to_keep.append(price)
         except (TypeError, KeyError, ValueError) as e:
-            logger.warning(f'Bad message received, skipping: {e}')  
+            logger.warning('Bad message received, skipping: %s', e)  
         return PriceChange(prices_to_add_or_update = prices_to_keep, 
                             prices_to_remove = prices_to_remove)
     
@@ -117,9 +144,32 @@ class OrderBook:
         for side_key in ('b','a'):
             price_change = await self.parse_price_changes_from_message(message, side_key)
             await self.update_price_list_side (price_change, side_key)
+        if self.level_listeners:
+            self._notify_level_listeners()
         return self.ob_bids_prices, self.ob_asks_prices
 
 
+    # Listening to level changes
+
+    def add_level_listener(self, listener) -> None:
+        """
+        Registers listener(order_book, bid_changes, ask_changes), called after every applied update
+        (update_order_book followed by update_price_lists) with the touched levels as
+        [(price, old qty, new qty)] per side, qty 0 meaning the level is absent
+        """
+        self.level_listeners.append(listener)
+
+    def remove_level_listener(self, listener) -> None:
+        self.level_listeners.remove(listener)
+        if not self.level_listeners:
+            self._level_changes = {'b': [], 'a': []}
+
+    def _notify_level_listeners(self) -> None:
+        changes, self._level_changes = self._level_changes, {'b': [], 'a': []}
+        for listener in self.level_listeners:
+            listener(self, changes['b'], changes['a'])
+
+
     async def trim_price_lists(self, num_records: int = 5000) -> tuple[list[float],list[float]]:
         self.ob_bids_prices = self.ob_bids_prices[-num_records:]
         self.ob_asks_prices = self.ob_asks_prices[0:num_records]
@@ -133,3 +183,109 @@ class OrderBook:
     
 
 
+    # Reading from other threads
+
+    # The levels are written in two steps (the dicts in update_order_book, then the price lists), so a reader on
+    # another thread could see a level in ob_bids that isn't in ob_bids_prices yet. to_do_processing_logic wraps
+    # both steps in begin_update / end_update, which make the version odd and then even again. A reader copies
+    # what it needs between two reads of the version and starts again when it moved, as for the shared-memory
+    # top of book (see top_of_book.py): the writer is never blocked, however many readers there are.
+    # Under the GIL a reader that lands in the middle of an update has to wait for the writer's next time slice,
+    # so for readers of the top levels the writer can also publish them after every update (double buffering):
+    # reading them is then a single attribute read, without retries.
+
+    def begin_update(self) -> None:
+        self.version += 1
+
+    def end_update(self) -> None:
+        self.version += 1
+        if self.view_depth:
+            self._view = BookView(self.version, *_copy_top_levels(self, self.view_depth))
+
+    def publish_top_levels(self, depth: int = 20) -> None:
+        """
+        Makes every update publish a BookView of the top `depth` levels, returned by top_levels() without retries
+        (0 stops publishing)
+        """
+        self.view_depth = depth
+        self._view = None
+        if depth:
+            version, levels = self.read(lambda book: _copy_top_levels(book, depth))
+            self._view = BookView(version, *levels)
+
+    def read(self, reader, max_retries: int = MAX_READ_RETRIES):
+        """
+        Runs reader(order_book) until it ran entirely between two updates
+        Args:
+            reader: function copying what it needs from the book, it may be run several times
+            max_retries (int): attempts before giving up
+        Returns:
+            tuple - (version the copy was taken at, what reader returned)
+        Raises:
+            InconsistentReadException: the writer kept updating the book during every attempt
+        """
+        for _ in range(max_retries):
+            version = self.version
+            if not version & 1:
+                try:
+                    result = reader(self)
+                except (KeyError, IndexError, RuntimeError):
+                    # A level removed or a dict resized under the reader, unless the book didn't change
+                    if self.version == version:
+                        raise
+                else:
+                    if self.version == version:
+                        return version, result
+            self.read_retries += 1
+            # Releases the GIL, so the writer can finish the update
+            time.sleep(0)
+        raise InconsistentReadException(f'No consistent copy of the book after {max_retries} attempts')
+
+    def top_levels(self, depth: int = 20) -> BookView:
+        """
+        Returns:
+            BookView - the top `depth` levels of both sides and the last update id, all from the same update
+        """
+        view = self._view
+        if view is not None and depth <= self.view_depth:
+            if depth == self.view_depth:
+                return view
+            return BookView(view.version, view.last_update_id, view.bids[:depth], view.asks[:depth])
+        version, (last_update_id, bids, asks) = self.read(lambda book: _copy_top_levels(book, depth))
+        return BookView(version, last_update_id, bids, asks)
+
+
+    # Immutable snapshots
+
+    def enable_snapshots(self, chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        Starts maintaining the copy-on-write ladders take_snapshot() shares with its snapshots (O(levels) once,
+        then O(log levels + chunk_size) per touched level). Called where the book is updated, before readers
+        on other threads take snapshots.
+        """
+        if self.cow_ladders is None:
+            self.cow_ladders = CowLadders(self, chunk_size)
+
+    def take_snapshot(self) -> FrozenBook:
+        """
+        Returns:
+            FrozenBook - immutable view of the whole book as of the current version, in O(1): it shares the
+            chunks of the levels with the live book, and only the chunks changed afterwards are copied.
+            Safe from other threads once enable_snapshots() was called; the first call otherwise enables them.
+        """
+        self.enable_snapshots()
+        return self.read(lambda book: book.cow_ladders.freeze())[1]
+
+
+    # Comparing books
+
+    async def diff(self, other: 'OrderBook', depth: int = None):
+        # Levels to change to turn this book into `other`, see order_book.book_diff.diff_order_books
+        return diff_order_books(self, other, depth)
+
+
+def _copy_top_levels(order_book: OrderBook, depth: int) -> tuple:
+    bids, asks = order_book.ob_bids, order_book.ob_asks
+    return (order_book.last_update_id,
+            [(price, bids[price]) for price in order_book.ob_bids_prices[:-depth - 1:-1]],
+            [(price, asks[price]) for price in order_book.ob_asks_prices[:depth]])
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+from order_book.book_manager import BookManager
+from order_book.snapshot_scheduler import DEFAULT_WEIGHT_BUDGET
+
+logger = logging.getLogger(__name__)
+
+Move = namedtuple('Move', ['symbol', 'from_worker', 'to_worker'])
+
+
+def assign_symbols(symbols, num_workers: int, loads: dict[str, float] = None) -> list[list[str]]:
+    """
+    Spreads the symbols over the workers, heaviest first, each to the currently least loaded worker.
+    Without loads every symbol counts as 1, which gives an even split by count.
+    Args:
+        symbols (iterable of str): trading pairs
+        num_workers (int): number of worker processes
+        loads (dict, optional): symbol -> load (e.g. CPU share), unknown symbols count as 1
+    Returns:
+        list[list[str]] - symbols of every worker
+    """
+    if num_workers < 1:
+        raise ValueError('At least one worker is required')
+    loads = loads or {}
+    shards = [[] for _ in range(num_workers)]
+    shard_loads = [0.0] * num_workers
+    for symbol in sorted(symbols, key=lambda symbol: -loads.get(symbol, 1.0)):
+        worker = min(range(num_workers), key=lambda index: (shard_loads[index], len(shards[index])))
+        shards[worker].append(symbol)
+        shard_loads[worker] += loads.get(symbol, 1.0)
+    return shards
+
+
+def plan_rebalance(assignment: list[list[str]], loads: dict[str, float], imbalance_threshold: float = 1.25) -> list[Move]:
+    """
+    Plans at most one move per call, from the hottest worker to the coolest one, when the hottest worker
+    carries more than imbalance_threshold times the mean load. The moved symbol is the one whose load is
+    closest to half of the gap between the two workers, so a move never makes the imbalance worse and
+    repeated calls converge instead of moving symbols back and forth.
+    Args:
+        assignment (list[list[str]]): current symbols of every worker
+        loads (dict): symbol -> recent load (unknown symbols count as 0)
+        imbalance_threshold (float): hottest / mean worker load that triggers a move
+    Returns:
+        list[Move] - empty when the load is balanced enough or no move would help
+    """
+    if len(assignment) < 2:
+        return []
+    worker_loads = [sum(loads.get(symbol, 0.0) for symbol in shard) for shard in assignment]
+    mean_load = sum(worker_loads) / len(worker_loads)
+    hottest = max(range(len(assignment)), key=worker_loads.__getitem__)
+    coolest = min(range(len(assignment)), key=worker_loads.__getitem__)
+    if mean_load <= 0 or worker_loads[hottest] <= imbalance_threshold * mean_load or len(assignment[hottest]) < 2:
+        return []
+
+    gap = worker_loads[hottest] - worker_loads[coolest]
+    candidates = [symbol for symbol in assignment[hottest] if 0 < loads.get(symbol, 0.0) < gap]
+    if not candidates:
+        return []
+    symbol = min(candidates, key=lambda symbol: abs(gap / 2 - loads[symbol]))
+    return [Move(symbol, hottest, coolest)]
+
+
+async def _run_worker(worker_id: int, symbols: list[str], manager_options: dict,
+                      commands, reports, report_interval: float) -> None:
+    manager, manager_task = None, None
+    partial_depth = {symbol.upper(): levels for symbol, levels in manager_options.get('partial_depth', {}).items()}
+
+    async def _stop_manager():
+        if manager_task is not None:
+            manager.stop()
+            manager_task.cancel()
+            await asyncio.gather(manager_task, return_exceptions=True)
+
+    def _start_manager(symbols):
+        if not symbols:
+            return None, None
+        manager = BookManager(symbols, **manager_options)
+        return manager, asyncio.create_task(manager.run())
+
+    async def _assign(symbols):
+        # Only the moved symbols change: they are (un)subscribed on the live connection, the other books keep running
+        nonlocal manager, manager_task
+        if manager is None or not symbols:
+            await _stop_manager()
+            manager, manager_task = _start_manager(symbols)
+            return
+        for symbol in symbols:
+            await manager.add_symbol(symbol, partial_depth.get(symbol.upper(), 0))
+        for symbol in set(manager.books) - {symbol.upper() for symbol in symbols}:
+            await manager.remove_symbol(symbol)
+
+    manager, manager_task = _start_manager(symbols)
+    try:
+        while True:
+            try:
+                while True:
+                    command, payload = commands.get_nowait()
+                    if command == 'stop':
+                        return
+                    if command == 'assign':
+                        await _assign(payload)
+            except queue.Empty:
+                pass
+            reports.put((worker_id, {'pid': os.getpid(),
+                                     'reported_at': time.monotonic(),
+                                     'manager': manager.snapshot() if manager is not None else None}))
+            await asyncio.sleep(report_interval)
+    finally:
+        await _stop_manager()
+
+
+def _worker_main(worker_id: int, symbols: list[str], manager_options: dict, commands, reports,
+                 report_interval: float, log_level: int) -> None:
+    """
+    Entry point of a worker process: its own event loop, combined-stream connection, sync logic
+    and OrderBooks for the symbols assigned to it
+    """
+    logging.basicConfig(level=log_level, format=f'%(asctime)s [worker {worker_id}] %(name)s %(levelname)s %(message)s')
+    try:
+        asyncio.run(_run_worker(worker_id, symbols, manager_options, commands, reports, report_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+class ShardCoordinator:
+    """
+    Shards symbols over a pool of worker processes, so parsing and book maintenance use more than one core.
+    Every worker runs a BookManager for its symbols (own connection, sync logic and OrderBooks); the
+    coordinator only assigns symbols, moves a symbol from the hottest to the coolest worker when the
+    CPU load gets unbalanced, restarts dead workers and aggregates the workers' metrics.
+    """
+    def __init__(self, symbols, num_workers: int = None, manager_options: dict = None,
+                 report_interval: float = 1, rebalance_interval: float = 60, imbalance_threshold: float = 1.25,
+                 log_level: int = logging.WARNING, mp_context = None):
+        self.symbols = [symbol.upper() for symbol in symbols]
+        num_workers = num_workers or os.cpu_count() or 1
+        self.num_workers = max(1, min(num_workers, len(self.symbols)))
+        self.assignment = assign_symbols(self.symbols, self.num_workers)
+        # Passed to BookManager in every worker, has to be picklable
+        self.manager_options = dict(manager_options or {})
+        # All the workers share the IP's REST weight limit
+        self.manager_options.setdefault('snapshot_weight_budget', DEFAULT_WEIGHT_BUDGET / self.num_workers)
+        self.report_interval = report_interval
+        self.rebalance_interval = rebalance_interval
+        self.imbalance_threshold = imbalance_threshold
+        self.log_level = log_level
+        # spawn: workers don't inherit the coordinator's event loop, threads or sockets
+        self._context = mp_context or multiprocessing.get_context('spawn')
+        self.reports: dict[int, dict] = {}
+        # worker -> symbol -> share of a core used between the worker's last two reports
+        self._recent_loads: dict[int, dict[str, float]] = {}
+        self.rebalances = 0
+        self.restarts = 0
+        self._processes: list = [None] * self.num_workers
+        self._commands: list = [None] * self.num_workers
+        self._reports_queue = None
+        self._stopping = False
+
+    def start(self) -> None:
+        self._reports_queue = self._context.Queue()
+        for worker_id in range(self.num_workers):
+            self._start_worker(worker_id)
+        logger.info('Started %d workers for %d symbols', self.num_workers, len(self.symbols))
+
+    def _start_worker(self, worker_id: int) -> None:
+        self._commands[worker_id] = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, name=f'book-worker-{worker_id}', daemon=True,
+            args=(worker_id, self.assignment[worker_id], self.manager_options, self._commands[worker_id],
+                  self._reports_queue, self.report_interval, self.log_level))
+        process.start()
+        self._processes[worker_id] = process
+
+    async def run(self) -> None:
+        """
+        Infinite function (until stop() is called) which collects reports, restarts dead workers and rebalances
+        """
+        if self._reports_queue is None:
+            self.start()
+        last_rebalance = time.monotonic()
+        try:
+            while not self._stopping:
+                self.collect_reports()
+                for worker_id, process in enumerate(self._processes):
+                    if not process.is_alive():
+                        logger.error('Worker %d exited with code %s, restarting it', worker_id, process.exitcode)
+                        self.restarts += 1
+                        self.reports.pop(worker_id, None)
+                        self._recent_loads.pop(worker_id, None)
+                        self._start_worker(worker_id)
+                if time.monotonic() - last_rebalance > self.rebalance_interval:
+                    last_rebalance = time.monotonic()
+                    self.rebalance()
+                await asyncio.sleep(self.report_interval / 2)
+        finally:
+            # Joins the workers, off the event loop
+            await asyncio.to_thread(self.stop)
+
+    def collect_reports(self) -> None:
+        while True:
+            try:
+                worker_id, report = self._reports_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.record_report(worker_id, report)
+
+    def record_report(self, worker_id: int, report: dict) -> None:
+        """
+        Keeps the worker's latest report and the CPU share of its symbols since the previous one
+        """
+        previous = self.reports.get(worker_id)
+        self.reports[worker_id] = report
+        if previous is None or previous['manager'] is None or report['manager'] is None:
+            return
+        elapsed = report['reported_at'] - previous['reported_at']
+        if elapsed <= 0:
+            return
+        loads = {}
+        for symbol, values in report['manager']['symbols'].items():
+            before = previous['manager']['symbols'].get(symbol)
+            # A symbol that just arrived on the worker has no previous CPU time to compare with
+            if before is not None and values['cpu_s'] >= before['cpu_s']:
+                loads[symbol] = (values['cpu_s'] - before['cpu_s']) / elapsed
+        self._recent_loads[worker_id] = loads
+
+    def symbol_loads(self) -> dict[str, float]:
+        """
+        Returns:
+            dict - symbol -> share of a core used by the symbol between the last two reports of its worker,
+            so a symbol that gets hot shows up at once, however long it ran before
+        """
+        loads = {}
+        for worker_id, shard in enumerate(self.assignment):
+            worker_loads = self._recent_loads.get(worker_id, {})
+            loads.update({symbol: worker_loads[symbol] for symbol in shard if symbol in worker_loads})
+        return loads
+
+    def rebalance(self, loads: dict[str, float] = None) -> list[Move]:
+        """
+        Args:
+            loads (dict, optional): symbol -> load, by default the CPU shares reported by the workers
+        Returns:
+            list[Move] - the applied moves
+        """
+        moves = plan_rebalance(self.assignment, loads if loads is not None else self.symbol_loads(), self.imbalance_threshold)
+        for move in moves:
+            self.assignment[move.from_worker].remove(move.symbol)
+            self.assignment[move.to_worker].append(move.symbol)
+            for worker_id in (move.from_worker, move.to_worker):
+                self._commands[worker_id].put(('assign', list(self.assignment[worker_id])))
+            self.rebalances += 1
+            logger.info('Moved %s from worker %d to worker %d', move.symbol, move.from_worker, move.to_worker)
+        return moves
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict - per-worker and total counters, aggregated from the latest report of every worker,
+            plus the per-symbol stats of all workers
+        """
+        workers, symbols = [], {}
+        for worker_id in range(self.num_workers):
+            process = self._processes[worker_id]
+            report = self.reports.get(worker_id)
+            manager = report['manager'] if report else None
+            worker_symbols = manager['symbols'] if manager else {}
+            symbols.update(worker_symbols)
+            workers.append({'worker_id': worker_id,
+                            'pid': report['pid'] if report else None,
+                            'alive': process is not None and process.is_alive(),
+                            'symbols': list(self.assignment[worker_id]),
+                            'live': manager['live'] if manager else 0,
+                            'messages_applied': sum(values['messages_applied'] for values in worker_symbols.values()),
+                            'memory_bytes': sum(values['memory_bytes'] for values in worker_symbols.values()),
+                            'cpu_s': sum(values['cpu_s'] for values in worker_symbols.values())
+                                     + (manager['routing_cpu_s'] if manager else 0.0)})
+        totals = {key: sum(worker[key] for worker in workers) for key in ('live', 'messages_applied', 'memory_bytes', 'cpu_s')}
+        return {'workers': workers, 'totals': totals, 'symbols': symbols,
+                'rebalances': self.rebalances, 'restarts': self.restarts}
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopping = True
+        for worker_id, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._commands[worker_id].put(('stop', None))
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import time
+from collections import deque, namedtuple
+import aiohttp
+from wb_sockets import syncing
+from wb_sockets.syncing import REQUEST_WEIGHT_LIMIT, depth_request_weight
+
+logger = logging.getLogger(__name__)
+
+# Share of the IP weight limit the snapshot requests of one process may use by default
+DEFAULT_WEIGHT_BUDGET = 0.5
+# Binance counts the request weight per minute
+WEIGHT_WINDOW_S = 60
+# Pause after a 429/418 response without a Retry-After header
+DEFAULT_RETRY_AFTER_S = 60
+
+# One stretch of snapshot requests, from the first request queued while idle until nothing is queued or in flight
+SnapshotBurst = namedtuple('SnapshotBurst', ['requests', 'symbols', 'weight', 'duration_s', 'rate_limited_s'])
+
+
+class _SnapshotRequest:
+    __slots__ = ('symbol', 'limit', 'weight', 'stale_since', 'traffic', 'future')
+
+    def __init__(self, symbol: str, limit: int, stale_since: float, traffic, future: asyncio.Future):
+        self.symbol = symbol
+        self.limit = limit
+        self.weight = depth_request_weight(limit)
+        self.stale_since = stale_since
+        self.traffic = traffic
+        self.future = future
+
+    def score(self, now: float) -> float:
+        # How long the symbol has been without a valid book, weighted by the updates waiting for it
+        waiting_updates = self.traffic() if self.traffic is not None else 0
+        return (now - self.stale_since) * (1 + waiting_updates)
+
+
+class SnapshotScheduler:
+    """
+    Central queue for the REST order book snapshots of many symbols, so a mass resync (e.g. after a network blip)
+    doesn't burst through the weight limit and stall every symbol on 429 responses:
+    - every request is charged its weight (by depth limit) in a sliding one-minute window, and requests are only
+      sent while the window, or the used weight Binance reports for the current minute, stays within the budget;
+    - up to max_in_flight requests are sent at once, the queued ones go out best score first: the longest
+      stale symbols with the most buffered updates;
+    - a 429/418 answer pauses all requests for Retry-After and queues the request again.
+    Ingestion keeps buffering the updates of the waiting symbols, so they sync from the buffer once served.
+    """
+    def __init__(self, session: aiohttp.ClientSession = None, weight_budget: float = DEFAULT_WEIGHT_BUDGET,
+                 max_in_flight: int = 5):
+        """
+        Args:
+            session (aiohttp.ClientSession, optional): pooled REST session, a new one is used per request if not given
+            weight_budget (float): share of REQUEST_WEIGHT_LIMIT the requests may use per minute
+            max_in_flight (int): requests sent at the same time
+        """
+        self.session = session
+        self.weight_budget = weight_budget
+        self.budget = weight_budget * REQUEST_WEIGHT_LIMIT
+        self.max_in_flight = max_in_flight
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.bursts: deque[SnapshotBurst] = deque(maxlen=100)
+        # (monotonic time, weight) of the requests sent in the last WEIGHT_WINDOW_S
+        self._window: deque[tuple[float, int]] = deque()
+        self._window_weight = 0
+        # Used weight reported by Binance and the wall-clock minute it refers to
+        self._reported_weight = 0
+        self._reported_minute = None
+        self._paused_until = 0.0
+        self._pending: list[_SnapshotRequest] = []
+        self._in_flight: set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+        self._burst = None
+
+    async def fetch(self, symbol: str, limit: int = 20, stale_since: float = None, traffic = None) -> tuple[dict, int]:
+        """
+        Queues a snapshot request and waits for its turn, a drop-in for get_order_book
+        Args:
+            symbol (str): trading pair
+            limit (int): levels per side, decides the request weight
+            stale_since (float, optional): time.monotonic() since when the symbol has no valid book, now by default
+            traffic (callable, optional): returns the number of updates waiting for the symbol, e.g. its buffer length
+        Returns:
+            tuple:
+                snapshot (dict): parsed JSON order book snapshot
+                order_book_last_update_id (int): its lastUpdateId
+        """
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        request = _SnapshotRequest(symbol.upper(), limit, stale_since if stale_since is not None else time.monotonic(),
+                                   traffic, asyncio.get_running_loop().create_future())
+        if self._burst is None:
+            self._burst = {'started': time.monotonic(), 'requests': 0, 'symbols': set(), 'weight': 0,
+                           'rate_limited_s': 0.0}
+        self._pending.append(request)
+        self._wake.set()
+        try:
+            return await request.future
+        finally:
+            # A request cancelled while queued (e.g. the caller's timeout) is never sent
+            if request in self._pending:
+                self._pending.remove(request)
+                self._end_burst_if_idle()
+
+    def used_weight(self) -> float:
+        """
+        Returns:
+            float - weight used in the current minute: the own requests or what Binance reported, whichever is higher
+        """
+        now = time.monotonic()
+        window = self._window
+        while window and window[0][0] <= now - WEIGHT_WINDOW_S:
+            self._window_weight -= window.popleft()[1]
+        reported = self._reported_weight if self._reported_minute == int(time.time() // WEIGHT_WINDOW_S) else 0
+        return max(self._window_weight, reported)
+
+    def _delay(self, weight: int) -> float:
+        # Seconds until a request of this weight fits into the budget
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        used = self.used_weight()
+        # A request heavier than the whole budget still goes out, alone
+        if used + weight <= self.budget or not used:
+            return 0.0
+        if used > self._window_weight:
+            # Binance's count dominates, it resets with the next wall-clock minute
+            return WEIGHT_WINDOW_S - time.time() % WEIGHT_WINDOW_S
+        freed = 0
+        for sent_at, sent_weight in self._window:
+            freed += sent_weight
+            if used - freed + weight <= self.budget:
+                return sent_at + WEIGHT_WINDOW_S - now
+        return WEIGHT_WINDOW_S
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self._pending or len(self._in_flight) >= self.max_in_flight:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            now = time.monotonic()
+            request = max(self._pending, key=lambda pending: pending.score(now))
+            delay = self._delay(request.weight)
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    # A new request may have a lower weight, re-check when one arrives
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                if now < self._paused_until and self._burst is not None:
+                    self._burst['rate_limited_s'] += time.monotonic() - now
+                continue
+            self._pending.remove(request)
+            self._charge(request)
+            task = asyncio.create_task(self._send(request))
+            self._in_flight.add(task)
+            task.add_done_callback(self._request_done)
+
+    def _charge(self, request: _SnapshotRequest) -> None:
+        self._window.append((time.monotonic(), request.weight))
+        self._window_weight += request.weight
+        self.requests += 1
+        burst = self._burst
+        burst['requests'] += 1
+        burst['symbols'].add(request.symbol)
+        burst['weight'] += request.weight
+
+    async def _send(self, request: _SnapshotRequest) -> None:
+        try:
+            if self.session is not None:
+                snapshot, used_weight = await syncing.request_depth_snapshot(self.session, request.symbol, request.limit)
+            else:
+                async with aiohttp.ClientSession() as session:
+                    snapshot, used_weight = await syncing.request_depth_snapshot(session, request.symbol, request.limit)
+        except aiohttp.ClientResponseError as e:
+            if e.status not in (418, 429):
+                self._fail(request, e)
+                return
+            self.rate_limited += 1
+            retry_after = e.headers.get('Retry-After') if e.headers else None
+            pause = float(retry_after) if retry_after else DEFAULT_RETRY_AFTER_S
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            logger.warning('Snapshot requests rate limited (%s), pausing for %.0fs', e.status, pause)
+            if not request.future.done():
+                self._pending.append(request)
+            return
+        except Exception as e:
+            self._fail(request, e)
+            return
+        if used_weight is not None:
+            self._reported_weight, self._reported_minute = used_weight, int(time.time() // WEIGHT_WINDOW_S)
+        if not request.future.done():
+            request.future.set_result((snapshot, snapshot.get('lastUpdateId')))
+
+    @staticmethod
+    def _fail(request: _SnapshotRequest, error: Exception) -> None:
+        if not request.future.done():
+            request.future.set_exception(error)
+
+    def _request_done(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        self._wake.set()
+        self._end_burst_if_idle()
+
+    def _end_burst_if_idle(self) -> None:
+        if self._burst is None or self._pending or self._in_flight:
+            return
+        burst, self._burst = self._burst, None
+        if not burst['requests']:
+            return
+        finished = SnapshotBurst(burst['requests'], len(burst['symbols']), burst['weight'],
+                                 time.monotonic() - burst['started'], burst['rate_limited_s'])
+        self.bursts.append(finished)
+        logger.info('Fetched snapshots of %d symbols in %.2fs (%d requests, weight %d, rate limited %.2fs)',
+                    finished.symbols, finished.duration_s, finished.requests, finished.weight, finished.rate_limited_s)
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, *self._in_flight, return_exceptions=True)
+            self._dispatcher = None
+
+    def snapshot(self) -> dict:
+        return {'requests': self.requests,
+                'rate_limited': self.rate_limited,
+                'pending': len(self._pending),
+                'in_flight': len(self._in_flight),
+                'used_weight': self.used_weight(),
+                'budget': self.budget,
+                'last_burst': self.bursts[-1]._asdict() if self.bursts else None}
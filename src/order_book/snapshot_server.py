@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import time
+from aiohttp import web, WSMsgType
+from utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Binance /api/v3/depth accepts limits from 1 to 5000, 100 by default
+DEFAULT_DEPTH = 100
+MAX_DEPTH = 5000
+# Deeper requests are encoded on a worker thread, so a 5000-level response doesn't stall ws_processing
+INLINE_ENCODE_DEPTH = 500
+
+
+def capture_levels(order_book, depth: int) -> tuple[int, list[tuple[float, float]], list[tuple[float, float]]]:
+    """
+    Copies the top `depth` levels, best first. The copy is consistent also while the book is updated
+    on a processing thread (see OrderBook.top_levels); the (slower) formatting can then happen anywhere.
+    Returns:
+        tuple - (last_update_id, bids, asks)
+    """
+    view = order_book.top_levels(depth)
+    return view.last_update_id, view.bids, view.asks
+
+
+def encode_depth(last_update_id: int, bids: list, asks: list) -> bytes:
+    """
+    Returns:
+        bytes - JSON in the shape of Binance /api/v3/depth: {"lastUpdateId": .., "bids": [["price", "qty"], ..], "asks": ..}
+    """
+    return json.dumps({'lastUpdateId': last_update_id,
+                       'bids': [[f'{price:.8f}', f'{qty:.8f}'] for price, qty in bids],
+                       'asks': [[f'{price:.8f}', f'{qty:.8f}'] for price, qty in asks]},
+                      separators=(',', ':')).encode()
+
+
+def encode_frozen_depth(frozen, depth: int) -> bytes:
+    """
+    encode_depth of the top `depth` levels of a FrozenBook (see OrderBook.take_snapshot), from any thread
+    """
+    return encode_depth(frozen.last_update_id, frozen.top('bids', depth), frozen.top('asks', depth))
+
+
+class SnapshotCache:
+    """
+    Serialised depth responses keyed by (symbol, lastUpdateId, depth). An entry is a future, so
+    concurrent identical requests wait for the one encode already in flight instead of starting their own.
+    Only the current update ID of a symbol is kept: once the book moves on, older entries can't be hit again.
+    """
+    def __init__(self):
+        self._entries: dict[tuple[str, int, int], asyncio.Future] = {}
+        self._current_update_id: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, symbol: str, order_book, depth: int) -> bytes:
+        last_update_id = order_book.last_update_id
+        if self._current_update_id.get(symbol) != last_update_id:
+            self._current_update_id[symbol] = last_update_id
+            self._entries = {key: entry for key, entry in self._entries.items() if key[0] != symbol}
+        key = (symbol, last_update_id, depth)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return await asyncio.shield(entry)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        entry = self._entries[key] = loop.create_future()
+        try:
+            if depth > INLINE_ENCODE_DEPTH and order_book.cow_ladders is not None:
+                # Books with copy-on-write snapshots (OrderBook.enable_snapshots) aren't even copied on the event loop
+                body = await asyncio.to_thread(encode_frozen_depth, order_book.take_snapshot(), depth)
+            else:
+                levels = capture_levels(order_book, depth)
+                if depth > INLINE_ENCODE_DEPTH:
+                    body = await asyncio.to_thread(encode_depth, *levels)
+                else:
+                    body = encode_depth(*levels)
+        except asyncio.CancelledError:
+            self._entries.pop(key, None)
+            entry.cancel()
+            raise
+        except Exception as e:
+            self._entries.pop(key, None)
+            entry.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting for this entry
+            entry.exception()
+            raise
+        entry.set_result(body)
+        return body
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class SnapshotServer:
+    """
+    Local HTTP endpoint serving the current book in the shape of Binance /api/v3/depth:
+        GET /api/v3/depth?symbol=BTCUSDT&limit=100
+        GET /ws  - websocket, every text message {"symbol": "BTCUSDT", "limit": 100} is answered with the same JSON
+        GET /stats - request latency and cache hit rate
+    Runs on the event loop of the pipeline; responses are cached per update ID, so a burst of identical
+    requests costs one encode.
+    """
+    def __init__(self, get_book, host: str = '127.0.0.1', port: int = 8080, default_symbol: str = 'BTCUSDT'):
+        # get_book(symbol) -> the current valid OrderBook or None, e.g. BookManager.order_book
+        self.get_book = get_book
+        self.host = host
+        self.port = port
+        self.default_symbol = default_symbol
+        self.cache = SnapshotCache()
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.app = web.Application(middlewares=[self._measure])
+        self.app.add_routes([web.get('/api/v3/depth', self._depth),
+                             web.get('/ws', self._websocket),
+                             web.get('/stats', self._stats)])
+        self._runner = None
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Port 0 picks a free port, report the real one
+        self.port = self._runner.addresses[0][1]
+        logger.info('Snapshot server listening on http://%s:%d/api/v3/depth', self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def snapshot(self) -> dict:
+        latency = self.latency.snapshot()
+        return {'requests': self.requests,
+                'errors': self.errors,
+                'cache_hits': self.cache.hits,
+                'cache_misses': self.cache.misses,
+                'cache_hit_rate': self.cache.hit_rate(),
+                'latency_p50_ms': latency['p50_ms'],
+                'latency_p99_ms': latency['p99_ms'],
+                'latency_p999_ms': latency['p999_ms']}
+
+    @web.middleware
+    async def _measure(self, request, handler):
+        started = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            if request.path != '/ws':
+                self.requests += 1
+                self.latency.record((time.perf_counter() - started) * 1e6)
+
+    def _parse(self, symbol, limit) -> tuple[str, int]:
+        symbol = (symbol or self.default_symbol).upper()
+        try:
+            depth = int(limit) if limit is not None else DEFAULT_DEPTH
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid limit {limit!r}')
+        if not 1 <= depth <= MAX_DEPTH:
+            raise ValueError(f'limit has to be between 1 and {MAX_DEPTH}')
+        return symbol, depth
+
+    async def _render(self, symbol, limit) -> tuple[int, bytes]:
+        try:
+            symbol, depth = self._parse(symbol, limit)
+            order_book = self.get_book(symbol)
+        except (ValueError, KeyError) as e:
+            self.errors += 1
+            return 400, json.dumps({'code': -1100, 'msg': str(e)}).encode()
+        if order_book is None:
+            self.errors += 1
+            return 503, json.dumps({'code': -1003, 'msg': f'No valid order book for {symbol} yet'}).encode()
+        return 200, await self.cache.get(symbol, order_book, depth)
+
+    async def _depth(self, request: web.Request) -> web.Response:
+        status, body = await self._render(request.query.get('symbol'), request.query.get('limit'))
+        return web.Response(body=body, status=status, content_type='application/json')
+
+    async def _websocket(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        async for message in websocket:
+            if message.type != WSMsgType.TEXT:
+                continue
+            started = time.perf_counter()
+            try:
+                params = json.loads(message.data)
+                _, body = await self._render(params.get('symbol'), params.get('limit'))
+            except (json.JSONDecodeError, AttributeError):
+                self.errors += 1
+                body = json.dumps({'code': -1100, 'msg': 'Expected {"symbol": .., "limit": ..}'}).encode()
+            await websocket.send_str(body.decode())
+            self.requests += 1
+            self.latency.record((time.perf_counter() - started) * 1e6)
+        return websocket
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot())
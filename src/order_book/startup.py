@@ -0,0 +1,83 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import namedtuple
+import aiohttp
+import websockets
+from order_book.orchestrator import orchestrator
+from wb_sockets import run_the_subscriber
+from wb_sockets.syncing import get_order_book
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds since the start of the startup (None if the step didn't happen)
+StartupTimings = namedtuple('StartupTimings', ['connected_ms', 'subscribed_ms', 'snapshot_ms', 'first_valid_book_ms'])
+StartupResult = namedtuple('StartupResult', ['websockets', 'ws_ingestion_task', 'ws_processing_task', 'order_book', 'timings'])
+
+
+@contextlib.asynccontextmanager
+async def concurrent_startup(uri: str, metrics = None, profiler = None, session: aiohttp.ClientSession = None,
+                             connections: int = 1, connect = websockets.connect, threaded_processing: bool = False):
+    """
+    Starts the pipeline with the slow steps overlapped instead of one after another:
+    the REST snapshot request (which also warms up the pooled HTTPS connection) goes out
+    straight away, while the WebSocket handshake and the subscription are still in flight.
+    The prefetched snapshot is validated against the buffer as soon as the first depth update
+    arrives, and is only re-requested (over the now warm connection) if it is older than the stream.
+    Args:
+        uri (str): depth stream URI
+        metrics (PipelineMetrics, optional): passed to the ingestion and processing
+        profiler (StageProfiler, optional): passed to the orchestrator
+        session (aiohttp.ClientSession, optional): pooled REST session, created (and closed) here if not given
+        connections (int): number of WebSocket connections, more than one means redundant ingestion
+        connect: websockets.connect or a stand-in with the same interface
+        threaded_processing (bool): process the updates on a dedicated thread, see wb_sockets/threaded_processing.py
+    Yields:
+        StartupResult - connections, running pipeline tasks, the valid OrderBook and the cold-start timings;
+        the tasks are cancelled and the connections closed when the context exits
+    """
+    started = time.perf_counter()
+    timings = {'connected_ms': None, 'subscribed_ms': None, 'snapshot_ms': None, 'first_valid_book_ms': None}
+
+    def _elapsed_ms() -> float:
+        return (time.perf_counter() - started) * 1000
+
+    async with contextlib.AsyncExitStack() as stack:
+        if session is None:
+            session = await stack.enter_async_context(aiohttp.ClientSession())
+
+        async def _prefetch():
+            result = await get_order_book(session)
+            timings['snapshot_ms'] = _elapsed_ms()
+            return result
+
+        snapshot_task = asyncio.create_task(_prefetch())
+        tasks = [snapshot_task]
+        try:
+            # The handshakes overlap; every attempt finishes before an error is raised, so the stack closes all opened ones
+            opened = await asyncio.gather(*(stack.enter_async_context(connect(uri)) for _ in range(connections)),
+                                          return_exceptions=True)
+            errors = [result for result in opened if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+            websockets_list = list(opened)
+            timings['connected_ms'] = _elapsed_ms()
+            await asyncio.wait_for(asyncio.gather(*(run_the_subscriber(websocket) for websocket in websockets_list)), timeout = 5)
+            timings['subscribed_ms'] = _elapsed_ms()
+
+            target = websockets_list[0] if len(websockets_list) == 1 else websockets_list
+            ws_ingestion_task, ws_processing_task, order_book = await orchestrator(
+                target, metrics, profiler, session = session, prefetched_snapshot = snapshot_task,
+                threaded = threaded_processing)
+            tasks += [ws_ingestion_task, ws_processing_task]
+            timings['first_valid_book_ms'] = _elapsed_ms()
+
+            startup_timings = StartupTimings(**timings)
+            logger.info('Cold start: connected %.1f ms, subscribed %.1f ms, snapshot %.1f ms, first valid book %.1f ms',
+                        *(value if value is not None else float('nan') for value in startup_timings))
+            yield StartupResult(websockets_list, ws_ingestion_task, ws_processing_task, order_book, startup_timings)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
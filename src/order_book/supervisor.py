@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import random
+import time
+import aiohttp
+import websockets
+from order_book.startup import concurrent_startup
+from utils.metrics import PipelineMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class StreamStalledException(Exception):
+    """Raised when no frame arrived for too long or the ping latency is above the threshold"""
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0, rng: random.Random = random) -> float:
+    """
+    Exponential backoff with full jitter: a random delay between 0 and min(cap, base * 2**attempt).
+    Jitter spreads reconnects out, so several clients losing the connection at once
+    don't hit Binance at the same moment.
+    """
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class BookSupervisor:
+    """
+    Keeps a local order book alive indefinitely.
+    Runs connect -> subscribe -> sync -> ingest/process, watches the session for silent stalls,
+    failed tasks and slow pings, and starts a new session with jittered backoff when something goes wrong.
+    The last valid OrderBook stays readable through `order_book` until the new session has synced
+    a new one, so readers never see a half-built book.
+    """
+    def __init__(self, uri: str, metrics: PipelineMetrics = None, profiler = None,
+                 stall_timeout_ms: float = 5000, ping_interval: float = 5, max_ping_latency_ms: float = 2000,
+                 backoff_base: float = 0.5, backoff_cap: float = 30, stable_after: float = 60,
+                 check_interval: float = 0.1, connections: int = 1, connect = websockets.connect,
+                 threaded_processing: bool = False):
+        self.uri = uri
+        # More than one connection switches to the redundant (first arrival wins) ingestion
+        self.connections = connections
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.profiler = profiler
+        self.stall_timeout_ms = stall_timeout_ms
+        self.ping_interval = ping_interval
+        self.max_ping_latency_ms = max_ping_latency_ms
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # A session that lived this many seconds resets the backoff attempt counter
+        self.stable_after = stable_after
+        self.check_interval = check_interval
+        self.connect = connect
+        # Parse and apply the updates on a dedicated thread instead of the event loop
+        self.threaded_processing = threaded_processing
+
+        self.order_book = None
+        self.reconnects = 0
+        self.stalls = 0
+        self.downtime_s = 0.0
+        self.last_ping_latency_ms = None
+        self.last_startup = None
+        self._session = None
+        self._down_since = time.monotonic()
+        self._stopping = False
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict - reconnect/downtime counters (downtime includes the current outage, if any)
+        """
+        downtime = self.downtime_s
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return {'reconnects': self.reconnects,
+                'stalls': self.stalls,
+                'downtime_s': downtime,
+                'is_up': self._down_since is None,
+                'last_ping_latency_ms': self.last_ping_latency_ms,
+                'last_startup': self.last_startup._asdict() if self.last_startup else None}
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    async def run(self) -> None:
+        """
+        Infinite function (until stop() is called) which keeps a session with a valid order book running
+        """
+        attempt = 0
+        # One pooled REST session for all the sessions, so resyncs reuse a warm HTTPS connection
+        async with aiohttp.ClientSession() as self._session:
+            while not self._stopping:
+                started = time.monotonic()
+                try:
+                    await self._run_session()
+                except asyncio.CancelledError:
+                    raise
+                except StreamStalledException as e:
+                    self.stalls += 1
+                    logger.warning('Stream stalled: %s', e)
+                except Exception as e:
+                    logger.error('Session failed: %s', e)
+                self._mark_down()
+                if self._stopping:
+                    break
+
+                if time.monotonic() - started > self.stable_after:
+                    attempt = 0
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                attempt += 1
+                self.reconnects += 1
+                logger.info('Reconnecting in %.2fs (attempt %d), supervisor stats: %s', delay, attempt, self.snapshot())
+                await asyncio.sleep(delay)
+
+    async def _run_session(self) -> None:
+        async with concurrent_startup(self.uri, self.metrics, self.profiler, self._session,
+                                      self.connections, self.connect, self.threaded_processing) as started:
+            # The new book is valid only now, swap it in and end the outage
+            self.order_book = started.order_book
+            self.last_startup = started.timings
+            self._mark_up()
+            await self._watch(started.websockets, [started.ws_ingestion_task, started.ws_processing_task])
+
+    async def _watch(self, websockets_list: list, tasks: list[asyncio.Task]) -> None:
+        """
+        Returns only by raising: when a pipeline task ends, no frame arrived for stall_timeout_ms,
+        or a ping wasn't answered within max_ping_latency_ms.
+        """
+        last_ping = time.monotonic()
+        while not self._stopping:
+            await asyncio.sleep(self.check_interval)
+            for task in tasks:
+                if task.done():
+                    if task.cancelled():
+                        raise StreamStalledException(f'Task {task.get_name()} was cancelled')
+                    error = task.exception()
+                    if isinstance(error, Exception):
+                        # e.g. MissingMessageInIngestedStream: a new session resyncs the book
+                        raise error
+                    raise StreamStalledException(f'Task {task.get_name()} has stopped')
+
+            last_received_at = self.metrics.last_received_at
+            if last_received_at is not None:
+                silence_ms = (time.time() - last_received_at) * 1000
+                if silence_ms > self.stall_timeout_ms:
+                    raise StreamStalledException(f'No frame received for {silence_ms:.0f} ms')
+
+            if self.ping_interval and time.monotonic() - last_ping > self.ping_interval:
+                last_ping = time.monotonic()
+                await self._check_ping(websockets_list)
+
+    async def _ping(self, websocket) -> float | None:
+        try:
+            pong_waiter = await websocket.ping()
+            # websockets returns the latency in seconds
+            latency = await asyncio.wait_for(pong_waiter, timeout = self.max_ping_latency_ms / 1000)
+        except (asyncio.TimeoutError, ConnectionError, websockets.ConnectionClosed):
+            return None
+        return latency * 1000 if isinstance(latency, float) else 0.0
+
+    async def _check_ping(self, websockets_list: list) -> None:
+        # With redundant connections one slow path is tolerated, the session stalls only when all are slow
+        latencies = [latency for latency in await asyncio.gather(*(self._ping(websocket) for websocket in websockets_list))
+                     if latency is not None]
+        if not latencies:
+            raise StreamStalledException(f'Ping not answered within {self.max_ping_latency_ms} ms')
+        self.last_ping_latency_ms = min(latencies)
+
+    def _mark_down(self) -> None:
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+
+    def _mark_up(self) -> None:
+        if self._down_since is not None:
+            self.downtime_s += time.monotonic() - self._down_since
+            self._down_since = None
@@ -0,0 +1,191 @@
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+from order_book.order_book_class import InconsistentReadException
+
+# Fixed layout of a segment (little endian):
+#   header: sequence (uint64), last_update_id (uint64), published_ns (uint64),
+#           depth (uint32), num_bids (uint32), num_asks (uint32), reserved (uint32)
+#   levels: depth x (price, qty) doubles for the bids, best first, then the same for the asks
+# Sequence lock: the writer makes the sequence odd, writes the levels, then makes it even again.
+# A reader copies the sequence, the data and the sequence again; the copy is consistent when both
+# sequences are equal and even. Readers never write to the segment, so any number of processes can
+# read without locks or system calls. The protocol relies on the writer's stores becoming visible in
+# program order, which holds on x86-64 (TSO).
+HEADER = struct.Struct('<QQQIIII')
+SEQUENCE = struct.Struct('<Q')
+SEGMENT_PREFIX = 'lob_top'
+# Failed attempts a reader spins before it yields the CPU (lets a preempted writer finish on a busy core)
+SPINS_BEFORE_YIELD = 100
+
+TopOfBook = namedtuple('TopOfBook', ['last_update_id', 'published_ns', 'bids', 'asks'])
+BestBidAsk = namedtuple('BestBidAsk', ['last_update_id', 'bid_price', 'bid_qty', 'ask_price', 'ask_qty'])
+
+
+# Segments created by publishers of this process, see TopOfBookReader.__init__
+_published_segments: set[str] = set()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    segment = shared_memory.SharedMemory(name)
+    # Before Python 3.13 attaching registers the segment with the resource tracker, which would
+    # unlink it when the reader exits; only the publisher owns the segment
+    if name not in _published_segments:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def _backoff(attempt: int) -> None:
+    if attempt >= SPINS_BEFORE_YIELD:
+        os.sched_yield()
+
+
+def segment_name(symbol: str, prefix: str = SEGMENT_PREFIX) -> str:
+    return f'{prefix}_{symbol.lower()}'
+
+
+def segment_size(depth: int) -> int:
+    return HEADER.size + 4 * depth * 8
+
+
+class TopOfBookPublisher:
+    """
+    Writer side: publishes the top `depth` levels and the last update ID of an OrderBook into a
+    shared-memory segment named after the symbol (see segment_name)
+    """
+    def __init__(self, symbol: str, depth: int = 20, name: str = None):
+        self.symbol = symbol.upper()
+        self.depth = depth
+        self.name = name or segment_name(symbol)
+        try:
+            self._segment = shared_memory.SharedMemory(self.name, create=True, size=segment_size(depth))
+        except FileExistsError:
+            # Left behind by a previous run of the writer; readers re-check the header depth on attach
+            self._segment = shared_memory.SharedMemory(self.name)
+            if self._segment.size < segment_size(depth):
+                self._segment.close()
+                raise
+        _published_segments.add(self.name)
+        self._buffer = self._segment.buf
+        self._levels = struct.Struct(f'<{4 * depth}d')
+        self._values = [0.0] * (4 * depth)
+        self._sequence = 0
+        HEADER.pack_into(self._buffer, 0, self._sequence, 0, 0, depth, 0, 0, 0)
+        self.publishes = 0
+
+    def publish(self, order_book) -> None:
+        """
+        Args:
+            order_book (OrderBook): book with up-to-date price lists (ob_bids_prices / ob_asks_prices)
+        """
+        depth, values = self.depth, self._values
+        bids, asks = order_book.ob_bids, order_book.ob_asks
+        # Price lists are sorted ascending: the best bids are at the end, the best asks at the start
+        bid_prices = order_book.ob_bids_prices[:-depth - 1:-1]
+        ask_prices = order_book.ob_asks_prices[:depth]
+        index = 0
+        for price in bid_prices:
+            values[index] = price
+            values[index + 1] = bids[price]
+            index += 2
+        for index in range(index, 2 * depth):
+            values[index] = 0.0
+        index = 2 * depth
+        for price in ask_prices:
+            values[index] = price
+            values[index + 1] = asks[price]
+            index += 2
+        for index in range(index, 4 * depth):
+            values[index] = 0.0
+
+        buffer = self._buffer
+        self._sequence += 1
+        SEQUENCE.pack_into(buffer, 0, self._sequence)
+        HEADER.pack_into(buffer, 0, self._sequence, order_book.last_update_id or 0, time.time_ns(),
+                         depth, len(bid_prices), len(ask_prices), 0)
+        self._levels.pack_into(buffer, HEADER.size, *values)
+        self._sequence += 1
+        SEQUENCE.pack_into(buffer, 0, self._sequence)
+        self.publishes += 1
+
+    def close(self, unlink: bool = True) -> None:
+        self._buffer.release()
+        self._segment.close()
+        if unlink:
+            self._segment.unlink()
+            _published_segments.discard(self.name)
+
+
+class TopOfBookReader:
+    """
+    Reader side, for any process on the same machine: attaches to the segment of a symbol and returns
+    consistent copies of the published levels
+    """
+    def __init__(self, symbol: str, name: str = None, max_retries: int = 100000):
+        self.name = name or segment_name(symbol)
+        self.max_retries = max_retries
+        self._segment = _attach(self.name)
+        self._buffer = self._segment.buf
+        self.depth = HEADER.unpack_from(self._buffer, 0)[3]
+        self._levels = struct.Struct(f'<{4 * self.depth}d')
+        self._best = struct.Struct('<2d')
+        self.retries = 0
+
+    def read(self) -> TopOfBook:
+        """
+        Returns:
+            TopOfBook - last_update_id, published_ns (time.time_ns() of the writer) and the bids / asks
+            as lists of (price, qty), best first
+        """
+        buffer, depth = self._buffer, self.depth
+        for attempt in range(self.max_retries):
+            sequence, last_update_id, published_ns, _, num_bids, num_asks, _ = HEADER.unpack_from(buffer, 0)
+            if sequence & 1:
+                self.retries += 1
+                _backoff(attempt)
+                continue
+            values = self._levels.unpack_from(buffer, HEADER.size)
+            if SEQUENCE.unpack_from(buffer, 0)[0] != sequence:
+                self.retries += 1
+                _backoff(attempt)
+                continue
+            bids = list(zip(values[0:2 * num_bids:2], values[1:2 * num_bids:2]))
+            asks = list(zip(values[2 * depth:2 * (depth + num_asks):2], values[2 * depth + 1:2 * (depth + num_asks):2]))
+            return TopOfBook(last_update_id, published_ns, bids, asks)
+        raise InconsistentReadException(f'No consistent copy of {self.name} after {self.max_retries} attempts')
+
+    def best_bid_ask(self) -> BestBidAsk:
+        """
+        Fast path reading only the first level of each side
+        """
+        buffer, asks_offset = self._buffer, HEADER.size + 2 * self.depth * 8
+        for attempt in range(self.max_retries):
+            sequence, last_update_id = HEADER.unpack_from(buffer, 0)[:2]
+            if sequence & 1:
+                self.retries += 1
+                _backoff(attempt)
+                continue
+            bid_price, bid_qty = self._best.unpack_from(buffer, HEADER.size)
+            ask_price, ask_qty = self._best.unpack_from(buffer, asks_offset)
+            if SEQUENCE.unpack_from(buffer, 0)[0] != sequence:
+                self.retries += 1
+                _backoff(attempt)
+                continue
+            return BestBidAsk(last_update_id, bid_price, bid_qty, ask_price, ask_qty)
+        raise InconsistentReadException(f'No consistent copy of {self.name} after {self.max_retries} attempts')
+
+    def staleness_ns(self) -> int:
+        """
+        Returns:
+            int - nanoseconds since the last publish
+        """
+        return time.time_ns() - HEADER.unpack_from(self._buffer, 0)[2]
+
+    def close(self) -> None:
+        self._buffer.release()
+        self._segment.close()
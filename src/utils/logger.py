@@ -1,13 +1,117 @@
 import logging
+import logging.handlers
 import os
+import queue
+import time
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Loggers which log once per WebSocket frame - their DEBUG records are sampled
+HOT_PATH_LOGGERS = ('wb_sockets.ingesting', 'wb_sockets.routing', 'wb_sockets.processing', 'order_book.order_book_class')
+
+
+class DeferredFormatQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler which doesn't format the record on the calling thread.
+    The standard QueueHandler merges msg and args in prepare() so the record can be pickled,
+    which means the string work still happens on the event loop. Our queue never leaves
+    the process, so the record is put on the queue as is and the QueueListener thread formats it.
+    Log calls should therefore pass immutable arguments (str, int, float), not the buffer itself.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through only one of every `every` records at or below `max_level`
+    (records above max_level always pass). Used for per-message DEBUG logs.
+    """
+    def __init__(self, every: int = 1000, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.every = every
+        self.max_level = max_level
+        self.seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        self.seen += 1
+        return self.seen % self.every == 1 or self.every == 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most one WARNING record per `interval` seconds for every call site (logger, line),
+    e.g. 'Bad message received' during a burst of malformed frames; other levels always pass.
+    The number of suppressed records is added to the next record which is let through,
+    so nothing disappears silently.
+    """
+    def __init__(self, interval: float = 1.0):
+        super().__init__()
+        self.interval = interval
+        self.last_emitted: dict[tuple[str, int], float] = {}
+        self.suppressed: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.WARNING:
+            return True
+        key = (record.name, record.lineno)
+        now = time.monotonic()
+        if now - self.last_emitted.get(key, float('-inf')) < self.interval:
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return False
+        self.last_emitted[key] = now
+        suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f'{record.msg} [{suppressed} similar messages suppressed]'
+        return True
+
 
 # Adding %(name)s to add a line specifying which module the log came from
-def setup_logger():
-    os.makedirs("data", exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        filename="data/log.txt",
-        filemode="w",
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"  
-    )
\ No newline at end of file
+def setup_logger(level: int = logging.INFO, filename: str = "data/log.txt", console: bool = True,
+                 debug_sample_every: int = 1000, rate_limit_interval: float = 1.0) -> logging.handlers.QueueListener:
+    """
+    Configures the root logger so that logging never blocks the event loop:
+    log calls only put the record on a queue, a QueueListener thread formats it and
+    writes it to the log file (and to the console).
+    Args:
+        level (int): root logging level
+        filename (str): log file, its directory is created if needed
+        console (bool): also write to stderr (replaces the old print statements)
+        debug_sample_every (int): only 1 of every N DEBUG records of the hot path loggers is kept
+        rate_limit_interval (float): at most one WARNING record per call site per interval seconds
+    Returns:
+        logging.handlers.QueueListener - already started, call stop() at shutdown to flush the queue
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
+    handlers = [logging.FileHandler(filename, mode="w")]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredFormatQueueHandler(log_queue)
+    if rate_limit_interval:
+        queue_handler.addFilter(RateLimitFilter(rate_limit_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    for name in HOT_PATH_LOGGERS:
+        hot_logger = logging.getLogger(name)
+        # Replaced on every call, filters stacked by an earlier setup would sample 1 of N squared records
+        for sampling_filter in [f for f in hot_logger.filters if isinstance(f, SamplingFilter)]:
+            hot_logger.removeFilter(sampling_filter)
+        if debug_sample_every > 1:
+            hot_logger.addFilter(SamplingFilter(debug_sample_every))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
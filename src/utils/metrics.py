@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages, every stage is measured between two stamps of the same frame:
+# network    - Binance event time 'E' -> frame received in ws_ingestion
+# queue      - frame received -> frame dequeued by ws_processing
+# apply      - frame dequeued -> update applied to the OrderBook in to_do_processing_logic
+# end_to_end - Binance event time 'E' -> update applied
+STAGES = ('network', 'queue', 'apply', 'end_to_end')
+
+
+class StampedFrame(str):
+    """
+    Raw WebSocket frame which remembers when it was received.
+    It is still a str, so the buffer, json.loads and the syncing code work with it unchanged.
+    """
+    received_at: float
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram (values in microseconds).
+    Buckets are log-linear: every power of two is split into 8 sub-buckets, which keeps the
+    relative error of a percentile below 12.5% with a fixed number (~280) of integer counters.
+    Recording a value is O(1) and doesn't allocate.
+    """
+    SUB_BUCKET_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    MAX_VALUE_BITS = 36  # ~19 hours in microseconds, anything above goes to the last bucket
+
+    def __init__(self):
+        self.num_buckets = (self.MAX_VALUE_BITS - self.SUB_BUCKET_BITS + 1) * self.SUB_BUCKETS
+        self.counts = [0] * self.num_buckets
+        self.count = 0
+        self.total = 0
+        self.max_value = 0
+
+    def _bucket_index(self, value: int) -> int:
+        if value < 2 * self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - self.SUB_BUCKET_BITS - 1
+        return min(shift * self.SUB_BUCKETS + (value >> shift), self.num_buckets - 1)
+
+    def _bucket_upper_bound(self, index: int) -> int:
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        mantissa = index % self.SUB_BUCKETS + self.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value_us: float) -> None:
+        # Clock skew between Binance and the local machine can make the network lag negative
+        value = int(value_us) if value_us > 0 else 0
+        self.counts[self._bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max_value:
+            self.max_value = value
+
+    def percentile(self, percent: float) -> int:
+        """
+        Returns the upper bound of the bucket containing the requested percentile (in microseconds)
+        """
+        if self.count == 0:
+            return 0
+        target = self.count * percent / 100
+        running = 0
+        for index, bucket_count in enumerate(self.counts):
+            running += bucket_count
+            if running >= target and bucket_count:
+                return min(self._bucket_upper_bound(index), self.max_value)
+        return self.max_value
+
+    def snapshot(self) -> dict:
+        return {'count': self.count,
+                'mean_ms': self.total / self.count / 1000 if self.count else 0.0,
+                'p50_ms': self.percentile(50) / 1000,
+                'p99_ms': self.percentile(99) / 1000,
+                'p999_ms': self.percentile(99.9) / 1000,
+                'max_ms': self.max_value / 1000}
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+class PipelineMetrics:
+    """
+    Latency histograms per pipeline stage plus counters for the messages flowing through
+    ws_ingestion -> buffer -> ws_processing -> OrderBook.
+    """
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.messages_received = 0
+        self.messages_applied = 0
+        self.levels_applied = 0
+        self.resyncs = 0
+        self.last_received_at = None
+
+    def stamp(self, frame: str) -> StampedFrame:
+        """
+        Called by ws_ingestion straight after websocket.recv()
+        Args:
+            frame (str): raw frame received from the WebSocket
+        Returns:
+            StampedFrame - the same frame with the receive time attached
+        """
+        stamped = StampedFrame(frame)
+        stamped.received_at = self.last_received_at = time.time()
+        self.messages_received += 1
+        return stamped
+
+    def record_apply(self, frame: str, message: dict, dequeued_at: float) -> None:
+        """
+        Called by ws_processing once a depth update is applied to the OrderBook.
+        Args:
+            frame (str): raw frame popped from the buffer (a StampedFrame if ingestion stamped it)
+            message (dict): the parsed depth update message
+            dequeued_at (float): time.time() when the frame was popped from the buffer
+        """
+        applied_at = time.time()
+        self.messages_applied += 1
+        self.levels_applied += len(message.get('b', ())) + len(message.get('a', ()))
+        self.histograms['apply'].record((applied_at - dequeued_at) * 1e6)
+
+        received_at = getattr(frame, 'received_at', None)
+        if received_at is not None:
+            self.histograms['queue'].record((dequeued_at - received_at) * 1e6)
+        event_time = message.get('E')
+        if event_time is not None:
+            # Binance event time is in milliseconds since epoch
+            self.histograms['end_to_end'].record((applied_at * 1000 - event_time) * 1000)
+            if received_at is not None:
+                self.histograms['network'].record((received_at * 1000 - event_time) * 1000)
+
+    def record_resync(self) -> None:
+        self.resyncs += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict - counters and p50/p99/p999 latencies (ms) per stage, safe to serialise to JSON
+        """
+        return {'messages_received': self.messages_received,
+                'messages_applied': self.messages_applied,
+                'levels_applied': self.levels_applied,
+                'resyncs': self.resyncs,
+                'stages': {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}}
+
+    def format_line(self) -> str:
+        stages = ' '.join(f"{stage}[p50={values['p50_ms']:.2f} p99={values['p99_ms']:.2f} p999={values['p999_ms']:.2f}]"
+                          for stage, values in self.snapshot()['stages'].items())
+        return (f'received={self.messages_received} applied={self.messages_applied} '
+                f'levels={self.levels_applied} resyncs={self.resyncs} {stages} (ms)')
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+# Default instance shared by the ingestion and processing coroutines
+pipeline_metrics = PipelineMetrics()
+
+
+def get_pipeline_metrics() -> dict:
+    """
+    Programmatic access to the latency histograms and counters of the running pipeline
+    """
+    return pipeline_metrics.snapshot()
+
+
+async def log_metrics_periodically(metrics: PipelineMetrics = pipeline_metrics, interval: float = 10) -> None:
+    """
+    Infinite function which writes a single summary line with the pipeline metrics every interval seconds
+    Args:
+        metrics (PipelineMetrics): metrics to report
+        interval (float): seconds between two log lines
+    Returns:
+        None
+    """
+    while True:
+        await asyncio.sleep(interval)
+        logger.info('Pipeline metrics: %s', metrics.format_line())
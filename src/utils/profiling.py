@@ -0,0 +1,161 @@
+import cProfile
+import functools
+import logging
+import marshal
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Profiling is switched on with an environment variable, no code edits needed:
+#   LOB_PROFILE=stages python main.py   -> CPU time and call counts per pipeline stage
+#   LOB_PROFILE=full python main.py     -> the same plus a deterministic cProfile of the whole run
+# LOB_PROFILE_DIR changes where the .prof files are written (default: data/profile)
+PROFILE_ENV = 'LOB_PROFILE'
+PROFILE_DIR_ENV = 'LOB_PROFILE_DIR'
+PROFILE_MODES = ('stages', 'full')
+
+# OrderBook methods on the apply path, wrapped by install_order_book_profiling
+ORDER_BOOK_APPLY_METHODS = ('update_order_book', 'update_price_lists', 'sort_updated_order_book',
+                            'trim_order_book', 'extract_order_book_prices')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StageProfiler:
+    """
+    Collects cumulative CPU time and call counts per pipeline stage.
+    Coroutines are measured step by step (every resumption of the coroutine is one call), so the
+    time a coroutine spends suspended on websocket.recv() or asyncio.sleep() is not counted.
+    Nested stages are cumulative, like cProfile's cumtime: time spent in OrderBook.update_order_book
+    is also part of the ws_processing stage.
+    """
+    def __init__(self, mode: str = 'stages', output_dir: str = None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'Unknown profiling mode {mode}, expected one of {PROFILE_MODES}')
+        self.mode = mode
+        self.output_dir = output_dir or os.path.join(PROJECT_DIR, 'data', 'profile')
+        # stage -> [calls, cpu_ns]
+        self.stages: dict[str, list[int]] = {}
+        self.full_profile = cProfile.Profile() if mode == 'full' else None
+
+    def start(self) -> None:
+        if self.full_profile is not None:
+            self.full_profile.enable()
+
+    def stop(self) -> None:
+        if self.full_profile is not None:
+            self.full_profile.disable()
+
+    def add(self, stage: str, cpu_ns: int) -> None:
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = [0, 0]
+        stats[0] += 1
+        stats[1] += cpu_ns
+
+    def wrap_coroutine(self, stage: str, coro):
+        """
+        Args:
+            stage (str): name of the pipeline stage
+            coro (coroutine): coroutine object to measure, e.g. ws_ingestion(websocket, buffer)
+        Returns:
+            coroutine - can be awaited or passed to asyncio.create_task in place of the original one
+        """
+        async def _profiled():
+            return await _ProfiledCoroutine(self, stage, coro)
+        return _profiled()
+
+    def wrap_async_function(self, stage: str, function):
+        @functools.wraps(function)
+        async def _profiled(*args, **kwargs):
+            return await _ProfiledCoroutine(self, stage, function(*args, **kwargs))
+        _profiled.__wrapped_for_profiling__ = function
+        return _profiled
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict - {stage: {'calls': int, 'cpu_s': float}}
+        """
+        return {stage: {'calls': calls, 'cpu_s': cpu_ns / 1e9} for stage, (calls, cpu_ns) in self.stages.items()}
+
+    def dump(self) -> list[str]:
+        """
+        Writes the per-stage stats (and the full cProfile in 'full' mode) in the marshal format
+        used by pstats, so they can be opened with pstats, snakeviz, tuna etc.
+        Returns:
+            list[str] - paths of the written files
+        """
+        self.stop()
+        os.makedirs(self.output_dir, exist_ok=True)
+        # pstats format: {(file, line, function): (primitive calls, calls, tottime, cumtime, callers)}
+        stats = {('<stage>', 0, stage): (calls, calls, cpu_ns / 1e9, cpu_ns / 1e9, {})
+                 for stage, (calls, cpu_ns) in self.stages.items()}
+        stages_path = os.path.join(self.output_dir, 'stages.prof')
+        with open(stages_path, 'wb') as file:
+            marshal.dump(stats, file)
+        paths = [stages_path]
+        if self.full_profile is not None:
+            full_path = os.path.join(self.output_dir, 'full.prof')
+            self.full_profile.dump_stats(full_path)
+            paths.append(full_path)
+        for stage, values in sorted(self.report().items()):
+            logger.info('Profile stage %s: calls=%d cpu=%.4fs', stage, values['calls'], values['cpu_s'])
+        return paths
+
+
+class _ProfiledCoroutine:
+    """
+    Awaitable which drives the wrapped coroutine itself and measures the CPU time of every step
+    """
+    __slots__ = ('profiler', 'stage', 'coro')
+
+    def __init__(self, profiler: StageProfiler, stage: str, coro):
+        self.profiler = profiler
+        self.stage = stage
+        self.coro = coro
+
+    def __await__(self):
+        send_value, error = None, None
+        while True:
+            start = time.thread_time_ns()
+            try:
+                if error is None:
+                    yielded = self.coro.send(send_value)
+                else:
+                    yielded = self.coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profiler.add(self.stage, time.thread_time_ns() - start)
+            try:
+                send_value, error = (yield yielded), None
+            except BaseException as e:  # CancelledError has to reach the wrapped coroutine
+                send_value, error = None, e
+
+
+def get_profiler() -> StageProfiler | None:
+    """
+    Reads the LOB_PROFILE environment variable.
+    Returns:
+        StageProfiler if profiling is switched on, otherwise None (nothing is wrapped, no overhead)
+    """
+    mode = os.environ.get(PROFILE_ENV, '').strip().lower()
+    if not mode or mode in ('0', 'off', 'false'):
+        return None
+    if mode in ('1', 'on', 'true'):
+        mode = 'stages'
+    return StageProfiler(mode, os.environ.get(PROFILE_DIR_ENV))
+
+
+def install_order_book_profiling(profiler: StageProfiler, order_book_class) -> None:
+    """
+    Wraps the OrderBook methods on the apply path, so each of them gets its own stage
+    (e.g. 'OrderBook.update_order_book'). Safe to call more than once.
+    """
+    for method_name in ORDER_BOOK_APPLY_METHODS:
+        method = getattr(order_book_class, method_name)
+        method = getattr(method, '__wrapped_for_profiling__', method)
+        setattr(order_book_class, method_name,
+                profiler.wrap_async_function(f'{order_book_class.__name__}.{method_name}', method))
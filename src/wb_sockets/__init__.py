@@ -1,4 +1,6 @@
 from .subscribing import run_the_subscriber
 from .ingesting import ws_ingestion
+from .redundant_ingesting import ws_redundant_ingestion, FirstArrivalDeduplicator
 from .syncing import fetch_order_book_snapshot, find_matching_message
-from .processing import ws_processing
\ No newline at end of file
+from .processing import ws_processing
+from .routing import FrameRouter, ws_routed_ingestion, combined_stream_uri
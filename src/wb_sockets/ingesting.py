@@ -1,17 +1,25 @@
+import logging
 from collections import deque
 import websockets 
 
-async def ws_ingestion(websocket: websockets.WebSocketClientProtocol,buffer: deque[str]):
+logger = logging.getLogger(__name__)
+
+async def ws_ingestion(websocket: websockets.WebSocketClientProtocol,buffer: deque[str], metrics = None):
     """
     Infinite function which receives order book prices and quantity updates and adds them to buffer
     Args:
         websocket (websockets.WebSocketClientProtocol): The WebSocket connection to Binance
-        buffer: a deque to keep incoming WebSocket stream messages
+        buffer: a deque to keep incoming WebSocket stream messages; for partial depth streams, where every frame
+            replaces the previous one, a deque(maxlen=1) keeps only the newest frame
+        metrics (PipelineMetrics, optional): if given, every frame is stamped with its receive time
     Returns:
         None 
     """
+    logger.info('Ingestion started')
     while True:
-        print ('Continue ingestion')
         response = await websocket.recv() 
-        print(response)
-        buffer.append(response)
\ No newline at end of file
+        # Per-frame log: level-guarded and lazily formatted, sampled by setup_logger
+        logger.debug('Frame received (buffer len=%d): %s', len(buffer), response)
+        if metrics is not None:
+            response = metrics.stamp(response)
+        buffer.append(response)
@@ -1,5 +1,9 @@
 import asyncio
 import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 
 class MissingMessageInIngestedStream(Exception):
@@ -13,18 +17,21 @@ async def to_do_processing_logic(order_book, message):
     - Updating bid and ask dictionaries (`ob_bids`, `ob_asks`).
     - Updating corresponding price lists (`ob_bids_prices`, `ob_asks_prices`)
     to ensure consistency between all order book attributes.
+    Readers on other threads see the book either before or after the update, see OrderBook.read.
     Args:
             order_book (OrderBook): The local copy of the order book to update
             message (dict): A WebSocket depth update message received from Binance
     Returns:
             None
     """
-    print("Trying to execute the logic")
-    order_book.ob_bids, order_book.ob_asks = await order_book.update_order_book(message)
-    order_book.ob_bids_prices, order_book.ob_asks_prices = (
-        await order_book.update_price_lists(message)
-    )
-    print("Processing is done")
+    order_book.begin_update()
+    try:
+        order_book.ob_bids, order_book.ob_asks = await order_book.update_order_book(message)
+        order_book.ob_bids_prices, order_book.ob_asks_prices = (
+            await order_book.update_price_lists(message)
+        )
+    finally:
+        order_book.end_update()
 
 
 async def is_continuous(curr_msg, buffer, max_num_skipped_msg = 2):
@@ -37,62 +44,74 @@ async def is_continuous(curr_msg, buffer, max_num_skipped_msg = 2):
             await asyncio.sleep(0.1)
 
         next_msg_first_id = int(json.loads(buffer[0])["U"])
-        print(f"Last update current {curr_msg['u']}, first update next {next_msg_first_id}")
 
         # If there is no id gaps between messages
         if next_msg_first_id == target_id:
-            print("Condition is met")
             return True
 
         # If there is a gap between msgs, we pop the problematic msg and put it on the shelf
         skipped_msg = buffer.popleft()
         shelf.append(skipped_msg)
-        print(f"Skipped a message. Shelf size: {len(shelf)}")
+        logger.warning('Skipped a message: last update current %s, first update next %s. Shelf size: %d',
+                       curr_msg['u'], next_msg_first_id, len(shelf))
 
-    print(f"Condition is not met after skipping {max_num_skipped_msg} messages")
+    logger.warning('Continuity condition is not met after skipping %d messages', max_num_skipped_msg)
     return False
 
 # Updating in progress - don't need len(buffer) < 2 check here since is_continuous handling this
-async def ws_processing(order_book, buffer):
+async def ws_processing(order_book, buffer, metrics = None, publisher = None, feed = None, recorder = None,
+                        bars = None):
     # Infinite processing function
+    # metrics (PipelineMetrics, optional) collects dequeue -> apply latencies and message counters
+    # publisher (TopOfBookPublisher, optional) shares the top levels with other processes after every update
+    # feed (DiffFeed, optional) fans the applied updates out to local subscribers as level diffs
+    # recorder (ColumnarWriter, optional) appends the top levels to a columnar store after every update
+    # bars (BarBuilder, optional) updates the time bars in progress from the update's event time
+    logger.info('Processing started')
     while True:
         if len(buffer) < 2:
             await asyncio.sleep(0.1)
             continue
 
         try:
-            print("Continue processing")
-            print(f"This is buffer (len={len(buffer)}): {buffer}")
-            # msg_str = buffer.popleft()
-            print(f"After popleft (len={len(buffer)}): {buffer}")
+            msg_str = buffer.popleft()
+            dequeued_at = time.time()
             curr_msg = json.loads(msg_str)
-            print("Parsed JSON OK")
-            if buffer:
-                print("Cats")
 
             if buffer:
-                print("Cats")
                 if await is_continuous(curr_msg, buffer):
-                    print(
-                        f"Printing the message I am going to process: {curr_msg}. It has type {type(curr_msg)}"
-                    )
                     await to_do_processing_logic(order_book, curr_msg)
+                    if publisher is not None:
+                        publisher.publish(order_book)
+                    if feed is not None:
+                        feed.publish(curr_msg, order_book)
+                    if recorder is not None:
+                        recorder.record(order_book, curr_msg)
+                    if bars is not None:
+                        bars.record(order_book, curr_msg)
+                    if metrics is not None:
+                        metrics.record_apply(msg_str, curr_msg, dequeued_at)
+                    # Only the update ids are logged, never the buffer or the whole message
+                    logger.debug('Applied update U=%s u=%s (buffer len=%d)', curr_msg['U'], curr_msg['u'], len(buffer))
                 else:
                     raise MissingMessageInIngestedStream(
                         "There is a gap between update IDs between the processed and following message. Current message haven't been processed and will stay in the buffer for retry."
                     )
-                await asyncio.sleep(0.1)
+                # Yield to the event loop so ws_ingestion can keep reading the socket
+                await asyncio.sleep(0)
 
         except MissingMessageInIngestedStream as e:
-            buffer.appendleft(curr_msg)
+            buffer.appendleft(msg_str)
+            if metrics is not None:
+                metrics.record_resync()
             await asyncio.sleep(0.1)
-            print(f"Continuity gap detected: {e}")
+            logger.error('Continuity gap detected: %s', e)
             raise
 
         except Exception as e:
-            buffer.appendleft(curr_msg)
+            buffer.appendleft(msg_str)
             await asyncio.sleep(0.1)
-            print(f"Something is wrong with processing: {e}")
+            logger.error('Something is wrong with processing: %s', e)
             raise
 
 
@@ -104,6 +123,64 @@ async def ws_processing(order_book, buffer):
 
 
 
+def partial_depth_diff(order_book, payload: dict, received_at: float = None) -> dict | None:
+    """
+    Turns a partial depth payload (<symbol>@depth<N>: the full top N levels, {"lastUpdateId", "bids", "asks"})
+    into a depth update message against the current book: the levels that changed, and qty 0 for the levels that
+    left the top N. Applying it with to_do_processing_logic replaces the book, and the level listeners,
+    feed, recorder and bars see an ordinary update.
+    Partial payloads carry no event time, 'E' is the receive time.
+    Returns:
+        dict - the depth update message, None if the payload isn't newer than the book
+    """
+    last_update_id = payload['lastUpdateId']
+    if order_book.last_update_id is not None and last_update_id <= order_book.last_update_id:
+        return None
+    message = {'e': 'depthUpdate',
+               'E': int((received_at if received_at is not None else time.time()) * 1000),
+               'U': (order_book.last_update_id or last_update_id - 1) + 1,
+               'u': last_update_id}
+    for side_key, levels, current in (('b', payload['bids'], order_book.ob_bids), ('a', payload['asks'], order_book.ob_asks)):
+        top = {float(price): float(qty) for price, qty in levels}
+        changes = [[price, qty] for price, qty in top.items() if current.get(price) != qty]
+        changes.extend([price, 0.0] for price in current if price not in top)
+        message[side_key] = changes
+    return message
+
+
+async def ws_partial_processing(order_book, buffer, metrics = None, publisher = None, feed = None, recorder = None,
+                                bars = None):
+    """
+    Infinite processing function of the partial-book mode (<symbol>@depth<N>@100ms streams): every frame is the
+    whole top N, so only the newest frame in the buffer is applied and the older ones are dropped unparsed.
+    No snapshot sync or continuity check is needed. The hooks are the ones of ws_processing.
+    """
+    logger.info('Partial-book processing started')
+    while True:
+        if not buffer:
+            await asyncio.sleep(0.01)
+            continue
+        msg_str = buffer.pop()
+        buffer.clear()
+        dequeued_at = time.time()
+        payload = json.loads(msg_str)
+        message = partial_depth_diff(order_book, payload, getattr(msg_str, 'received_at', None))
+        if message is not None:
+            await to_do_processing_logic(order_book, message)
+            if publisher is not None:
+                publisher.publish(order_book)
+            if feed is not None:
+                feed.publish(message, order_book)
+            if recorder is not None:
+                recorder.record(order_book, message)
+            if bars is not None:
+                bars.record(order_book, message)
+            if metrics is not None:
+                metrics.record_apply(msg_str, message, dequeued_at)
+            logger.debug('Replaced the top levels, lastUpdateId=%s', message['u'])
+        await asyncio.sleep(0)
+
+
 # Not working version - some adjusments to handle errors in the WebSockets stream
 # import asyncio
 # import json
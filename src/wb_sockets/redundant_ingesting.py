@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+def _read_int_after(frame: str, key: str) -> int | None:
+    position = frame.find(key)
+    if position < 0:
+        return None
+    position += len(key)
+    while position < len(frame) and frame[position] == ' ':
+        position += 1
+    end = position
+    while end < len(frame) and frame[end].isdigit():
+        end += 1
+    return int(frame[position:end]) if end > position else None
+
+
+def extract_update_ids(frame: str) -> tuple[int, int] | None:
+    """
+    Reads the first ('U') and final ('u') update IDs straight from the raw frame, without json.loads.
+    Deduplication only needs these two numbers, and most copies are dropped, so parsing
+    the whole frame for every copy would be wasted work.
+    Args:
+        frame (str): raw depth update frame
+    Returns:
+        tuple (U, u) or None for frames which are not depth updates (e.g. subscription confirmations)
+    """
+    first_update_id = _read_int_after(frame, '"U":')
+    final_update_id = _read_int_after(frame, '"u":')
+    if first_update_id is None or final_update_id is None:
+        return None
+    return first_update_id, final_update_id
+
+
+class ConnectionStats:
+    """
+    Lead/lag statistics of one connection of the redundant ingestion
+    wins       - frames from this connection which arrived first and were forwarded to the buffer
+    duplicates - frames which arrived after the copy from another connection and were dropped
+    lag        - how late (microseconds) the dropped copies were compared to the forwarded copy
+    """
+    def __init__(self):
+        self.wins = 0
+        self.duplicates = 0
+        self.lag = LatencyHistogram()
+        self.connected = True
+
+    def snapshot(self) -> dict:
+        lag = self.lag.snapshot()
+        total = self.wins + self.duplicates
+        return {'wins': self.wins,
+                'duplicates': self.duplicates,
+                'lead_ratio': self.wins / total if total else 0.0,
+                'lag_p50_ms': lag['p50_ms'],
+                'lag_p99_ms': lag['p99_ms'],
+                'connected': self.connected}
+
+
+class FirstArrivalDeduplicator:
+    """
+    Merges the frames of several connections to the same depth stream:
+    the first copy of every update is appended to the buffer, later copies are dropped.
+    Binance sends the updates of a stream in order on every connection, so a frame is a copy
+    when its final update ID 'u' is not greater than the last forwarded one.
+    """
+    def __init__(self, buffer: deque[str], num_connections: int, metrics = None, arrivals_to_keep: int = 1024):
+        self.buffer = buffer
+        self.metrics = metrics
+        self.last_forwarded_id = None
+        self.stats = [ConnectionStats() for _ in range(num_connections)]
+        # final update ID -> (connection, monotonic arrival time) of the forwarded copy
+        self._arrivals: dict[int, tuple[int, float]] = {}
+        self._arrival_order: deque[int] = deque()
+        self._arrivals_to_keep = arrivals_to_keep
+
+    def accept(self, connection_id: int, frame: str) -> bool:
+        """
+        Args:
+            connection_id (int): index of the connection the frame came from
+            frame (str): raw frame
+        Returns:
+            bool - True if the frame was forwarded to the buffer, False if it was dropped
+        """
+        now = time.monotonic()
+        update_ids = extract_update_ids(frame)
+        if update_ids is None:
+            # Subscription confirmations etc. come from every connection and aren't needed downstream
+            return False
+        final_update_id = update_ids[1]
+
+        if self.last_forwarded_id is not None and final_update_id <= self.last_forwarded_id:
+            stats = self.stats[connection_id]
+            stats.duplicates += 1
+            first_arrival = self._arrivals.get(final_update_id)
+            if first_arrival is not None:
+                stats.lag.record((now - first_arrival[1]) * 1e6)
+            return False
+
+        self.last_forwarded_id = final_update_id
+        self.stats[connection_id].wins += 1
+        self._arrivals[final_update_id] = (connection_id, now)
+        self._arrival_order.append(final_update_id)
+        if len(self._arrival_order) > self._arrivals_to_keep:
+            self._arrivals.pop(self._arrival_order.popleft(), None)
+
+        if self.metrics is not None:
+            frame = self.metrics.stamp(frame)
+        self.buffer.append(frame)
+        return True
+
+    def snapshot(self) -> list[dict]:
+        return [stats.snapshot() for stats in self.stats]
+
+
+async def _receive_loop(websocket, connection_id: int, deduplicator: FirstArrivalDeduplicator) -> None:
+    while True:
+        frame = await websocket.recv()
+        deduplicator.accept(connection_id, frame)
+
+
+async def ws_redundant_ingestion(websockets_list: list, buffer: deque[str], metrics = None,
+                                 deduplicator: FirstArrivalDeduplicator = None) -> None:
+    """
+    Infinite function which receives the same depth stream over several connections and adds
+    the first copy of every update to the buffer. When a connection fails, the others keep feeding
+    the buffer (hot failover, no resync needed); the function raises only when all of them failed.
+    Args:
+        websockets_list (list): subscribed WebSocket connections to the same stream
+        buffer (collections.deque[str]): incoming WebSocket stream messages waiting to be processed
+        metrics (PipelineMetrics, optional): stamps forwarded frames with their receive time
+        deduplicator (FirstArrivalDeduplicator, optional): pass one in to read the lead/lag stats
+    Returns:
+        None
+    """
+    if deduplicator is None:
+        deduplicator = FirstArrivalDeduplicator(buffer, len(websockets_list), metrics)
+    tasks = {asyncio.create_task(_receive_loop(websocket, connection_id, deduplicator)): connection_id
+             for connection_id, websocket in enumerate(websockets_list)}
+    logger.info('Redundant ingestion started with %d connections', len(tasks))
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                connection_id = tasks[task]
+                deduplicator.stats[connection_id].connected = False
+                logger.warning('Connection %d of the redundant ingestion stopped: %s', connection_id, task.exception())
+        raise ConnectionError('All connections of the redundant ingestion have stopped')
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
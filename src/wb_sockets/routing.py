@@ -0,0 +1,136 @@
+import logging
+from collections import deque
+from wb_sockets.subscribing import partial_depth_stream
+
+logger = logging.getLogger(__name__)
+
+COMBINED_STREAM_URI = 'wss://stream.binance.com:9443/stream'
+DEPTH_STREAM_SUFFIX = '@depth@100ms'
+# Binance allows at most 1024 streams on a single connection
+MAX_STREAMS_PER_CONNECTION = 1024
+
+
+def symbol_stream(symbol: str, stream_suffix: str = DEPTH_STREAM_SUFFIX, partial_levels: int = 0) -> str:
+    """
+    Returns:
+        str - stream name of the symbol on a combined connection, its partial depth stream when partial_levels is set
+    """
+    if partial_levels:
+        return partial_depth_stream(symbol, partial_levels)
+    return f'{symbol.lower()}{stream_suffix}'
+
+
+def combined_stream_uri(symbols, base_uri: str = COMBINED_STREAM_URI, stream_suffix: str = DEPTH_STREAM_SUFFIX,
+                        partial_depth: dict = None) -> str:
+    """
+    Args:
+        symbols (iterable of str): trading pairs, e.g. ['BTCUSDT', 'ETHUSDT']
+        base_uri (str): combined stream endpoint
+        stream_suffix (str): stream type appended to every lower-case symbol
+        partial_depth (dict, optional): upper-case symbol -> levels, these symbols get a partial depth stream instead
+    Returns:
+        str - e.g. wss://stream.binance.com:9443/stream?streams=btcusdt@depth@100ms/ethusdt@depth@100ms
+    """
+    partial_depth = partial_depth or {}
+    streams = [symbol_stream(symbol, stream_suffix, partial_depth.get(symbol.upper(), 0)) for symbol in symbols]
+    if not streams:
+        raise ValueError('At least one symbol is required')
+    if len(streams) > MAX_STREAMS_PER_CONNECTION:
+        raise ValueError(f'{len(streams)} streams requested, a connection carries at most {MAX_STREAMS_PER_CONNECTION}')
+    return f"{base_uri}?streams={'/'.join(streams)}"
+
+
+def extract_symbol(frame: str) -> str | None:
+    """
+    Reads the symbol ('s') straight from the raw frame, without json.loads: the router only needs
+    this one field and the depth update itself is parsed later by ws_processing anyway.
+    Args:
+        frame (str): raw frame, combined ({"stream": ..., "data": {...}}) or plain depth update
+    Returns:
+        str or None for frames without a symbol (e.g. subscription confirmations)
+    """
+    position = frame.find('"s":')
+    if position < 0:
+        return None
+    start = frame.find('"', position + 4)
+    end = frame.find('"', start + 1)
+    if start < 0 or end < 0:
+        return None
+    return frame[start + 1:end]
+
+
+def extract_stream_symbol(frame: str) -> str | None:
+    """
+    Reads the symbol from the stream name of a combined frame ({"stream": "btcusdt@depth20@100ms", ...}),
+    for the events without an 's' field, i.e. the partial depth payloads
+    Returns:
+        str - upper-case symbol, or None if the frame isn't wrapped
+    """
+    if not frame.startswith('{"stream":"'):
+        return None
+    end = frame.find('@', 11)
+    if end < 0:
+        return None
+    return frame[11:end].upper()
+
+
+def unwrap_combined_frame(frame: str) -> str:
+    """
+    Combined streams wrap every event: {"stream": "<name>", "data": <depth update>}.
+    Returns the raw depth update, so the per-symbol pipeline sees the same frames as on a single stream.
+    """
+    position = frame.find('"data":')
+    if position < 0:
+        return frame
+    return frame[position + 7:frame.rfind('}')]
+
+
+class FrameRouter:
+    """
+    Routes the frames of one combined-stream connection into per-symbol buffers by their 's' field.
+    """
+    def __init__(self, buffers: dict[str, deque[str]], metrics: dict = None):
+        # symbol (upper case, as in the 's' field) -> buffer of that symbol's depth updates
+        self.buffers = buffers
+        # symbol -> PipelineMetrics, used to stamp the frames of that symbol
+        self.metrics = metrics or {}
+        self.routed = 0
+        self.unrouted = 0
+
+    def route(self, frame: str) -> bool:
+        """
+        Args:
+            frame (str): raw frame received from the combined stream
+        Returns:
+            bool - True if the frame was appended to a symbol buffer
+        """
+        symbol = extract_symbol(frame) or extract_stream_symbol(frame)
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            # Subscription confirmations, or a symbol nobody asked for
+            self.unrouted += 1
+            return False
+        frame = unwrap_combined_frame(frame)
+        metrics = self.metrics.get(symbol)
+        if metrics is not None:
+            frame = metrics.stamp(frame)
+        buffer.append(frame)
+        self.routed += 1
+        return True
+
+
+async def ws_routed_ingestion(websocket, router: FrameRouter) -> None:
+    """
+    Infinite function which receives the frames of a combined stream and routes them into the per-symbol buffers
+    Args:
+        websocket (websockets.WebSocketClientProtocol): connection to the combined stream
+        router (FrameRouter): per-symbol buffers and metrics
+    Returns:
+        None
+    """
+    logger.info('Routed ingestion started for %d symbols', len(router.buffers))
+    while True:
+        frame = await websocket.recv()
+        # Per-frame log: level-guarded and lazily formatted, sampled by setup_logger
+        logger.debug('Frame received: %s', frame)
+        router.route(frame)
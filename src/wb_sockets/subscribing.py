@@ -1,11 +1,31 @@
 import json
 import asyncio
+import logging
 
-async def _send_subscription_request(websocket) -> str:
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAMS = ('btcusdt@depth@100ms',)
+# Levels Binance offers as partial book depth streams
+PARTIAL_DEPTH_LEVELS = (5, 10, 20)
+
+
+def partial_depth_stream(symbol: str, levels: int = 20) -> str:
+    """
+    Returns:
+        str - name of the partial book depth stream of the symbol, e.g. 'btcusdt@depth20@100ms':
+        the full top `levels` levels every 100 ms, applied without snapshot sync (see ws_partial_processing)
+    """
+    if levels not in PARTIAL_DEPTH_LEVELS:
+        raise ValueError(f'Partial depth streams have {PARTIAL_DEPTH_LEVELS} levels, not {levels}')
+    return f'{symbol.lower()}@depth{levels}@100ms'
+
+
+async def _send_subscription_request(websocket, streams = DEFAULT_STREAMS) -> str:
     """
     Sends a subscription request to the Binance WebSocket for depth updates.
     Args:
         websocket (websockets.WebSocketClientProtocol): The WebSocket connection to Binance.
+        streams (iterable of str): stream names, e.g. 'btcusdt@depth@100ms', or partial_depth_stream() names
     Returns:
         A JSON-formatted response string from Binance, which is either:
         - subscription confirmation {"result": null, "id": 1}
@@ -29,16 +49,27 @@ async def _send_subscription_request(websocket) -> str:
                 ]
             ]
             }
+        - partial depth payload (partial book streams) {"lastUpdateId": 160, "bids": [...], "asks": [...]}
     """
-    await websocket.send(
-        json.dumps({
-            "method": "SUBSCRIBE",
-            "params": ["btcusdt@depth@100ms"], 
-            "id": 1}))
+    await send_stream_request(websocket, 'SUBSCRIBE', streams)
     response = await websocket.recv()
     return (response)
 
 
+async def send_stream_request(websocket, method: str, streams, request_id: int = 1) -> None:
+    """
+    Sends a SUBSCRIBE / UNSUBSCRIBE request without waiting for the answer, for a connection whose frames
+    are already received elsewhere (e.g. by ws_routed_ingestion, which counts the {"result": null, "id": ...}
+    answer as unrouted)
+    Args:
+        websocket (websockets.WebSocketClientProtocol): The WebSocket connection to Binance.
+        method (str): 'SUBSCRIBE' or 'UNSUBSCRIBE'
+        streams (iterable of str): stream names, e.g. 'btcusdt@depth@100ms'
+        request_id (int): id Binance echoes in its answer
+    """
+    await websocket.send(json.dumps({"method": method, "params": list(streams), "id": request_id}))
+
+
 async def _is_subscription_confirmed(response) -> bool:
     """
     Parses the response string and checks that expected dictionary keys are present 
@@ -50,27 +81,31 @@ async def _is_subscription_confirmed(response) -> bool:
     try:
         response_dict = json.loads(response)
     except json.JSONDecodeError as e:
-        print (f'Invalid format of server response: {e}') 
+        logger.warning('Invalid format of server response: %s', e)
         return False  
          
     if response_dict.keys() == {'result','id'}:
         return True
     elif response_dict.get('e') == "depthUpdate":
         return True
+    elif 'lastUpdateId' in response_dict:
+        # Partial depth streams send the top levels without an event type
+        return True
     return False
 
 
-async def run_the_subscriber(websocket):
+async def run_the_subscriber(websocket, streams = DEFAULT_STREAMS):
     """
     Repeatedly sends a subscription request to the Binance WebSocket for depth updates 
     until the subscription is confirmed.
     Args:
         websocket (websockets.WebSocketClientProtocol): The WebSocket connection to Binance.
+        streams (iterable of str): stream names, e.g. 'btcusdt@depth@100ms'
     Returns:
         None   
     """
-    response = await _send_subscription_request(websocket)
+    response = await _send_subscription_request(websocket, streams)
     while not await _is_subscription_confirmed(response):
         await asyncio.sleep(0.1)
-        response = await _send_subscription_request(websocket)
-    print ('Subscription is confirmed')  
\ No newline at end of file
+        response = await _send_subscription_request(websocket, streams)
+    logger.info('Subscription is confirmed')
\ No newline at end of file
@@ -1,8 +1,11 @@
 import aiohttp
 import asyncio
 import json
+import logging
 from collections import deque
 
+logger = logging.getLogger(__name__)
+
 async def get_first_depth_update_id(buffer: deque[str]) -> int:
     """
     Loops through messages in the buffer till finds a valid depth update message.
@@ -21,43 +24,91 @@ async def get_first_depth_update_id(buffer: deque[str]) -> int:
         except json.JSONDecodeError:
             continue    
         if 'U' in parsed:
-            print(f'First depth update message in the stream is {parsed}')
+            logger.info('First depth update message in the stream has U=%s', parsed["U"])
             return parsed["U"]
         else:
-            print(f'Skipping non-depthUpdate message: {parsed}')
+            logger.debug('Skipping non-depthUpdate message: %s', message)
         await asyncio.sleep(0.01)
 
-async def get_order_book() -> tuple [dict, int]:
+DEFAULT_SYMBOL = 'BTCUSDT'
+SNAPSHOT_URL = 'https://api.binance.com/api/v3/depth'
+
+
+# Weight of GET /api/v3/depth by limit: (highest limit, weight), and the IP weight limit per minute
+DEPTH_REQUEST_WEIGHTS = ((100, 5), (500, 25), (1000, 50), (5000, 250))
+REQUEST_WEIGHT_LIMIT = 6000
+USED_WEIGHT_HEADER = 'X-MBX-USED-WEIGHT-1M'
+
+
+def depth_request_weight(limit: int) -> int:
+    """
+    Returns:
+        int - REST API weight of one order book snapshot request with this limit
+    """
+    for max_limit, weight in DEPTH_REQUEST_WEIGHTS:
+        if limit <= max_limit:
+            return weight
+    raise ValueError(f'Snapshot limit {limit} is above the maximum of {DEPTH_REQUEST_WEIGHTS[-1][0]}')
+
+
+async def request_depth_snapshot(session: aiohttp.ClientSession, symbol: str = DEFAULT_SYMBOL,
+                                 limit: int = 20) -> tuple[dict, int | None]:
+    """
+    Args:
+        session (aiohttp.ClientSession): pooled session
+        symbol (str): trading pair, e.g. 'BTCUSDT'
+        limit (int): number of levels per side
+    Returns:
+        tuple:
+            snapshot (dict): parsed JSON order book snapshot
+            used_weight (int | None): weight used by this IP in the current minute, as reported by Binance
+    """
+    try:
+        async with session.get(SNAPSHOT_URL, params={'symbol': symbol.upper(), 'limit': limit}) as response:
+            response.raise_for_status()
+            used_weight = response.headers.get(USED_WEIGHT_HEADER)
+            return await response.json(), int(used_weight) if used_weight else None
+    except aiohttp.ClientError as e:
+        logger.error('Error fetching the order book snapshot: %s', e)
+        raise
+    except aiohttp.ContentTypeError as e:
+        logger.error('The server response file is not a valid json: %s', e)
+        raise
+    except Exception as e:
+        logger.error('An error occurred fetching the order book copy: %s', e)
+        raise
+
+
+async def _request_order_book(session: aiohttp.ClientSession, symbol: str = DEFAULT_SYMBOL) -> dict:
+    snapshot, _ = await request_depth_snapshot(session, symbol)
+    return snapshot
+
+
+async def get_order_book(session: aiohttp.ClientSession = None, symbol: str = DEFAULT_SYMBOL) -> tuple [dict, int]:
     """
     Sends a request to get a copy of the order book from Binance REST API using aiohttp.ClientSession()
     to avoid blocking the event loop. This allows ws_ingestion to run simultaneously with this function.
-    Saves the received JSON locally at the path specified by 'path_initial_shapshot'.
-    Extracts and returns the 'lastUpdateId' of the saved order book copy.
+    Extracts and returns the 'lastUpdateId' of the order book copy.
     This ID is used to synchronize the order book with the WebSocket depth stream.
-
+    Args:
+        session (aiohttp.ClientSession, optional): pooled session to reuse a warm connection;
+            if not given a new session (and connection) is created for this request
+        symbol (str): trading pair, e.g. 'BTCUSDT'
     Returns:
         tuple:
             snapshot (dict): parsed JSON order book snapshot from Binance REST API
             order_book_last_update_id (int): the last update ID from the REST API snapshot of the order book
     """
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get('https://api.binance.com/api/v3/depth?symbol=BTCUSDT&limit=20') as response:
-                response.raise_for_status()
-                snapshot = await response.json()
-        except aiohttp.ClientError as e:
-            print (f'Error fetching the order book snapshot: {e}') 
-            raise
-        except aiohttp.ContentTypeError as e:
-            print(f'The server response file is not a valid json: {e}') 
-            raise
-        except Exception as e:
-            print(f'An error occurred fetching the order book copy: {e}')
-            raise
+    if session is not None:
+        snapshot = await _request_order_book(session, symbol)
+    else:
+        async with aiohttp.ClientSession() as session:
+            snapshot = await _request_order_book(session, symbol)
     return snapshot, snapshot.get("lastUpdateId")
 
 
-async def fetch_order_book_snapshot(buffer) -> tuple [dict, int]:
+async def fetch_order_book_snapshot(buffer, session: aiohttp.ClientSession = None, prefetched: asyncio.Future = None,
+                                    symbol: str = DEFAULT_SYMBOL, request = None) -> tuple [dict, int]:
     """
     Continuously requests a copy of the order book from the Binance REST API and compares
     its "lastUpdateId" with the 'U' value (first update ID) from the earliest valid
@@ -67,19 +118,37 @@ async def fetch_order_book_snapshot(buffer) -> tuple [dict, int]:
     a valid snapshot has been found and is returned.
     Args:
         buffer (collections.deque[str]) - incoming WebSocket stream messages waiting to be processed
+        session (aiohttp.ClientSession, optional): pooled session used for the requests
+        prefetched (asyncio.Future, optional): snapshot request started before the stream was ready
+            (see order_book.startup); it is validated first and only re-requested if it is too old
+        symbol (str): trading pair of the depth stream in the buffer
+        request (callable, optional): request(symbol) -> (snapshot, lastUpdateId) used instead of get_order_book,
+            e.g. the fetch of a SnapshotScheduler shared by many symbols
     Returns:
         tuple:
             snapshot (dict): parsed JSON order book snapshot from Binance REST API
             order_book_last_update_id (int): the "lastUpdateId" of that snapshot
     """
     while True:
-        await asyncio.sleep (0.1)
-        snapshot, order_book_last_update_id = await get_order_book()  
+        snapshot = None
+        if prefetched is not None:
+            try:
+                snapshot, order_book_last_update_id = await prefetched
+            except Exception as e:
+                logger.warning('Prefetched order book snapshot failed, requesting a new one: %s', e)
+            prefetched = None
+        if snapshot is None and request is not None:
+            snapshot, order_book_last_update_id = await request(symbol)
+        elif snapshot is None:
+            snapshot, order_book_last_update_id = await get_order_book(session, symbol)
         first_received_message_id = await get_first_depth_update_id(buffer)
 
         if order_book_last_update_id >= first_received_message_id:
-            print(f'A valid snapshot of the order book is found')
+            logger.info('A valid snapshot of the order book is found, lastUpdateId=%s', order_book_last_update_id)
             return snapshot, order_book_last_update_id  
+        # The stream is already running, so the next snapshot will be recent enough - no need to wait
+        logger.info('Snapshot lastUpdateId=%s is older than the stream (U=%s), requesting a new one',
+                    order_book_last_update_id, first_received_message_id)
 
 
 async def find_matching_message(order_book_last_update_id, buffer) -> None:
@@ -97,7 +166,6 @@ async def find_matching_message(order_book_last_update_id, buffer) -> None:
     """
 
     while True:
-        await asyncio.sleep (0.1)
         while buffer:
             message = buffer[0]
            
@@ -113,9 +181,11 @@ async def find_matching_message(order_book_last_update_id, buffer) -> None:
 
             message_final_update_id = parsed ['u']
             if message_final_update_id > order_book_last_update_id:
-                print(f'Match is found: {parsed}')
+                logger.info('Match is found: U=%s u=%s', parsed['U'], parsed['u'])
                 return parsed
             else:
                 buffer.popleft()
-        print('No matching message found in the buffer yet.')
+        logger.debug('No matching message found in the buffer yet.')
+        # Checked before the first wait, so a matching message that is already buffered doesn't cost a poll interval
+        await asyncio.sleep(0.01)
 
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from wb_sockets.processing import ws_processing
+
+logger = logging.getLogger(__name__)
+
+
+class SpscRing:
+    """
+    Bounded single-producer / single-consumer queue of raw frames, without locks: a preallocated ring of slots,
+    a tail written only by the producer (ws_ingestion on the event loop) and a head written only by the consumer
+    (the processing thread). The producer fills the slot before it moves the tail, so the consumer never reads
+    a slot that is being written (each store is a single bytecode under the GIL, executed in program order).
+    It has the deque methods the syncing and processing code use, so it replaces the buffer deque unchanged:
+    append (producer), popleft / appendleft / [i] / iteration / clear (consumer), len (both).
+    Frames put back with appendleft go to a consumer-side stash, the producer never sees them.
+    When the ring is full new frames are dropped and counted, ws_processing then detects the gap and resyncs.
+    """
+    def __init__(self, capacity: int = 1 << 16):
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError(f'The capacity has to be a power of two, got {capacity}')
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._slots: list = [None] * capacity
+        # Next slot to read, written by the consumer only
+        self._head = 0
+        # Next slot to write, written by the producer only
+        self._tail = 0
+        self._stash: deque[str] = deque()
+        self.dropped = 0
+
+    def append(self, frame: str) -> bool:
+        """
+        Returns:
+            bool - False if the ring was full and the frame was dropped
+        """
+        tail = self._tail
+        if tail - self._head >= self.capacity:
+            self.dropped += 1
+            return False
+        self._slots[tail & self._mask] = frame
+        self._tail = tail + 1
+        return True
+
+    def popleft(self) -> str:
+        if self._stash:
+            return self._stash.popleft()
+        head = self._head
+        if head == self._tail:
+            raise IndexError('pop from an empty ring')
+        slot = head & self._mask
+        frame, self._slots[slot] = self._slots[slot], None
+        self._head = head + 1
+        return frame
+
+    def appendleft(self, frame: str) -> None:
+        self._stash.appendleft(frame)
+
+    def clear(self) -> None:
+        self._stash.clear()
+        while self._head != self._tail:
+            self.popleft()
+
+    def __len__(self) -> int:
+        return len(self._stash) + self._tail - self._head
+
+    def __getitem__(self, index: int) -> str:
+        stashed = len(self._stash)
+        if index < 0:
+            index += len(self)
+        if 0 <= index < stashed:
+            return self._stash[index]
+        position = self._head + index - stashed
+        if not 0 <= index or position >= self._tail:
+            raise IndexError('ring index out of range')
+        return self._slots[position & self._mask]
+
+    def __iter__(self):
+        yield from list(self._stash)
+        for position in range(self._head, self._tail):
+            yield self._slots[position & self._mask]
+
+
+class _LoopForwarder:
+    """
+    Calls target.publish on the event loop the pipeline runs on, for the hooks that are bound to it (the DiffFeed
+    wakes its subscribers with asyncio events). Calls keep their order.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, target):
+        self.loop = loop
+        self.target = target
+
+    def publish(self, *args) -> None:
+        self.loop.call_soon_threadsafe(self.target.publish, *args)
+
+
+async def ws_threaded_processing(order_book, buffer: SpscRing, metrics = None, publisher = None, feed = None,
+                                 recorder = None, bars = None):
+    """
+    ws_processing on a dedicated thread, so parsing and applying a burst of updates doesn't hold up websocket.recv()
+    in ws_ingestion: the ingestion appends the raw frames to an SpscRing on the event loop, the thread runs
+    ws_processing on its own event loop and owns the OrderBook from then on.
+    metrics, publisher, recorder and bars are called on the thread, right after the update they record;
+    the feed is published back on the calling event loop.
+    Ends like ws_processing, by raising its error; cancelling it stops the thread.
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    started = threading.Event()
+    thread_state = {}
+    if feed is not None:
+        feed = _LoopForwarder(loop, feed)
+
+    def _set_result(error: BaseException | None) -> None:
+        if done.done():
+            return
+        if error is None:
+            done.set_result(None)
+        else:
+            done.set_exception(error)
+
+    async def _thread_main():
+        thread_state['loop'] = asyncio.get_running_loop()
+        thread_state['task'] = asyncio.current_task()
+        started.set()
+        await ws_processing(order_book, buffer, metrics, publisher, feed, recorder, bars)
+
+    def _run():
+        error = None
+        try:
+            asyncio.run(_thread_main())
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            error = e
+        finally:
+            started.set()
+            loop.call_soon_threadsafe(_set_result, error)
+
+    thread = threading.Thread(target=_run, name='ws-processing', daemon=True)
+    thread.start()
+    logger.info('Processing thread started')
+    try:
+        await asyncio.shield(done)
+    except asyncio.CancelledError:
+        await loop.run_in_executor(None, started.wait)
+        if 'task' in thread_state:
+            try:
+                thread_state['loop'].call_soon_threadsafe(thread_state['task'].cancel)
+            except RuntimeError:
+                # The thread's loop already closed, the processing ended on its own
+                pass
+        await asyncio.gather(done, return_exceptions=True)
+        raise
+    finally:
+        await loop.run_in_executor(None, thread.join)
+        logger.info('Processing thread stopped')
@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Modules in src/ import each other as top level packages (e.g. `from wb_sockets import ...`),
+# the same way main.py sees them, so src/ has to be importable for the tests too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import pytest
+from order_book.order_book_class import OrderBook
+
+
+@pytest.fixture
+def make_order_book():
+    """
+    Factory of initialised OrderBooks: await make_order_book(bids, asks, last_update_id = 1, qty = 1),
+    a level is a (price, qty) pair or a bare price, which gets qty
+    """
+    async def _make(bids, asks, last_update_id = 1, qty = 1):
+        def levels(side):
+            return [[f"{price:.8f}", f"{level_qty:.8f}"]
+                    for price, level_qty in (level if isinstance(level, (tuple, list)) else (level, qty) for level in side)]
+        order_book = OrderBook({"lastUpdateId": last_update_id, "bids": levels(bids), "asks": levels(asks)})
+        await order_book.extract_order_book_prices()
+        return order_book
+    return _make
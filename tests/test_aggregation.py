@@ -0,0 +1,57 @@
+import pytest
+import math
+import random
+from collections import defaultdict
+from order_book.aggregation import AggregatedLadders
+from wb_sockets.processing import to_do_processing_logic
+
+
+def _aggregate(levels, bucket_size, is_bid):
+    # The full re-aggregation the ladders replace, in cents to stay exact
+    buckets = defaultdict(int)
+    size = round(bucket_size * 100)
+    for price, qty in levels.items():
+        cents = round(price * 100)
+        bucket = cents // size if is_bid else -(-cents // size)
+        buckets[bucket * size / 100] += round(qty * 1e8)
+    return sorted(((price, qty / 1e8) for price, qty in buckets.items()), reverse = is_bid)
+
+
+@pytest.mark.describe('Aggregated ladders')
+class TestAggregatedLadders:
+
+    @pytest.mark.it('groups bids down and asks up into buckets')
+    @pytest.mark.asyncio
+    async def test_grouping(self, make_order_book):
+        order_book = await make_order_book([(100.37, 1), (100.01, 2), (99.99, 3)], [(100.38, 1), (100.99, 2), (101.0, 4)])
+        ladders = AggregatedLadders(order_book, bucket_sizes = (0.1, 1))
+        assert ladders.top(1, 'bids') == [(100.0, 3.0), (99.0, 3.0)]
+        assert ladders.top(1, 'asks', 1) == [(101.0, 7.0)]
+        assert ladders.top(0.1, 'bids', 2) == [(100.3, 1.0), (100.0, 2.0)]
+        assert ladders.top(0.1, 'asks') == [(100.4, 1.0), (101.0, 6.0)]
+
+
+    @pytest.mark.it('matches a full re-aggregation while the book is updated')
+    @pytest.mark.asyncio
+    async def test_matches_reaggregation(self, make_order_book):
+        rng = random.Random(9)
+        order_book = await make_order_book([(1000 - i * 0.01, 1) for i in range(1, 300)], [(1000 + i * 0.01, 1) for i in range(300)])
+        sizes = (0.1, 1, 10)
+        ladders = AggregatedLadders(order_book, bucket_sizes = sizes)
+        for update_id in range(2, 1500):
+            def levels(center, sign):
+                return [[f"{center + sign * offset * 0.01:.8f}", rng.choice(["0", f"{rng.randint(1, 500) / 1000:.8f}"])]
+                        for offset in rng.sample(range(400), 5)]
+            message = {"U": update_id, "u": update_id, "b": levels(999.99, -1), "a": levels(1000, 1)}
+            await to_do_processing_logic(order_book, message)
+            if update_id % 50:
+                continue
+            for size in sizes:
+                for side, levels_by_price, is_bid in (('bids', order_book.ob_bids, True), ('asks', order_book.ob_asks, False)):
+                    expected = _aggregate(levels_by_price, size, is_bid)
+                    assert [price for price, _ in ladders.ladder(size, side)] == pytest.approx([price for price, _ in expected])
+                    assert all(math.isclose(qty, expected_qty, abs_tol = 1e-9)
+                               for (_, qty), (_, expected_qty) in zip(ladders.ladder(size, side), expected))
+        # Every level of a bucket removed: the bucket is gone
+        await to_do_processing_logic(order_book, {"U": 1500, "u": 1500, "a": [], "b": [[f"{price:.8f}", "0"] for price in list(order_book.ob_bids)]})
+        assert ladders.top(10, 'bids') == []
@@ -0,0 +1,66 @@
+import pytest
+import math
+from order_book.bars import BarBuilder
+from order_book.columnar_store import ColumnarReader, np
+from wb_sockets.processing import to_do_processing_logic
+
+
+async def _apply(order_book, bars, update_id, event_time, bids = (), asks = ()):
+    message = {"E": event_time, "U": update_id, "u": update_id,
+               "b": [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in bids],
+               "a": [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in asks]}
+    await to_do_processing_logic(order_book, message)
+    bars.record(order_book, message)
+
+
+@pytest.mark.describe('Bar builder')
+class TestBarBuilder:
+
+    @pytest.mark.it('builds OHLC and time-weighted bars of several intervals from the event time')
+    @pytest.mark.asyncio
+    async def test_bars(self, make_order_book):
+        order_book = await make_order_book([(99, 1)], [(101, 1)])
+        bars = BarBuilder(intervals_ms = (100, 1000))
+        completed = []
+        bars.add_listener(completed.append)
+        # mid 100 from 1000 ms, 101 from 1040 ms, 99 from 1070 ms
+        await _apply(order_book, bars, 2, 1000)
+        await _apply(order_book, bars, 3, 1040, bids = [(99, 0), (100, 1)], asks = [(101, 0), (102, 1)])
+        await _apply(order_book, bars, 4, 1070, bids = [(98, 1), (100, 0)], asks = [(100, 1), (102, 0)])
+        assert completed == []
+        # Completes the first 100 ms bar, skips the empty ones
+        await _apply(order_book, bars, 5, 1450, bids = [(98, 3)])
+        bar = completed[0]
+        assert (bar.interval_ms, bar.start_time, bar.updates) == (100, 1000, 3)
+        assert bar.mid.open == 100 and bar.mid.high == 101 and bar.mid.low == 99 and bar.mid.close == 99
+        assert bar.mid.twap == pytest.approx((100 * 40 + 101 * 30 + 99 * 30) / 100)
+        assert bar.spread.close == 2
+        assert bar.imbalance.close == 0
+        # The next bar opens with the values in effect at its start
+        await _apply(order_book, bars, 6, 2010)
+        bar_100ms, bar_1s = completed[1:]
+        assert (bar_100ms.start_time, bar_100ms.updates, bar_100ms.mid.open) == (1400, 1, 99)
+        assert bar_100ms.imbalance.close == pytest.approx(0.5)
+        assert bar_100ms.microprice.close == pytest.approx((98 * 1 + 100 * 3) / 4)
+        assert (bar_1s.start_time, bar_1s.updates) == (1000, 4)
+        assert bar_1s.mid.twap == pytest.approx((100 * 40 + 101 * 30 + 99 * 930) / 1000)
+        assert bars.snapshot()['bars'] == {100: 2, 1000: 1}
+        bars.close()
+        assert order_book.level_listeners == []
+
+
+    @pytest.mark.it('stores the completed bars of every interval in a columnar store')
+    @pytest.mark.asyncio
+    async def test_store(self, tmp_path, make_order_book):
+        order_book = await make_order_book([(99, 1)], [(101, 1)])
+        bars = BarBuilder(intervals_ms = (100,), store_directory = str(tmp_path))
+        for index in range(5):
+            await _apply(order_book, bars, index + 2, 1000 + 100 * index)
+        bars.close()
+        reader = ColumnarReader(str(tmp_path / 'bars_100ms'))
+        rows = reader.by_event_time(1100, 1300)
+        start_times = rows['start_time'] if np is None else rows['start_time'].tolist()
+        assert list(start_times) == [1100, 1200, 1300]
+        mid = list(rows['mid'] if np is None else rows['mid'].reshape(-1))
+        assert mid == [100.0] * 15
+        assert not any(math.isnan(value) for value in mid)
@@ -0,0 +1,62 @@
+import pytest
+import random
+from order_book.book_diff import diff_order_books
+
+
+def _naive_diff(old, new):
+    # Reference implementation on the dicts
+    result = []
+    for old_side, new_side in ((old.ob_bids, new.ob_bids), (old.ob_asks, new.ob_asks)):
+        added = {price: qty for price, qty in new_side.items() if price not in old_side}
+        removed = {price: qty for price, qty in old_side.items() if price not in new_side}
+        changed = {price: (old_side[price], new_side[price]) for price in old_side.keys() & new_side.keys()
+                   if old_side[price] != new_side[price]}
+        result.append((added, removed, changed))
+    return result
+
+
+@pytest.mark.describe('Order book diff')
+class TestDiffOrderBooks:
+
+    @pytest.mark.it('returns added, removed and changed levels best first')
+    @pytest.mark.asyncio
+    async def test_diff(self, make_order_book):
+        old = await make_order_book([(99, 1), (98, 2), (97, 3)], [(101, 1), (102, 2)])
+        new = await make_order_book([(99.5, 4), (99, 1), (97, 5)], [(101, 1), (103, 2)])
+        difference = await old.diff(new)
+        assert difference.bids.added == [(99.5, 4)]
+        assert difference.bids.removed == [(98, 2)]
+        assert difference.bids.changed == [(97, 3, 5)]
+        assert difference.bids.unchanged == 1
+        assert (difference.asks.added, difference.asks.removed, difference.asks.changed) == ([(103, 2)], [(102, 2)], [])
+        summary = difference.summary()
+        assert summary['bids']['abs_qty_change'] == 4 + 2 + 2
+        assert not summary['is_equal']
+        assert difference.levels() == ({99.5: 4, 98: 0.0, 97: 5}, {102: 0.0, 103: 2})
+
+
+    @pytest.mark.it('matches a dict-based diff on random books')
+    @pytest.mark.asyncio
+    async def test_matches_naive(self, make_order_book):
+        rng = random.Random(5)
+        for _ in range(20):
+            def side(low, high):
+                return [(price, rng.choice([1.0, 2.0])) for price in rng.sample(range(low, high), rng.randint(1, 30))]
+            old, new = await make_order_book(side(1, 50), side(51, 100)), await make_order_book(side(1, 50), side(51, 100))
+            difference = diff_order_books(old, new)
+            for side_diff, (added, removed, changed) in zip((difference.bids, difference.asks), _naive_diff(old, new)):
+                assert dict(side_diff.added) == added
+                assert dict(side_diff.removed) == removed
+                assert {price: (old_qty, new_qty) for price, old_qty, new_qty in side_diff.changed} == changed
+
+
+    @pytest.mark.it('compares only down to the shallower top N level of the two books')
+    @pytest.mark.asyncio
+    async def test_depth(self, make_order_book):
+        local = await make_order_book([(99 - i, 1) for i in range(50)], [(101 + i, 1) for i in range(50)])
+        rest_snapshot = await make_order_book([(99 - i, 1) for i in range(5)], [(101, 2)] + [(102 + i, 1) for i in range(4)])
+        assert not diff_order_books(local, rest_snapshot).is_equal
+        difference = diff_order_books(local, rest_snapshot, depth = 5)
+        assert difference.bids.unchanged == 5 and not difference.bids.added and not difference.bids.removed
+        assert difference.asks.changed == [(101, 1, 2)] and difference.asks.unchanged == 4
+        assert diff_order_books(local, local, depth = 5).is_equal
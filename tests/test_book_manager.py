@@ -0,0 +1,283 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+from collections import deque
+import websockets
+# Imported the way main.py sees them (src/ on sys.path, see conftest.py), so that
+# monkeypatching affects the modules the manager actually uses
+from order_book.book_manager import BookManager
+from wb_sockets import syncing as syncing_module
+from wb_sockets.routing import combined_stream_uri, extract_symbol, extract_stream_symbol, unwrap_combined_frame, FrameRouter
+
+
+def _combined_frame(symbol, first_update_id, final_update_id):
+    return json.dumps({"stream": f"{symbol.lower()}@depth@100ms",
+                       "data": {"e": "depthUpdate", "E": 1753786825814, "s": symbol,
+                                "U": first_update_id, "u": final_update_id,
+                                "b": [["100.00000000", "1.00000000"]], "a": []}}, separators=(',', ':'))
+
+
+def _partial_frame(symbol, last_update_id, best_bid = 100.0):
+    return json.dumps({"stream": f"{symbol.lower()}@depth5@100ms",
+                       "data": {"lastUpdateId": last_update_id,
+                                "bids": [[f"{best_bid - i:.8f}", "1.00000000"] for i in range(5)],
+                                "asks": [[f"{best_bid + 1 + i:.8f}", "1.00000000"] for i in range(5)]}},
+                      separators=(',', ':'))
+
+
+@pytest_asyncio.fixture
+async def stand_in_server():
+    """
+    Local stand-in for the Binance combined stream: interleaves BTCUSDT and ETHUSDT depth updates,
+    ETHUSDT skips a few update IDs once, so only ETHUSDT has to resync.
+    `last_ids` is what the fake REST snapshot of each symbol reports.
+    """
+    last_ids = {'BTCUSDT': 1000, 'ETHUSDT': 5000}
+
+    async def handler(websocket):
+        sent = 0
+        try:
+            while True:
+                for symbol in last_ids:
+                    first_update_id = last_ids[symbol] + 1
+                    if symbol == 'ETHUSDT' and sent == 30:
+                        first_update_id += 7
+                    last_ids[symbol] = first_update_id + 2
+                    await websocket.send(_combined_frame(symbol, first_update_id, last_ids[symbol]))
+                sent += 1
+                await asyncio.sleep(0.005)
+        except websockets.ConnectionClosed:
+            pass
+
+    async with websockets.serve(handler, '127.0.0.1', 0) as server:
+        yield f'ws://127.0.0.1:{server.sockets[0].getsockname()[1]}/stream', last_ids
+
+
+@pytest.fixture
+def fake_rest(monkeypatch):
+    requested = []
+
+    def install(last_ids):
+        # The manager's snapshot scheduler sends the requests
+        async def fake_request_depth_snapshot(session, symbol = 'BTCUSDT', limit = 20):
+            requested.append(symbol)
+            return {"lastUpdateId": last_ids[symbol],
+                    "bids": [["99.00000000", "2.00000000"]],
+                    "asks": [["101.00000000", "3.00000000"]]}, 10
+        monkeypatch.setattr(syncing_module, 'request_depth_snapshot', fake_request_depth_snapshot)
+    return install, requested
+
+
+@pytest.mark.describe('Combined stream routing')
+class TestRouting:
+
+    @pytest.mark.it('builds the combined stream URI from the symbols')
+    def test_combined_stream_uri(self):
+        assert (combined_stream_uri(['BTCUSDT', 'ethusdt'], 'wss://host/stream')
+                == 'wss://host/stream?streams=btcusdt@depth@100ms/ethusdt@depth@100ms')
+        with pytest.raises(ValueError):
+            combined_stream_uri([])
+
+
+    @pytest.mark.it('subscribes the partial-book symbols to their top levels stream and routes it by stream name')
+    def test_partial_streams(self):
+        assert (combined_stream_uri(['BTCUSDT', 'ETHUSDT'], 'wss://host/stream', partial_depth = {'ETHUSDT': 10})
+                == 'wss://host/stream?streams=btcusdt@depth@100ms/ethusdt@depth10@100ms')
+        with pytest.raises(ValueError):
+            combined_stream_uri(['BTCUSDT'], partial_depth = {'BTCUSDT': 15})
+        frame = _partial_frame('ETHUSDT', 42)
+        assert extract_symbol(frame) is None and extract_stream_symbol(frame) == 'ETHUSDT'
+        buffers = {'ETHUSDT': deque(maxlen=1)}
+        router = FrameRouter(buffers)
+        assert router.route(_partial_frame('ETHUSDT', 1)) and router.route(frame)
+        assert [json.loads(payload)['lastUpdateId'] for payload in buffers['ETHUSDT']] == [42]
+
+
+    @pytest.mark.it('reads the symbol and unwraps the depth update without parsing the frame')
+    def test_extract_and_unwrap(self):
+        frame = _combined_frame('ETHUSDT', 7, 9)
+        assert extract_symbol(frame) == 'ETHUSDT'
+        assert json.loads(unwrap_combined_frame(frame)) == json.loads(frame)['data']
+        assert extract_symbol('{"result":null,"id":1}') is None
+
+
+    @pytest.mark.it('routes frames into the buffer of their symbol and counts the rest as unrouted')
+    def test_frame_router(self):
+        buffers = {'BTCUSDT': deque(), 'ETHUSDT': deque()}
+        router = FrameRouter(buffers)
+        assert router.route(_combined_frame('ETHUSDT', 1, 2))
+        assert not router.route(_combined_frame('BNBBTC', 1, 2))
+        assert not router.route('{"result":null,"id":1}')
+        assert len(buffers['ETHUSDT']) == 1 and not buffers['BTCUSDT']
+        assert (router.routed, router.unrouted) == (1, 2)
+
+
+@pytest.mark.describe('Multi-symbol book manager')
+class TestBookManager:
+
+    @pytest.mark.it('keeps every symbol in sync over one connection and resyncs only the symbol with a gap')
+    @pytest.mark.asyncio
+    async def test_independent_resync(self, stand_in_server, fake_rest):
+        uri, last_ids = stand_in_server
+        install, requested = fake_rest
+        install(last_ids)
+        manager = BookManager(['BTCUSDT', 'ETHUSDT'], base_uri = uri, backoff_base = 0.01, backoff_cap = 0.02)
+        task = asyncio.create_task(manager.run(session = object()))
+        await asyncio.sleep(1.0)
+        stats = manager.snapshot()
+        manager.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        btc, eth = stats['symbols']['BTCUSDT'], stats['symbols']['ETHUSDT']
+        assert btc['is_live'] and btc['syncs'] == 1 and btc['resyncs'] == 0
+        assert eth['is_live'] and eth['syncs'] >= 2 and eth['resyncs'] >= 1
+        assert btc['messages_applied'] > 0 and eth['messages_applied'] > 0
+        assert btc['memory_bytes'] > 0 and btc['cpu_s'] > 0
+        assert stats['reconnects'] == 0
+        assert requested.count('BTCUSDT') == 1
+        assert manager.order_book('btcusdt').ob_asks_prices == [101.0]
+
+
+    @pytest.mark.it('drops the book and syncs again when a resync is requested')
+    @pytest.mark.asyncio
+    async def test_requested_resync(self, stand_in_server, fake_rest):
+        uri, last_ids = stand_in_server
+        install, requested = fake_rest
+        install(last_ids)
+        manager = BookManager(['BTCUSDT'], base_uri = uri, backoff_base = 0.01, backoff_cap = 0.02)
+        task = asyncio.create_task(manager.run(session = object()))
+        await asyncio.sleep(0.3)
+        first_book = manager.order_book('BTCUSDT')
+        manager.request_resync('BTCUSDT')
+        await asyncio.sleep(0.3)
+        stats = manager.snapshot()
+        manager.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        btc = stats['symbols']['BTCUSDT']
+        assert btc['is_live'] and btc['syncs'] == 2 and btc['resyncs'] == 1
+        assert 'resync requested' in btc['last_error']
+        assert manager.order_book('BTCUSDT') is not first_book
+        assert requested.count('BTCUSDT') == 2
+
+
+    @pytest.mark.it('answers point-in-time queries from the history of every symbol')
+    @pytest.mark.asyncio
+    async def test_history(self, stand_in_server, fake_rest):
+        uri, last_ids = stand_in_server
+        install, _ = fake_rest
+        install(last_ids)
+        manager = BookManager(['BTCUSDT'], base_uri = uri, backoff_base = 0.01, backoff_cap = 0.02,
+                              history_options = {'checkpoint_every': 10})
+        task = asyncio.create_task(manager.run(session = object()))
+        await asyncio.sleep(0.5)
+        history = manager.books['BTCUSDT'].history
+        synced_at = history.first_update_id
+        manager.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert history.snapshot()['checkpoints'] >= 2
+        assert manager.book_at('BTCUSDT', synced_at).ob_bids == {99.0: 2.0}
+        assert manager.book_at('BTCUSDT', history.last_update_id).ob_bids == {99.0: 2.0, 100.0: 1.0}
+        with pytest.raises(KeyError):
+            manager.book_at('BTCUSDT', synced_at - 1)
+
+
+    @pytest.mark.it('runs a partial-book symbol from its payloads without REST snapshots')
+    @pytest.mark.asyncio
+    async def test_partial_book(self, fake_rest):
+        install, requested = fake_rest
+        install({'BTCUSDT': 1000})
+
+        async def handler(websocket):
+            try:
+                for update_id in range(1, 1000):
+                    await websocket.send(_partial_frame('SOLUSDT', update_id, 100.0 + update_id % 3))
+                    await asyncio.sleep(0.005)
+            except websockets.ConnectionClosed:
+                pass
+
+        async with websockets.serve(handler, '127.0.0.1', 0) as server:
+            uri = f'ws://127.0.0.1:{server.sockets[0].getsockname()[1]}/stream'
+            manager = BookManager(['SOLUSDT'], base_uri = uri, partial_depth = {'solusdt': 5},
+                                  backoff_base = 0.01, backoff_cap = 0.02)
+            assert manager.uri.endswith('solusdt@depth5@100ms')
+            task = asyncio.create_task(manager.run(session = object()))
+            await asyncio.sleep(0.3)
+            stats = manager.snapshot()
+            order_book = manager.order_book('SOLUSDT')
+            manager.stop()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        sol = stats['symbols']['SOLUSDT']
+        assert sol['is_live'] and sol['syncs'] == 1 and sol['partial_levels'] == 5 and sol['messages_applied'] > 10
+        assert requested == []
+        best_bid = order_book.ob_bids_prices[-1]
+        assert len(order_book.ob_bids) == len(order_book.ob_asks) == 5
+        assert order_book.ob_asks_prices[0] == best_bid + 1
+
+
+    @pytest.mark.it('adds and removes symbols on the live connection without resyncing the others')
+    @pytest.mark.asyncio
+    async def test_add_remove_symbol(self, fake_rest):
+        install, requested = fake_rest
+        last_ids = {'BTCUSDT': 1000, 'ETHUSDT': 5000}
+        install(last_ids)
+        connections, requests = [], []
+
+        async def handler(websocket):
+            # Serves the streams of the URI, then follows the SUBSCRIBE / UNSUBSCRIBE requests
+            streams = set(websocket.request.path.split('streams=')[1].split('/'))
+            connections.append(websocket.request.path)
+
+            async def follow_requests():
+                async for message in websocket:
+                    request = json.loads(message)
+                    requests.append((request['method'], request['params']))
+                    if request['method'] == 'SUBSCRIBE':
+                        streams.update(request['params'])
+                    else:
+                        streams.difference_update(request['params'])
+                    await websocket.send(json.dumps({"result": None, "id": request['id']}))
+
+            follower = asyncio.create_task(follow_requests())
+            try:
+                while True:
+                    for symbol in last_ids:
+                        if f'{symbol.lower()}@depth@100ms' in streams:
+                            last_ids[symbol] += 1
+                            await websocket.send(_combined_frame(symbol, last_ids[symbol], last_ids[symbol]))
+                    await asyncio.sleep(0.005)
+            except websockets.ConnectionClosed:
+                pass
+            finally:
+                follower.cancel()
+
+        async with websockets.serve(handler, '127.0.0.1', 0) as server:
+            uri = f'ws://127.0.0.1:{server.sockets[0].getsockname()[1]}/stream'
+            manager = BookManager(['BTCUSDT'], base_uri = uri, backoff_base = 0.01, backoff_cap = 0.02)
+            task = asyncio.create_task(manager.run(session = object()))
+            await asyncio.sleep(0.3)
+            await manager.add_symbol('ethusdt')
+            await asyncio.sleep(0.3)
+            added = manager.snapshot()
+            await manager.remove_symbol('BTCUSDT')
+            await asyncio.sleep(0.2)
+            removed = manager.snapshot()
+            with pytest.raises(ValueError):
+                await manager.remove_symbol('ETHUSDT')
+            manager.stop()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        assert len(connections) == 1 and added['reconnects'] == 0 == removed['reconnects']
+        assert requests == [('SUBSCRIBE', ['ethusdt@depth@100ms']), ('UNSUBSCRIBE', ['btcusdt@depth@100ms'])]
+        assert added['symbols']['BTCUSDT']['syncs'] == 1 and added['symbols']['ETHUSDT']['is_live']
+        assert list(removed['symbols']) == ['ETHUSDT'] and removed['symbols']['ETHUSDT']['syncs'] == 1
+        assert requested == ['BTCUSDT', 'ETHUSDT']
+        assert manager.uri == f'{uri}?streams=ethusdt@depth@100ms'
@@ -0,0 +1,119 @@
+import pytest
+import math
+import time
+from order_book.columnar_store import ColumnarReader, ColumnarWriter, np
+
+
+def _levels(best_bid, num_bids = 3, num_asks = 3):
+    # Bids and asks one unit apart around best_bid, quantities growing away from the touch
+    return ([(best_bid - i, i + 1) for i in range(num_bids)],
+            [(best_bid + 1 + i, i + 0.5) for i in range(num_asks)])
+
+
+def _flat(view):
+    # Values of a column view, arrays with numpy and flat memoryviews without it
+    return [float(value) for value in (view.reshape(-1) if np is not None else view)]
+
+
+def _wait_for_rows(writer, rows):
+    deadline = time.monotonic() + 2
+    while writer.rows < rows and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+@pytest.mark.describe('Columnar store')
+class TestColumnarStore:
+
+    @pytest.mark.it('stores the top levels per update and slices them by update id and event time')
+    @pytest.mark.asyncio
+    async def test_write_and_read(self, tmp_path, make_order_book):
+        writer = ColumnarWriter(str(tmp_path / 'BTCUSDT'), depth = 2, capacity = 4)
+        for index in range(10):
+            bids, asks = _levels(1000 + index, num_asks = 1 if index == 3 else 3)
+            writer.record(await make_order_book(bids, asks, last_update_id = 100 + 10 * index),
+                          {"E": 1_700_000_000_000 + 100 * index})
+        writer.close()
+        assert writer.snapshot()['rows'] == 10 and writer.snapshot()['capacity'] == 16
+
+        reader = ColumnarReader(str(tmp_path / 'BTCUSDT'))
+        assert reader.rows == 10 and reader.depth == 2
+        rows = reader.by_update_id(125, 150)
+        assert _flat(rows['update_id']) == [130, 140, 150]
+        assert _flat(rows['bid_price']) == [1003, 1002, 1004, 1003, 1005, 1004]
+        assert _flat(rows['bid_qty']) == [1, 2, 1, 2, 1, 2]
+        ask_prices = _flat(rows['ask_price'])
+        assert ask_prices[0] == 1004 and math.isnan(ask_prices[1])
+        rows = reader.by_event_time(1_700_000_000_250, 1_700_000_000_400)
+        assert _flat(rows['event_time']) == [1_700_000_000_300, 1_700_000_000_400]
+        assert _flat(reader.by_update_id(0, 50)['update_id']) == []
+        if np is not None:
+            assert rows['bid_price'].shape == (2, 2)
+        del rows
+        reader.close()
+
+
+    @pytest.mark.it('is readable while the writer appends and grows the files')
+    @pytest.mark.asyncio
+    async def test_read_while_writing(self, tmp_path, make_order_book):
+        directory = str(tmp_path / 'ETHUSDT')
+        writer = ColumnarWriter(directory, depth = 3, capacity = 2)
+        writer.record(await make_order_book(*_levels(100), last_update_id = 1), {"E": 1})
+        _wait_for_rows(writer, 1)
+        reader = ColumnarReader(directory)
+        assert _flat(reader.slice_rows(0, 10)['update_id']) == [1]
+        for update_id in range(2, 8):
+            writer.record(await make_order_book(*_levels(100), last_update_id = update_id), {"E": update_id})
+        _wait_for_rows(writer, 7)
+        assert _flat(reader.slice_rows(0, 10)['update_id']) == [1, 2, 3, 4, 5, 6, 7]
+        writer.close()
+
+        # Reopened, the store is appended to
+        writer = ColumnarWriter(directory, depth = 3)
+        writer.record(await make_order_book(*_levels(100), last_update_id = 8), {"E": 8})
+        writer.close()
+        assert _flat(reader.by_update_id(7, 8)['update_id']) == [7, 8]
+        with pytest.raises(ValueError):
+            ColumnarWriter(directory, depth = 5)
+
+
+    @pytest.mark.it('records the first update of every interval of event time')
+    @pytest.mark.asyncio
+    async def test_interval(self, tmp_path, make_order_book):
+        writer = ColumnarWriter(str(tmp_path / 'BNBUSDT'), depth = 1, interval_ms = 1000)
+        for update_id, event_time in enumerate((1000, 1100, 1999, 2000, 2500, 4200)):
+            writer.record(await make_order_book(*_levels(100), last_update_id = update_id), {"E": event_time})
+        writer.close()
+        reader = ColumnarReader(str(tmp_path / 'BNBUSDT'))
+        assert _flat(reader.slice_rows(0, 10)['event_time']) == [1000, 2000, 4200]
+
+
+    @pytest.mark.it('returns read-only numpy views over the mapped files')
+    @pytest.mark.asyncio
+    async def test_numpy_views(self, tmp_path, make_order_book):
+        numpy = pytest.importorskip('numpy')
+        writer = ColumnarWriter(str(tmp_path / 'BTCUSDT'), depth = 3, capacity = 4)
+        for index in range(6):
+            writer.record(await make_order_book(*_levels(1000 + index), last_update_id = 100 + index),
+                          {"E": 1_700_000_000_000 + 100 * index})
+        writer.close()
+
+        reader = ColumnarReader(str(tmp_path / 'BTCUSDT'))
+        rows = reader.slice_rows(1, 5)
+        assert all(isinstance(column, numpy.ndarray) for column in rows.values())
+        assert rows['update_id'].shape == (4,) and rows['event_time'].shape == (4,)
+        assert rows['bid_price'].shape == (4, 3) and rows['ask_qty'].shape == (4, 3)
+        assert rows['update_id'].dtype == numpy.int64 and rows['bid_price'].dtype == numpy.float64
+        # Views of the mmap, not copies
+        assert all(not column.flags.writeable and not column.flags.owndata for column in rows.values())
+        with pytest.raises(ValueError):
+            rows['bid_price'][0, 0] = 0
+        assert rows['bid_price'][:, 0].tolist() == [1001, 1002, 1003, 1004]
+
+        rows = reader.by_update_id(102, 104)
+        assert rows['update_id'].tolist() == [102, 103, 104] and rows['bid_qty'].shape == (3, 3)
+        rows = reader.by_event_time(1_700_000_000_050, 1_700_000_000_200)
+        assert rows['event_time'].tolist() == [1_700_000_000_100, 1_700_000_000_200]
+        assert rows['ask_price'].shape == (2, 3) and rows['ask_price'][1].tolist() == [1003, 1004, 1005]
+        assert reader.by_update_id(200, 300)['bid_price'].shape == (0, 3)
+        del rows
+        reader.close()
@@ -0,0 +1,58 @@
+import pytest
+import random
+from order_book.cow_ladder import CowLadders
+from wb_sockets.processing import to_do_processing_logic
+
+
+def _levels(order_book):
+    # What a snapshot has to match: both sides best first
+    return ([(price, order_book.ob_bids[price]) for price in reversed(order_book.ob_bids_prices)],
+            [(price, order_book.ob_asks[price]) for price in order_book.ob_asks_prices])
+
+
+@pytest.mark.describe('Copy-on-write snapshots')
+class TestCowSnapshots:
+
+    @pytest.mark.it('keeps a snapshot unchanged while the book moves on, copying only the touched chunks')
+    @pytest.mark.asyncio
+    async def test_snapshot_is_immutable(self, make_order_book):
+        order_book = await make_order_book([(100 - i, 1) for i in range(1, 41)], [(100 + i, 1) for i in range(40)])
+        order_book.enable_snapshots(chunk_size = 8)
+        frozen = order_book.take_snapshot()
+        expected = _levels(order_book)
+        assert (frozen.version, frozen.last_update_id, frozen.num_bids, frozen.num_asks) == (0, 1, 40, 40)
+        assert (list(frozen.bids()), list(frozen.asks())) == expected
+        assert frozen.top('bids', 2) == [(99.0, 1.0), (98.0, 1.0)]
+
+        await to_do_processing_logic(order_book, {"U": 2, "u": 2, "b": [["99.00000000", "0"], ["99.50000000", "3"]],
+                                                  "a": [["139.00000000", "2.00000000"]]})
+        assert (list(frozen.bids()), list(frozen.asks())) == expected
+        # The best bids share one chunk, the worst ask is in another one
+        assert order_book.cow_ladders.snapshot()['copied_chunks'] == 2
+        later = order_book.take_snapshot()
+        assert later.version == 2 and later.last_update_id == 2
+        assert (list(later.bids()), list(later.asks())) == _levels(order_book)
+        assert later.top('bids', 2) == [(99.5, 3.0), (98.0, 1.0)] and later.top('asks', 1) == [(100.0, 1.0)]
+
+
+    @pytest.mark.it('matches the book after every update, with snapshots alive over random updates')
+    @pytest.mark.asyncio
+    async def test_matches_book(self, make_order_book):
+        rng = random.Random(11)
+        order_book = await make_order_book([(1000 - i * 0.01, 1) for i in range(1, 200)], [(1000 + i * 0.01, 1) for i in range(200)])
+        ladders = CowLadders(order_book, chunk_size = 4)
+        snapshots = []
+        for update_id in range(2, 800):
+            def levels(center, sign):
+                return [[f"{center + sign * offset * 0.01:.8f}", rng.choice(["0", f"{rng.randint(1, 500) / 1000:.8f}"])]
+                        for offset in rng.sample(range(300), 6)]
+            await to_do_processing_logic(order_book, {"U": update_id, "u": update_id,
+                                                      "b": levels(999.99, -1), "a": levels(1000, 1)})
+            if update_id % 40 == 0:
+                snapshots.append((ladders.freeze(), _levels(order_book)))
+        snapshots.append((ladders.freeze(), _levels(order_book)))
+        for frozen, (bids, asks) in snapshots:
+            assert list(frozen.bids()) == bids and list(frozen.asks()) == asks
+            assert (frozen.num_bids, frozen.num_asks) == (len(bids), len(asks))
+        ladders.close()
+        assert not order_book.level_listeners
@@ -0,0 +1,93 @@
+import pytest
+import random
+from order_book.depth_index import DepthIndex
+from wb_sockets.processing import to_do_processing_logic
+
+
+def _walk(order_book, side, quantity):
+    # The naive walk over the price list the index replaces: (filled, vwap, worst price)
+    prices = order_book.ob_asks_prices if side == 'asks' else order_book.ob_bids_prices[::-1]
+    levels = order_book.ob_asks if side == 'asks' else order_book.ob_bids
+    filled = notional = 0.0
+    worst = None
+    for price in prices:
+        if filled >= quantity:
+            break
+        take = min(levels[price], quantity - filled)
+        filled += take
+        notional += take * price
+        worst = price
+    return filled, (notional / filled if filled else None), worst
+
+
+@pytest.mark.describe('Depth index')
+class TestDepthIndex:
+
+    @pytest.mark.it('answers fill price, quantity before a price and price for a quantity')
+    @pytest.mark.asyncio
+    async def test_queries(self, make_order_book):
+        order_book = await make_order_book([(99.0, 1), (98.5, 2), (98.0, 3)], [(100.0, 1), (100.5, 2), (101.5, 3)])
+        index = DepthIndex(order_book)
+        fill = index.vwap('asks', 2)
+        assert fill.quantity == 2 and fill.average_price == pytest.approx(100.25) and fill.worst_price == 100.5
+        assert index.vwap('bids', 10) == (6.0, pytest.approx((99 + 197 + 294) / 6), 98.0)
+        assert index.price_for_quantity('asks', 3.5) == 101.5
+        assert index.price_for_quantity('asks', 7) is None
+        assert index.quantity_to_price('asks', 101.0) == 3.0
+        assert index.quantity_to_price('bids', 98.5) == 3.0
+        assert index.quantity_to_price('bids', 99.5) == 0.0
+
+
+    @pytest.mark.it('matches the naive walk while the book is updated, across rebuilds')
+    @pytest.mark.asyncio
+    async def test_matches_walk(self, make_order_book):
+        rng = random.Random(3)
+        order_book = await make_order_book([(1000 - i, 1) for i in range(1, 200)], [(1000 + i, 1) for i in range(1, 200)])
+        index = DepthIndex(order_book)
+        for update_id in range(2, 1500):
+            # Drifting touch, and half-unit prices after a while (finer tick than the snapshot)
+            shift = update_id // 20
+            step = 0.5 if update_id > 700 else 1
+            def levels(center, sign):
+                return [[f"{center + sign * offset * step:.8f}", rng.choice(["0", f"{rng.randint(1, 500) / 100:.8f}"])]
+                        for offset in rng.sample(range(61), 4)]
+            message = {"U": update_id, "u": update_id, "b": levels(999 + shift, -1), "a": levels(1001 + shift, 1)}
+            await to_do_processing_logic(order_book, message)
+            for side in ('bids', 'asks'):
+                quantity = rng.uniform(0.1, 80)
+                filled, average_price, worst = _walk(order_book, side, quantity)
+                fill = index.vwap(side, quantity)
+                assert fill.quantity == pytest.approx(filled)
+                assert fill.average_price == pytest.approx(average_price)
+                assert fill.worst_price == worst
+        assert index.rebuilds > 2
+        index.close()
+        assert not order_book.level_listeners
+
+
+    @pytest.mark.it('grows the grid for a level added below the worst price of the snapshot')
+    @pytest.mark.asyncio
+    async def test_level_below_grid(self, make_order_book):
+        order_book = await make_order_book([(100 - i * 0.01, 1) for i in range(100)], [(100.01, 1)])
+        index = DepthIndex(order_book)
+        await to_do_processing_logic(order_book, {"U": 2, "u": 2, "b": [["50.00000000", "5.00000000"]], "a": []})
+        fill = index.vwap('bids', 105)
+        assert fill.quantity == 105 and fill.worst_price == 50.0
+        assert fill.average_price == pytest.approx(_walk(order_book, 'bids', 105)[1])
+        assert index.quantity_to_price('bids', 40) == 105.0
+        assert index.quantity_to_price('bids', 50.01) == 100.0
+
+
+    @pytest.mark.it('infers the tick from the second level when a side starts with a single one')
+    @pytest.mark.asyncio
+    async def test_single_level_side(self, make_order_book):
+        order_book = await make_order_book([(100.0, 1)], [(100.01, 1)])
+        index = DepthIndex(order_book)
+        assert index.vwap('bids', 2) == (1.0, 100.0, 100.0)
+        await to_do_processing_logic(order_book, {"U": 2, "u": 2, "b": [["99.99000000", "1.00000000"]], "a": []})
+        assert index.vwap('bids', 2) == (2.0, pytest.approx(99.995), 99.99)
+        await to_do_processing_logic(order_book, {"U": 3, "u": 3, "b": [["99.98000000", "1.00000000"]],
+                                                  "a": [["100.02000000", "2.00000000"]]})
+        assert index.vwap('bids', 3) == (3.0, pytest.approx(99.99), 99.98)
+        assert index.vwap('asks', 3) == (3.0, pytest.approx(100.01 / 3 + 200.04 / 3), 100.02)
+        assert index.sides['bids'].tick == 10 ** 6 and index.sides['asks'].tick == 10 ** 6
@@ -0,0 +1,124 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import random
+from order_book.order_book_class import OrderBook
+from order_book.diff_feed import DiffFeed, BookDiff, BookSnapshot
+from wb_sockets.processing import to_do_processing_logic
+
+
+@pytest_asyncio.fixture
+async def order_book():
+    order_book = OrderBook({"lastUpdateId": 100,
+                            "bids": [[f"{100 - i}.00000000", "1.00000000"] for i in range(1, 11)],
+                            "asks": [[f"{100 + i}.00000000", "1.00000000"] for i in range(1, 11)]})
+    await order_book.extract_order_book_prices()
+    return order_book
+
+
+def _updates(first_update_id, count, seed = 3):
+    rng = random.Random(seed)
+    updates = []
+    for update_id in range(first_update_id, first_update_id + count):
+        updates.append({"U": update_id, "u": update_id,
+                        "b": [[f"{rng.randint(80, 99)}.00000000", rng.choice(["0", "2.50000000", "0.10000000"])]],
+                        "a": [[f"{rng.randint(101, 120)}.00000000", rng.choice(["0", "3.00000000"])]]})
+    return updates
+
+
+async def _apply_and_publish(feed, order_book, updates):
+    for message in updates:
+        await to_do_processing_logic(order_book, message)
+        feed.publish(message, order_book)
+
+
+def _replay(items):
+    # What a subscriber reconstructs from its snapshot and diffs
+    bids, asks, last_update_id = {}, {}, None
+    for item in items:
+        if isinstance(item, BookSnapshot):
+            bids, asks, last_update_id = dict(item.bids), dict(item.asks), item.last_update_id
+            continue
+        assert item.first_update_id == last_update_id + 1
+        for side, changes in ((bids, item.bids), (asks, item.asks)):
+            for price, qty in changes.items():
+                if qty == 0:
+                    side.pop(price, None)
+                else:
+                    side[price] = qty
+        last_update_id = item.final_update_id
+    return bids, asks, last_update_id
+
+
+def _drain(subscriber):
+    items = []
+    while (item := subscriber.get_nowait()) is not None:
+        items.append(item)
+    return items
+
+
+@pytest.mark.describe('Diff fan-out')
+class TestDiffFeed:
+
+    @pytest.mark.it('starts a subscriber with a snapshot and follows with one diff per update')
+    @pytest.mark.asyncio
+    async def test_snapshot_then_diffs(self, order_book):
+        feed = DiffFeed()
+        await _apply_and_publish(feed, order_book, _updates(101, 1))
+        subscriber = feed.subscribe()
+        items = [await subscriber.get()]
+        await _apply_and_publish(feed, order_book, _updates(102, 20))
+        items += _drain(subscriber)
+        assert isinstance(items[0], BookSnapshot)
+        assert all(isinstance(item, BookDiff) for item in items[1:]) and len(items) == 21
+        assert _replay(items) == (order_book.ob_bids, order_book.ob_asks, 121)
+
+
+    @pytest.mark.it('conflates the pending diffs of a slow subscriber per price level')
+    @pytest.mark.asyncio
+    async def test_conflation(self, order_book):
+        feed = DiffFeed()
+        await _apply_and_publish(feed, order_book, _updates(101, 1))
+        slow, fast = feed.subscribe(max_pending = 5), feed.subscribe(max_pending = 5)
+        items = {slow: _drain(slow), fast: _drain(fast)}
+        for message in _updates(102, 200):
+            await _apply_and_publish(feed, order_book, [message])
+            items[fast] += _drain(fast)
+            assert len(slow.pending) <= 5
+        items[slow] += _drain(slow)
+
+        assert slow.conflations > 0 and slow.resets == 0
+        assert fast.conflations == 0 and len(items[fast]) == 201
+        for subscriber in (slow, fast):
+            assert _replay(items[subscriber]) == (order_book.ob_bids, order_book.ob_asks, 301)
+
+
+    @pytest.mark.it('sends a snapshot to a subscriber that fell too far behind')
+    @pytest.mark.asyncio
+    async def test_snapshot_and_resume(self, order_book):
+        feed = DiffFeed()
+        await _apply_and_publish(feed, order_book, _updates(101, 1))
+        subscriber = feed.subscribe(max_pending = 2, max_conflated_levels = 3)
+        items = _drain(subscriber)
+        await _apply_and_publish(feed, order_book, _updates(102, 50))
+        assert subscriber.resets == 1 and not subscriber.pending
+        items += _drain(subscriber)
+        assert isinstance(items[-1], BookSnapshot) and items[-1].last_update_id == 151
+        await _apply_and_publish(feed, order_book, _updates(152, 2))
+        items += _drain(subscriber)
+        assert _replay(items) == (order_book.ob_bids, order_book.ob_asks, 153)
+
+
+    @pytest.mark.it('restarts every subscriber from a snapshot when the book is resynced')
+    @pytest.mark.asyncio
+    async def test_resync(self, order_book):
+        feed = DiffFeed()
+        await _apply_and_publish(feed, order_book, _updates(101, 1))
+        subscriber = feed.subscribe()
+        _drain(subscriber)
+        new_book = OrderBook({"lastUpdateId": 500, "bids": [["90.00000000", "1.00000000"]], "asks": [["110.00000000", "1.00000000"]]})
+        await new_book.extract_order_book_prices()
+        await _apply_and_publish(feed, new_book, _updates(501, 1))
+        item = await asyncio.wait_for(subscriber.get(), timeout = 1)
+        assert isinstance(item, BookSnapshot) and item.last_update_id == 501
+        assert item.bids == new_book.ob_bids
@@ -0,0 +1,155 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import random
+import aiohttp
+import yarl
+from order_book.order_book_class import OrderBook
+from order_book.diff_feed import DiffFeed
+# Imported the way the auditor sees it (src/ on sys.path, see conftest.py), so monkeypatching reaches it
+from order_book import drift_audit as drift_audit_module
+from order_book.drift_audit import DriftAuditor
+from wb_sockets.processing import to_do_processing_logic
+
+SNAPSHOT = {"lastUpdateId": 100,
+            "bids": [[f"{100 - i}.00000000", "1.00000000"] for i in range(1, 31)],
+            "asks": [[f"{100 + i}.00000000", "1.00000000"] for i in range(1, 31)]}
+
+
+def _updates(first_update_id, count, seed = 11):
+    rng = random.Random(seed)
+    return [{"U": update_id, "u": update_id,
+             "b": [[f"{rng.randint(88, 99)}.00000000", rng.choice(["0", "2.50000000"])]],
+             "a": [[f"{rng.randint(101, 112)}.00000000", rng.choice(["0", "3.00000000"])]]}
+            for update_id in range(first_update_id, first_update_id + count)]
+
+
+def _content(order_book, limit):
+    # REST snapshot of a reference book
+    return {"lastUpdateId": order_book.last_update_id,
+            "bids": [[f"{price:.8f}", f"{order_book.ob_bids[price]:.8f}"] for price in order_book.ob_bids_prices[:-limit - 1:-1]],
+            "asks": [[f"{price:.8f}", f"{order_book.ob_asks[price]:.8f}"] for price in order_book.ob_asks_prices[:limit]]}
+
+
+class _Book:
+    # What the auditor reads from BookManager.books
+    def __init__(self, order_book, feed):
+        self.order_book, self.feed, self.is_live = order_book, feed, True
+
+
+@pytest_asyncio.fixture
+async def live_book():
+    """
+    The local book (fed through a DiffFeed like ws_processing does) and a reference book
+    that follows the same updates, the source of the fake REST snapshots
+    """
+    local, reference = OrderBook(dict(SNAPSHOT)), OrderBook(dict(SNAPSHOT))
+    await local.extract_order_book_prices()
+    await reference.extract_order_book_prices()
+    feed = DiffFeed()
+    updates, applied = _updates(101, 500), {'local': 0, 'reference': 0}
+
+    async def apply(count, books = ('local', 'reference')):
+        # Every book applies the same sequence of updates, each at its own pace
+        for name in books:
+            for message in updates[applied[name]:applied[name] + count]:
+                await to_do_processing_logic(local if name == 'local' else reference, message)
+                if name == 'local':
+                    feed.publish(message, local)
+            applied[name] += count
+    await apply(1)
+    return local, reference, feed, apply
+
+
+@pytest.mark.describe('Drift auditor')
+class TestDriftAuditor:
+
+    @pytest.mark.it('finds no drift when the stream moved on while the snapshot was requested')
+    @pytest.mark.asyncio
+    async def test_aligned_without_drift(self, monkeypatch, live_book):
+        local, reference, feed, apply = live_book
+
+        async def fake_request(session, symbol, limit):
+            await apply(5)
+            content = _content(reference, limit)
+            # The stream keeps going after the snapshot was taken
+            await apply(20, books = ('local',))
+            return content, 10
+        monkeypatch.setattr(drift_audit_module, 'request_depth_snapshot', fake_request)
+
+        auditor = DriftAuditor({'BTCUSDT': _Book(local, feed)}, session = object(), limit = 10)
+        report = await auditor.audit('BTCUSDT', local, feed)
+        assert report.last_update_id == 106 and report.local_update_id == 126
+        assert report.drift_levels == 0 and report.excluded_levels > 0
+        assert report.compared_levels >= 20
+        assert not feed.subscribers
+
+
+    @pytest.mark.it('waits for the book to reach the snapshot and reports the levels that drifted')
+    @pytest.mark.asyncio
+    async def test_drift_and_resync_request(self, monkeypatch, live_book):
+        local, reference, feed, apply = live_book
+        # A level lost without a trace in the stream
+        local.ob_bids.pop(99.0)
+        local.ob_bids_prices.remove(99.0)
+
+        async def fake_request(session, symbol, limit):
+            await apply(4, books = ('reference',))
+            # The local book lags behind the snapshot and catches up while the auditor waits
+            asyncio.get_running_loop().call_later(0.05, lambda: asyncio.ensure_future(apply(4, books = ('local',))))
+            return _content(reference, limit), 10
+        monkeypatch.setattr(drift_audit_module, 'request_depth_snapshot', fake_request)
+        drifted = []
+        auditor = DriftAuditor({'BTCUSDT': _Book(local, feed)}, session = object(), limit = 10,
+                               on_drift = lambda symbol, report: drifted.append((symbol, report)))
+        await auditor._audit_next('BTCUSDT')
+        (symbol, report), = drifted
+        assert symbol == 'BTCUSDT' and report.drift_levels == 1
+        assert report.last_update_id == report.local_update_id == 105
+        # The difference turns the snapshot into the local book
+        assert report.difference.bids.removed == [(99.0, 1.0)]
+        assert auditor.snapshot()['drifted'] == 1 and auditor.snapshot()['drift_levels'] == {'BTCUSDT': 1}
+
+
+    @pytest.mark.it('skips the audit when the book is resynced meanwhile')
+    @pytest.mark.asyncio
+    async def test_resynced_meanwhile(self, monkeypatch, live_book):
+        local, reference, feed, apply = live_book
+
+        async def fake_request(session, symbol, limit):
+            new_book = OrderBook(dict(SNAPSHOT, lastUpdateId = 900))
+            await new_book.extract_order_book_prices()
+            feed.publish({"U": 901, "u": 901, "b": [], "a": []}, new_book)
+            return _content(reference, limit), 10
+        monkeypatch.setattr(drift_audit_module, 'request_depth_snapshot', fake_request)
+        auditor = DriftAuditor({'BTCUSDT': _Book(local, feed)}, session = object())
+        await auditor._audit_next('BTCUSDT')
+        assert (auditor.audits, auditor.skipped) == (0, 1)
+
+
+    @pytest.mark.it('spaces the audits by the weight budget and slows down on high used weight or 429')
+    @pytest.mark.asyncio
+    async def test_cadence(self, monkeypatch, live_book):
+        local, reference, feed, apply = live_book
+        used_weight = [5000]
+        url = yarl.URL('https://api.binance.com/api/v3/depth')
+        request_info = aiohttp.RequestInfo(url, 'GET', {}, url)
+
+        async def fake_request(session, symbol, limit):
+            if used_weight[0] is None:
+                raise aiohttp.ClientResponseError(request_info, (), status = 429)
+            return _content(reference, limit), used_weight[0]
+        monkeypatch.setattr(drift_audit_module, 'request_depth_snapshot', fake_request)
+        auditor = DriftAuditor({'BTCUSDT': _Book(local, feed)}, session = object(), limit = 100,
+                               weight_budget = 0.05, min_interval = 0.1, max_interval = 60)
+        # weight 5 out of 5% of 6000 per minute
+        assert auditor.interval == pytest.approx(1.0)
+        await auditor._audit_next('BTCUSDT')
+        assert auditor.interval == pytest.approx(2.0)
+        used_weight[0] = 100
+        await auditor._audit_next('BTCUSDT')
+        assert auditor.interval == pytest.approx(1.0)
+        used_weight[0] = None
+        await auditor._audit_next('BTCUSDT')
+        assert auditor.interval == 60 and auditor.errors == 1
+        assert DriftAuditor({}, limit = 1000).interval == pytest.approx(10.0)
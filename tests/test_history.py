@@ -0,0 +1,90 @@
+import pytest
+import random
+from order_book.history import BookHistory
+from wb_sockets.processing import to_do_processing_logic
+
+
+def _random_update(rng, update_id):
+    def levels(center, sign):
+        return [[f"{center + sign * offset:.8f}", rng.choice(["0", f"{rng.randint(1, 100) / 10:.8f}"])]
+                for offset in rng.sample(range(1, 60), 4)]
+    # Update ids advance by a few per message, like the stream does
+    return {"U": update_id, "u": update_id + 2, "b": levels(100, -1), "a": levels(100, 1)}
+
+
+def _state(order_book):
+    return order_book.last_update_id, dict(order_book.ob_bids), dict(order_book.ob_asks), \
+        list(order_book.ob_bids_prices), list(order_book.ob_asks_prices)
+
+
+async def _record(history, order_book, rng, first_update_id, count):
+    # Applies `count` random updates, returns the live state after every one of them
+    states = {}
+    for update_id in range(first_update_id, first_update_id + 3 * count, 3):
+        await to_do_processing_logic(order_book, _random_update(rng, update_id))
+        states[order_book.last_update_id] = _state(order_book)
+    return states
+
+
+@pytest.mark.describe('Book history')
+class TestBookHistory:
+
+    @pytest.mark.it('rebuilds the book as of any update id from the nearest checkpoint')
+    @pytest.mark.asyncio
+    async def test_book_at(self, make_order_book):
+        rng = random.Random(3)
+        order_book = await make_order_book(range(50, 100), range(101, 150), last_update_id = 100)
+        history = BookHistory(checkpoint_every = 25)
+        history.attach(order_book)
+        initial = _state(order_book)
+        states = await _record(history, order_book, rng, 101, 200)
+
+        assert history.snapshot() == {'checkpoints': 9, 'updates': 200, 'first_update_id': 100,
+                                      'last_update_id': max(states)}
+        assert _state(history.book_at(100)) == initial
+        for update_id, state in states.items():
+            assert _state(history.book_at(update_id)) == state
+            # Ids inside an update's U..u range give the state before it
+            assert _state(history.book_at(update_id - 1))[0] == update_id - 3 if update_id > 103 else 100
+        for update_id in (99, max(states) + 1):
+            with pytest.raises(KeyError):
+                history.book_at(update_id)
+
+
+    @pytest.mark.it('streams every state of a range')
+    @pytest.mark.asyncio
+    async def test_states(self, make_order_book):
+        rng = random.Random(4)
+        order_book = await make_order_book(range(50, 100), range(101, 150), last_update_id = 100)
+        history = BookHistory(checkpoint_every = 10)
+        history.attach(order_book)
+        states = await _record(history, order_book, rng, 101, 60)
+        ids = sorted(states)
+
+        streamed = [_state(book) for book in history.states(ids[5], ids[40])]
+        assert streamed == [states[update_id] for update_id in ids[5:41]]
+        assert len(list(history.states(ids[-3]))) == 3
+
+
+    @pytest.mark.it('continues from the snapshot of a resynced book and keeps max_checkpoints')
+    @pytest.mark.asyncio
+    async def test_resync(self, make_order_book):
+        rng = random.Random(5)
+        history = BookHistory(checkpoint_every = 10, max_checkpoints = 3)
+        order_book = await make_order_book(range(50, 100), range(101, 150), last_update_id = 100)
+        history.attach(order_book)
+        states = await _record(history, order_book, rng, 101, 30)
+        # Checkpoints at 100, 130, 160 and 190, the first one dropped
+        assert history.first_update_id == 130
+        # The new snapshot is older than the last updates applied to the previous book
+        resynced = await make_order_book(range(60, 100), range(101, 140), last_update_id = 160)
+        history.attach(resynced)
+        states = {update_id: state for update_id, state in states.items() if update_id < 160}
+        states[160] = _state(resynced)
+        states.update(await _record(history, resynced, rng, 161, 15))
+        assert len(order_book.level_listeners) == 0
+
+        streamed = [_state(book) for book in history.states(history.first_update_id)]
+        assert streamed == [states[update_id] for update_id in sorted(states) if update_id >= history.first_update_id]
+        assert _state(history.book_at(160)) == states[160]
+        assert history.snapshot()['checkpoints'] == 3
@@ -0,0 +1,78 @@
+import pytest
+import logging
+from src.utils.logger import SamplingFilter, RateLimitFilter, setup_logger, HOT_PATH_LOGGERS
+
+
+def _record(level=logging.DEBUG, lineno=10, msg='Applied update U=%s'):
+    return logging.LogRecord('wb_sockets.processing', level, __file__, lineno, msg, (1,), None)
+
+
+@pytest.mark.describe('Logging filters for the hot path')
+class TestFilters:
+
+    @pytest.mark.it('keeps one of every N debug records and all records above debug')
+    def test_sampling_filter(self):
+        sampling_filter = SamplingFilter(every=10)
+        kept = [sampling_filter.filter(_record()) for _ in range(100)]
+        assert sum(kept) == 10
+        assert sampling_filter.filter(_record(logging.INFO))
+
+
+    @pytest.mark.it('rate limits warnings per call site and reports how many were suppressed')
+    def test_rate_limit_filter(self):
+        rate_limit_filter = RateLimitFilter(interval=60)
+        assert rate_limit_filter.filter(_record(logging.WARNING))
+        assert not rate_limit_filter.filter(_record(logging.WARNING))
+        assert rate_limit_filter.filter(_record(logging.WARNING, lineno=11))
+        assert rate_limit_filter.filter(_record(logging.ERROR))
+        assert rate_limit_filter.suppressed == {('wb_sockets.processing', 10): 1}
+
+
+@pytest.mark.describe('Queue-backed logger setup')
+class TestSetupLogger:
+
+    @pytest.mark.it('writes records to the log file from the listener thread')
+    def test_writes_to_file(self, tmp_path):
+        root = logging.getLogger()
+        saved_handlers, saved_level = list(root.handlers), root.level
+        log_file = tmp_path / 'logs' / 'log.txt'
+        listener = setup_logger(logging.INFO, str(log_file), console=False)
+        try:
+            logging.getLogger('test').info('Order book %s', 'initialised')
+            logging.getLogger('test').debug('not written')
+        finally:
+            listener.stop()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+            for name in ('wb_sockets.ingesting', 'wb_sockets.processing', 'order_book.order_book_class'):
+                logging.getLogger(name).filters = []
+        content = log_file.read_text()
+        assert '[INFO] test: Order book initialised' in content
+        assert 'not written' not in content
+
+
+    @pytest.mark.it('keeps a single sampling filter on the hot path loggers when it is set up again')
+    def test_setup_twice(self, tmp_path):
+        root = logging.getLogger()
+        saved_handlers, saved_level = list(root.handlers), root.level
+        listeners = []
+        try:
+            for debug_sample_every in (10, 100):
+                listeners.append(setup_logger(logging.INFO, str(tmp_path / 'log.txt'), console=False,
+                                              debug_sample_every=debug_sample_every))
+            for name in HOT_PATH_LOGGERS:
+                filters = [f for f in logging.getLogger(name).filters if isinstance(f, SamplingFilter)]
+                assert [f.every for f in filters] == [100]
+        finally:
+            for listener in listeners:
+                listener.stop()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+            for name in HOT_PATH_LOGGERS:
+                logging.getLogger(name).filters = []
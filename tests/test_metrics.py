@@ -0,0 +1,108 @@
+import pytest
+import json
+import asyncio
+import time
+from collections import deque
+from src.utils.metrics import LatencyHistogram, PipelineMetrics, StampedFrame
+from src.wb_sockets.processing import ws_processing
+from src.order_book.order_book_class import OrderBook
+
+
+@pytest.mark.describe('Fixed-bucket latency histogram')
+class TestLatencyHistogram:
+
+    @pytest.mark.it('returns zeros when nothing was recorded')
+    def test_empty_histogram(self):
+        histogram = LatencyHistogram()
+        assert histogram.percentile(99) == 0
+        assert histogram.snapshot()['count'] == 0
+
+
+    @pytest.mark.it('keeps small values exact')
+    def test_small_values_exact(self):
+        histogram = LatencyHistogram()
+        for value in range(10):
+            histogram.record(value)
+        assert histogram.percentile(50) == 4
+        assert histogram.percentile(100) == 9
+
+
+    @pytest.mark.it('estimates percentiles within the bucket precision')
+    @pytest.mark.parametrize('percent', [50, 90, 99, 99.9])
+    def test_percentile_precision(self, percent):
+        histogram = LatencyHistogram()
+        values = list(range(1, 100001))
+        for value in values:
+            histogram.record(value)
+        exact = values[int(len(values) * percent / 100) - 1]
+        assert exact <= histogram.percentile(percent) <= exact * 1.125
+
+
+    @pytest.mark.it('clamps negative values (clock skew) to zero and huge values to the last bucket')
+    def test_out_of_range_values(self):
+        histogram = LatencyHistogram()
+        histogram.record(-50)
+        histogram.record(2 ** 40)
+        assert histogram.counts[0] == 1
+        assert histogram.counts[-1] == 1
+
+
+@pytest.mark.describe('Pipeline metrics stamps and counters')
+class TestPipelineMetrics:
+
+    @pytest.mark.it('stamps frames without changing their content')
+    def test_stamp(self):
+        metrics = PipelineMetrics()
+        frame = metrics.stamp('{"U": 1, "u": 2}')
+        assert isinstance(frame, StampedFrame)
+        assert frame == '{"U": 1, "u": 2}'
+        assert json.loads(frame) == {'U': 1, 'u': 2}
+        assert metrics.messages_received == 1
+
+
+    @pytest.mark.it('records every stage for a stamped frame with an event time')
+    def test_record_apply(self):
+        metrics = PipelineMetrics()
+        message = {'E': int(time.time() * 1000) - 5, 'U': 1, 'u': 2,
+                   'b': [['1.0', '1.0'], ['2.0', '0.0']], 'a': [['3.0', '1.0']]}
+        frame = metrics.stamp(json.dumps(message))
+        metrics.record_apply(frame, message, time.time())
+        snapshot = metrics.snapshot()
+        assert snapshot['messages_applied'] == 1
+        assert snapshot['levels_applied'] == 3
+        assert all(values['count'] == 1 for values in snapshot['stages'].values())
+
+
+    @pytest.mark.it('records processing stages only for frames which were not stamped')
+    def test_record_apply_plain_frame(self):
+        metrics = PipelineMetrics()
+        metrics.record_apply('{}', {'b': [], 'a': []}, time.time())
+        stages = metrics.snapshot()['stages']
+        assert stages['apply']['count'] == 1
+        assert stages['queue']['count'] == 0
+        assert stages['network']['count'] == 0
+
+
+    @pytest.mark.it('is fed by ws_processing')
+    @pytest.mark.asyncio
+    async def test_fed_by_ws_processing(self):
+        order_book = OrderBook({"lastUpdateId": 1,
+                                "bids": [["113678.85000000", "7.25330000"]],
+                                "asks": [["113678.86000000", "1.93563000"]]})
+        await order_book.extract_order_book_prices()
+        metrics = PipelineMetrics()
+        messages = [{"e": "depthUpdate", "E": 1753786825814, "s": "BTCUSDT", "U": 2, "u": 5,
+                     "b": [["113678.80000000", "1.00000000"]], "a": []},
+                    {"e": "depthUpdate", "E": 1753786825914, "s": "BTCUSDT", "U": 6, "u": 8,
+                     "b": [], "a": [["113679.00000000", "1.00000000"]]}]
+        buffer = deque([metrics.stamp(json.dumps(message)) for message in messages])
+
+        task = asyncio.create_task(ws_processing(order_book, buffer, metrics))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert metrics.messages_applied == 1
+        assert metrics.levels_applied == 1
+        assert metrics.histograms['queue'].count == 1
@@ -0,0 +1,83 @@
+import pytest
+import random
+from order_book.microstructure import MicrostructureMetrics
+from wb_sockets.processing import to_do_processing_logic
+
+
+# 50 levels of quantity 1 on each side, half a unit apart
+BIDS = [1000 - i * 0.5 for i in range(1, 51)]
+ASKS = [1000 + i * 0.5 for i in range(1, 51)]
+
+
+def _random_update(rng, update_id):
+    def levels(low, high):
+        # Distinct prices, like in a Binance update
+        return [[f"{tick * 0.5:.8f}", rng.choice(["0", f"{rng.randint(1, 900000) / 1e5:.8f}"])]
+                for tick in rng.sample(range(low, high), rng.randint(0, 6))]
+    # Bids and asks around a mid that wanders, sometimes crossing the old touch
+    return {"U": update_id, "u": update_id, "b": levels(1900, 2001), "a": levels(1999, 2100)}
+
+
+def _expected(order_book, top_n, bps):
+    # Full recompute straight from the dicts
+    bids = sorted(order_book.ob_bids.items(), reverse=True)
+    asks = sorted(order_book.ob_asks.items())
+    best_bid, best_ask = bids[0][0], asks[0][0]
+    mid = (best_bid + best_ask) / 2
+    return {'spread': best_ask - best_bid,
+            'mid': mid,
+            'microprice': (best_bid * asks[0][1] + best_ask * bids[0][1]) / (bids[0][1] + asks[0][1]),
+            'top_depth': (sum(qty for _, qty in bids[:top_n]), sum(qty for _, qty in asks[:top_n])),
+            'band': (sum(qty for price, qty in bids if price >= mid - mid * bps / 10000),
+                     sum(qty for price, qty in asks if price <= mid + mid * bps / 10000))}
+
+
+@pytest.mark.describe('Microstructure metrics')
+class TestMicrostructureMetrics:
+
+    @pytest.mark.it('computes the touch values and depths of the initial book')
+    @pytest.mark.asyncio
+    async def test_initial_values(self, make_order_book):
+        order_book = await make_order_book(BIDS, ASKS)
+        metrics = MicrostructureMetrics(order_book, top_n = 5, band_bps = (10,))
+        assert (metrics.best_bid, metrics.best_ask, metrics.spread, metrics.mid) == (999.5, 1000.5, 1.0, 1000.0)
+        assert metrics.microprice == 1000.0 and metrics.imbalance == 0
+        assert metrics.top_depth() == (5.0, 5.0)
+        # 10 bps of 1000 is 1.0: bids down to 999.0, asks up to 1001.0
+        assert metrics.depth_within(10) == (2.0, 2.0)
+
+
+    @pytest.mark.it('stays equal to a full recompute over many random updates')
+    @pytest.mark.asyncio
+    async def test_matches_recompute(self, make_order_book):
+        rng = random.Random(17)
+        order_book = await make_order_book(BIDS, ASKS)
+        metrics = MicrostructureMetrics(order_book, top_n = 10, band_bps = (10, 100), reconcile_every = 0)
+        for update_id in range(2, 3000):
+            await to_do_processing_logic(order_book, _random_update(rng, update_id))
+            if not order_book.ob_bids or not order_book.ob_asks:
+                continue
+            expected = _expected(order_book, 10, 100)
+            assert metrics.spread == expected['spread'] and metrics.mid == expected['mid']
+            assert metrics.microprice == pytest.approx(expected['microprice'])
+            assert metrics.top_depth() == pytest.approx(expected['top_depth'], abs = 1e-8)
+            assert metrics.depth_within(100) == pytest.approx(expected['band'], abs = 1e-8)
+        assert metrics.updates == 2998
+        assert metrics.reconcile() and metrics.mismatches == 0
+
+
+    @pytest.mark.it('corrects the running values on reconciliation and stops listening when closed')
+    @pytest.mark.asyncio
+    async def test_reconcile_and_close(self, make_order_book):
+        order_book = await make_order_book(BIDS, ASKS)
+        metrics = MicrostructureMetrics(order_book, top_n = 5, reconcile_every = 2)
+        # A change that bypassed the apply path
+        order_book.ob_bids[999.5] = 3.0
+        await to_do_processing_logic(order_book, {"U": 2, "u": 2, "b": [], "a": [["1000.50000000", "2.00000000"]]})
+        assert metrics.top_depth() == (5.0, 6.0)
+        await to_do_processing_logic(order_book, {"U": 3, "u": 3, "b": [], "a": [["1000.50000000", "1.00000000"]]})
+        assert (metrics.reconciliations, metrics.mismatches) == (1, 1)
+        assert metrics.top_depth() == (7.0, 5.0)
+        metrics.close()
+        await to_do_processing_logic(order_book, {"U": 4, "u": 4, "b": [["999.50000000", "0"]], "a": []})
+        assert metrics.best_bid == 999.5 and not order_book.level_listeners
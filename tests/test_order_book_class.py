@@ -1,7 +1,11 @@
 import pytest
+import asyncio
 import logging
 import copy
-from src.order_book.order_book_class import OrderBook, EmptyOrderBookException
+import random
+import threading
+from src.order_book.order_book_class import OrderBook, EmptyOrderBookException, InconsistentReadException
+from src.wb_sockets.processing import to_do_processing_logic
 
 @pytest.fixture
 def small_order_book():
@@ -480,3 +484,95 @@ class TestPriceListMaintenance:
         assert price_lists_order_book == price_lists
 
 
+@pytest.mark.describe('Consistent reads from other threads')
+class TestConcurrentReads:
+
+    @pytest.mark.it('versions every applied update and copies the top levels best first')
+    @pytest.mark.asyncio
+    async def test_top_levels(self, big_order_book, short_message):
+        await big_order_book.extract_order_book_prices()
+        assert big_order_book.version == 0
+        await to_do_processing_logic(big_order_book, short_message)
+        view = big_order_book.top_levels(2)
+        assert view.version == 2 and view.last_update_id == big_order_book.last_update_id
+        assert view.bids == [(price, big_order_book.ob_bids[price]) for price in big_order_book.ob_bids_prices[:-3:-1]]
+        assert view.asks == [(price, big_order_book.ob_asks[price]) for price in big_order_book.ob_asks_prices[:2]]
+
+
+    @pytest.mark.it('publishes the top levels after every update when asked to')
+    @pytest.mark.asyncio
+    async def test_published_top_levels(self, big_order_book, short_message):
+        await big_order_book.extract_order_book_prices()
+        big_order_book.publish_top_levels(3)
+        assert big_order_book.top_levels(3).version == 0
+        await to_do_processing_logic(big_order_book, short_message)
+        published = big_order_book.top_levels(3)
+        # Read while an update is in progress: the state before it, without waiting
+        big_order_book.begin_update()
+        assert big_order_book.top_levels(3) is published
+        big_order_book.end_update()
+        assert published.version == 2 and published.last_update_id == big_order_book.last_update_id
+        assert big_order_book.top_levels(2) == (4, published.last_update_id, published.bids[:2], published.asks[:2])
+        # Deeper than published: a seqlock read
+        assert big_order_book.top_levels(5).bids[:3] == big_order_book.top_levels(3).bids
+        big_order_book.publish_top_levels(0)
+        assert big_order_book._view is None
+
+
+    @pytest.mark.it('retries a read that overlapped an update and gives up when the update never ends')
+    @pytest.mark.asyncio
+    async def test_retries(self, big_order_book):
+        await big_order_book.extract_order_book_prices()
+        calls = []
+
+        def reader(book):
+            calls.append(book.version)
+            if len(calls) == 1:
+                # An update starts while the first copy is taken
+                book.begin_update()
+                book.end_update()
+            return len(book.ob_bids)
+
+        assert big_order_book.read(reader) == (2, 7)
+        assert calls == [0, 2] and big_order_book.read_retries == 1
+        big_order_book.begin_update()
+        with pytest.raises(InconsistentReadException):
+            big_order_book.read(reader, max_retries = 3)
+        big_order_book.end_update()
+        assert big_order_book.top_levels(1).version == 4
+
+
+    @pytest.mark.it('never shows a reader thread the levels and the price lists of different updates')
+    @pytest.mark.asyncio
+    async def test_threads(self, big_order_book):
+        await big_order_book.extract_order_book_prices()
+        rng = random.Random(5)
+        messages = []
+        for update_id in range(300):
+            prices = rng.sample(range(113600, 113678), 6)
+            messages.append({'U': update_id, 'u': update_id,
+                             'b': [[f'{price}.00000000', rng.choice(['0', '1.50000000'])] for price in prices],
+                             'a': [[f'{price + 100}.00000000', rng.choice(['0', '2.00000000'])] for price in prices]})
+        stop = threading.Event()
+        failures = []
+
+        def consistent(book):
+            return (set(book.ob_bids) == set(book.ob_bids_prices) and set(book.ob_asks) == set(book.ob_asks_prices)
+                    and book.ob_bids_prices == sorted(book.ob_bids_prices))
+
+        def read():
+            while not stop.is_set():
+                _, result = big_order_book.read(consistent)
+                if not result:
+                    failures.append(big_order_book.version)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for message in messages:
+            await to_do_processing_logic(big_order_book, message)
+            await asyncio.sleep(0)
+        stop.set()
+        for reader in readers:
+            reader.join()
+        assert failures == [] and big_order_book.version == 2 * len(messages)
@@ -3,7 +3,7 @@ import pytest_asyncio
 import json
 import asyncio
 from collections import deque
-from src.wb_sockets.processing import is_continuous, ws_processing
+from src.wb_sockets.processing import is_continuous, ws_processing, ws_partial_processing, partial_depth_diff
 from src.order_book.order_book_class import OrderBook
 
 @pytest.fixture()
@@ -263,3 +263,41 @@ class TestWsProcessing:
                 task.cancel()
                 with pytest.raises(asyncio.CancelledError):
                         await task       
+
+
+def _partial_payload(last_update_id, bids, asks):
+        return {"lastUpdateId": last_update_id,
+                "bids": [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in bids],
+                "asks": [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in asks]}
+
+
+@pytest.mark.describe('Tests to ensure the partial-book mode replaces the top levels')
+class TestWsPartialProcessing:
+        @pytest.mark.asyncio
+        async def test_diff_against_the_book(self, order_book):
+                payload = _partial_payload(74105025900, [(113678.85, 7.2533), (113678.80, 1)], [(113678.86, 2)])
+                message = partial_depth_diff(order_book, payload, received_at = 1753786825.5)
+                assert (message['U'], message['u'], message['E']) == (74105025814, 74105025900, 1753786825500)
+                assert sorted(message['b']) == [[113678.8, 1.0], [113678.84, 0.0]]
+                assert sorted(message['a']) == [[113678.86, 2.0], [113900.35, 0.0]]
+                # Not newer than the book
+                assert partial_depth_diff(order_book, _partial_payload(74105025813, [], [])) is None
+
+
+        @pytest.mark.asyncio
+        async def test_applies_only_the_newest_payload(self, order_book):
+                await order_book.extract_order_book_prices()
+                older = _partial_payload(74105025900, [(1, 1)], [(2, 1)])
+                newest = _partial_payload(74105025910, [(113678.85, 1), (113678.5, 2)], [(113679, 3)])
+                buffer = deque([json.dumps(older), json.dumps(newest)])
+                task = asyncio.create_task(ws_partial_processing(order_book, buffer))
+                await asyncio.sleep(0.1)
+
+                assert order_book.ob_bids == {113678.85: 1.0, 113678.5: 2.0}
+                assert order_book.ob_asks == {113679.0: 3.0}
+                assert order_book.ob_bids_prices == [113678.5, 113678.85] and order_book.ob_asks_prices == [113679.0]
+                assert order_book.last_update_id == 74105025910 and not buffer
+
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                        await task
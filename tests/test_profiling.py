@@ -0,0 +1,99 @@
+import pytest
+import asyncio
+import pstats
+from src.utils.profiling import StageProfiler, get_profiler, install_order_book_profiling
+from src.order_book.order_book_class import OrderBook
+
+
+@pytest.mark.describe('Profiling switched on and off with the LOB_PROFILE environment variable')
+class TestGetProfiler:
+
+    @pytest.mark.it('returns None when the variable is not set or switched off')
+    @pytest.mark.parametrize('value', [None, '', '0', 'off'])
+    def test_disabled(self, monkeypatch, value):
+        if value is None:
+            monkeypatch.delenv('LOB_PROFILE', raising=False)
+        else:
+            monkeypatch.setenv('LOB_PROFILE', value)
+        assert get_profiler() is None
+
+
+    @pytest.mark.it('returns a profiler in the requested mode')
+    @pytest.mark.parametrize('value, expected_mode', [('1', 'stages'), ('stages', 'stages'), ('FULL', 'full')])
+    def test_enabled(self, monkeypatch, value, expected_mode):
+        monkeypatch.setenv('LOB_PROFILE', value)
+        assert get_profiler().mode == expected_mode
+
+
+@pytest.mark.describe('Stage profiler')
+class TestStageProfiler:
+
+    @pytest.mark.it('counts every resumption of a wrapped coroutine and returns its result')
+    @pytest.mark.asyncio
+    async def test_wrap_coroutine(self):
+        profiler = StageProfiler()
+
+        async def stage():
+            for _ in range(3):
+                await asyncio.sleep(0)
+            return 'done'
+
+        assert await profiler.wrap_coroutine('stage', stage()) == 'done'
+        assert profiler.report()['stage']['calls'] == 4
+
+
+    @pytest.mark.it('passes cancellation to an infinite coroutine')
+    @pytest.mark.asyncio
+    async def test_cancel(self):
+        profiler = StageProfiler()
+        cancelled = asyncio.Event()
+
+        async def infinite():
+            try:
+                while True:
+                    await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        task = asyncio.create_task(profiler.wrap_coroutine('infinite', infinite()))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert cancelled.is_set()
+        assert profiler.report()['infinite']['calls'] > 1
+
+
+    @pytest.mark.it('wraps OrderBook apply methods without changing their results')
+    @pytest.mark.asyncio
+    async def test_install_order_book_profiling(self):
+        class ProfiledOrderBook(OrderBook):
+            pass
+
+        profiler = StageProfiler()
+        install_order_book_profiling(profiler, ProfiledOrderBook)
+        order_book = ProfiledOrderBook({"lastUpdateId": 1,
+                                        "bids": [["113678.85000000", "7.25330000"]],
+                                        "asks": [["113678.86000000", "1.93563000"]]})
+        await order_book.extract_order_book_prices()
+        bids, asks = await order_book.update_order_book({'b': [['113678.80000000', '1.00000000']], 'a': []})
+        assert bids == {113678.85: 7.2533, 113678.8: 1.0}
+        assert profiler.report()['ProfiledOrderBook.update_order_book']['calls'] == 1
+
+
+    @pytest.mark.it('writes stats that pstats can read')
+    @pytest.mark.asyncio
+    async def test_dump(self, tmp_path):
+        profiler = StageProfiler('full', str(tmp_path))
+        profiler.start()
+
+        async def stage():
+            return sum(range(1000))
+
+        await profiler.wrap_coroutine('ws_processing', stage())
+        paths = profiler.dump()
+        assert len(paths) == 2
+        stats = pstats.Stats(paths[0])
+        assert ('<stage>', 0, 'ws_processing') in stats.stats
+        pstats.Stats(paths[1])
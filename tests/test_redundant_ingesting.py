@@ -0,0 +1,113 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+from collections import deque
+import websockets
+from src.wb_sockets.redundant_ingesting import extract_update_ids, FirstArrivalDeduplicator, ws_redundant_ingestion
+
+
+def _frame(first_update_id, final_update_id, separators=(',', ':')):
+    return json.dumps({"e": "depthUpdate", "E": 1753786825814, "s": "BTCUSDT",
+                       "U": first_update_id, "u": final_update_id,
+                       "b": [["118300.00000000", "1.73150000"]], "a": []}, separators=separators)
+
+
+@pytest.fixture
+def frames():
+    return [_frame(100 + 10 * i, 109 + 10 * i) for i in range(20)]
+
+
+@pytest_asyncio.fixture
+async def stand_in_server(frames):
+    """
+    Local stand-in for the Binance stream: every client gets the same frames,
+    the n-th connection gets each frame with delays[n] seconds of extra delay.
+    """
+    delays = []
+    connection_count = 0
+
+    async def handler(websocket):
+        nonlocal connection_count
+        delay = delays[connection_count]
+        connection_count += 1
+        for frame in frames:
+            await asyncio.sleep(0.005 + delay)
+            await websocket.send(frame)
+        await websocket.wait_closed()
+
+    async with websockets.serve(handler, '127.0.0.1', 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        yield f'ws://127.0.0.1:{port}', delays
+
+
+@pytest.mark.describe('Reading update IDs from raw frames')
+class TestExtractUpdateIds:
+
+    @pytest.mark.it('reads U and u from compact and spaced JSON')
+    @pytest.mark.parametrize('separators', [(',', ':'), (', ', ': ')])
+    def test_reads_ids(self, separators):
+        assert extract_update_ids(_frame(157, 160, separators)) == (157, 160)
+
+
+    @pytest.mark.it('returns None for frames which are not depth updates')
+    def test_non_depth_frames(self):
+        assert extract_update_ids('{"result": null, "id": 1}') is None
+
+
+@pytest.mark.describe('First-arrival deduplication')
+class TestFirstArrivalDeduplicator:
+
+    @pytest.mark.it('forwards the first copy of each update and drops later copies')
+    def test_deduplicates(self, frames):
+        buffer = deque()
+        deduplicator = FirstArrivalDeduplicator(buffer, 2)
+        for frame in frames[:3]:
+            assert deduplicator.accept(0, frame)
+        for frame in frames[:4]:
+            deduplicator.accept(1, frame)
+        assert list(buffer) == frames[:4]
+        stats = deduplicator.snapshot()
+        assert stats[0]['wins'] == 3 and stats[0]['duplicates'] == 0
+        assert stats[1]['wins'] == 1 and stats[1]['duplicates'] == 3
+
+
+@pytest.mark.describe('Redundant ingestion against a local stand-in server')
+class TestWsRedundantIngestion:
+
+    @pytest.mark.it('merges two connections with injected delay into one ordered stream without duplicates')
+    @pytest.mark.asyncio
+    async def test_merges_connections(self, stand_in_server, frames):
+        uri, delays = stand_in_server
+        delays.extend([0.0, 0.02])
+        buffer = deque()
+        async with websockets.connect(uri) as fast, websockets.connect(uri) as slow:
+            deduplicator = FirstArrivalDeduplicator(buffer, 2)
+            task = asyncio.create_task(ws_redundant_ingestion([fast, slow], buffer, deduplicator=deduplicator))
+            await asyncio.sleep(0.8)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        assert list(buffer) == frames
+        fast_stats, slow_stats = deduplicator.snapshot()
+        assert fast_stats['wins'] > slow_stats['wins']
+        assert slow_stats['lag_p50_ms'] > 0
+
+
+    @pytest.mark.it('keeps ingesting from the other connection when one fails')
+    @pytest.mark.asyncio
+    async def test_failover(self, stand_in_server, frames):
+        uri, delays = stand_in_server
+        delays.extend([0.0, 0.0])
+        buffer = deque()
+        async with websockets.connect(uri) as first, websockets.connect(uri) as second:
+            deduplicator = FirstArrivalDeduplicator(buffer, 2)
+            task = asyncio.create_task(ws_redundant_ingestion([first, second], buffer, deduplicator=deduplicator))
+            await asyncio.sleep(0.03)
+            await first.close()
+            await asyncio.sleep(0.4)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        assert list(buffer) == frames
+        assert deduplicator.snapshot()[0]['connected'] is False
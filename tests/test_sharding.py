@@ -0,0 +1,116 @@
+import pytest
+import asyncio
+import time
+from order_book.sharding import assign_symbols, plan_rebalance, Move, ShardCoordinator
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'SOLUSDT', 'XRPUSDT']
+
+
+@pytest.mark.describe('Symbol assignment')
+class TestAssignSymbols:
+
+    @pytest.mark.it('splits the symbols evenly by count when no loads are known')
+    def test_even_split(self):
+        shards = assign_symbols(SYMBOLS, 2)
+        assert sorted(len(shard) for shard in shards) == [2, 3]
+        assert sorted(symbol for shard in shards for symbol in shard) == sorted(SYMBOLS)
+
+
+    @pytest.mark.it('gives a hot symbol a worker of its own')
+    def test_hot_symbol(self):
+        loads = {'BTCUSDT': 0.9, 'ETHUSDT': 0.2, 'BNBUSDT': 0.2, 'SOLUSDT': 0.2, 'XRPUSDT': 0.2}
+        shards = assign_symbols(SYMBOLS, 2, loads)
+        assert ['BTCUSDT'] in shards
+
+
+@pytest.mark.describe('Rebalance planning')
+class TestPlanRebalance:
+
+    @pytest.mark.it('moves the symbol closest to half the gap from the hottest to the coolest worker')
+    def test_moves_symbol(self):
+        assignment = [['BTCUSDT', 'ETHUSDT', 'BNBUSDT'], ['SOLUSDT', 'XRPUSDT']]
+        loads = {'BTCUSDT': 0.5, 'ETHUSDT': 0.3, 'BNBUSDT': 0.2, 'SOLUSDT': 0.05, 'XRPUSDT': 0.05}
+        # Gap 0.9: moving BTCUSDT (0.5) leaves 0.5 vs 0.6, moving ETHUSDT (0.3) would leave 0.7 vs 0.4
+        assert plan_rebalance(assignment, loads) == [Move('BTCUSDT', 0, 1)]
+
+
+    @pytest.mark.it('does nothing when the load is balanced or the hot worker has a single symbol')
+    def test_no_move(self):
+        loads = {'BTCUSDT': 0.9, 'ETHUSDT': 0.3, 'BNBUSDT': 0.3}
+        assert plan_rebalance([['BTCUSDT'], ['ETHUSDT', 'BNBUSDT']], loads) == []
+        assert plan_rebalance([['ETHUSDT'], ['BNBUSDT']], loads) == []
+        assert plan_rebalance([['ETHUSDT', 'BNBUSDT']], loads) == []
+
+
+    @pytest.mark.it('converges instead of moving symbols back and forth')
+    def test_converges(self):
+        assignment = [list(SYMBOLS), []]
+        loads = {'BTCUSDT': 0.4, 'ETHUSDT': 0.3, 'BNBUSDT': 0.2, 'SOLUSDT': 0.1, 'XRPUSDT': 0.1}
+        moves = []
+        for _ in range(10):
+            planned = plan_rebalance(assignment, loads)
+            for move in planned:
+                assignment[move.from_worker].remove(move.symbol)
+                assignment[move.to_worker].append(move.symbol)
+            moves += planned
+        assert 1 <= len(moves) <= 3
+        worker_loads = [sum(loads[symbol] for symbol in shard) for shard in assignment]
+        assert max(worker_loads) <= 1.25 * sum(worker_loads) / 2
+
+
+@pytest.mark.describe('Shard coordinator')
+class TestShardCoordinator:
+
+    @pytest.mark.it('measures the load of a symbol between the last two reports of its worker')
+    def test_recent_loads(self):
+        coordinator = ShardCoordinator(SYMBOLS, num_workers = 2)
+        first, second = coordinator.assignment
+
+        def report(reported_at, cpu):
+            return {'pid': 1, 'reported_at': reported_at,
+                    'manager': {'symbols': {symbol: {'cpu_s': cpu.get(symbol, 0.0)} for symbol in first}}}
+
+        # Hours of running quietly, then the first symbol gets hot
+        coordinator.record_report(0, report(10_000.0, {first[0]: 100.0}))
+        assert coordinator.symbol_loads() == {}
+        coordinator.record_report(0, report(10_002.0, {first[0]: 101.6}))
+        loads = coordinator.symbol_loads()
+        assert loads[first[0]] == pytest.approx(0.8) and loads[first[1]] == 0.0
+        assert not set(loads) & set(second)
+
+        # Moved away, the symbol no longer counts for its old worker
+        hot = first[0]
+        coordinator.assignment[0].remove(hot)
+        assert hot not in coordinator.symbol_loads()
+
+
+    @pytest.mark.it('runs a worker process per shard, aggregates their reports and applies reassignments')
+    @pytest.mark.asyncio
+    async def test_workers_report_and_rebalance(self):
+        # Nothing listens on port 9: the workers keep reconnecting, which is enough to exercise the plumbing
+        coordinator = ShardCoordinator(SYMBOLS, num_workers = 2, report_interval = 0.05, rebalance_interval = 3600,
+                                       manager_options = {'base_uri': 'ws://127.0.0.1:9/stream', 'backoff_cap': 0.1})
+        task = asyncio.create_task(coordinator.run())
+        try:
+            deadline = time.monotonic() + 20
+            while len(coordinator.reports) < 2 and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            stats = coordinator.snapshot()
+            assert [worker['alive'] for worker in stats['workers']] == [True, True]
+            assert len({worker['pid'] for worker in stats['workers']}) == 2
+            assert sorted(stats['symbols']) == sorted(SYMBOLS)
+
+            source = coordinator.assignment[0]
+            moves = coordinator.rebalance({symbol: (1.0 if symbol in source else 0.01) for symbol in SYMBOLS})
+            assert len(moves) == 1
+            moved = moves[0].symbol
+            while moved not in coordinator.reports[1]['manager']['symbols'] and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                coordinator.collect_reports()
+            assert moved in coordinator.reports[1]['manager']['symbols']
+            assert coordinator.snapshot()['rebalances'] == 1
+        finally:
+            coordinator.stop()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        assert not any(worker['alive'] for worker in coordinator.snapshot()['workers'])
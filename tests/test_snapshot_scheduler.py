@@ -0,0 +1,104 @@
+import pytest
+import asyncio
+import time
+import aiohttp
+import yarl
+# Imported the way the scheduler sees them (src/ on sys.path, see conftest.py), so monkeypatching reaches it
+from order_book import snapshot_scheduler as scheduler_module
+from order_book.snapshot_scheduler import SnapshotScheduler
+from wb_sockets import syncing as syncing_module
+
+
+@pytest.fixture
+def fake_rest(monkeypatch):
+    """
+    Fake /api/v3/depth: records (symbol, sent at) and answers after `latency` seconds.
+    `failures` is a list of exceptions raised by the next requests.
+    """
+    sent, failures, settings = [], [], {'latency': 0.0}
+
+    async def fake_request_depth_snapshot(session, symbol = 'BTCUSDT', limit = 20):
+        sent.append((symbol, time.monotonic()))
+        await asyncio.sleep(settings['latency'])
+        if failures:
+            raise failures.pop(0)
+        return {"lastUpdateId": len(sent), "bids": [], "asks": []}, None
+    monkeypatch.setattr(syncing_module, 'request_depth_snapshot', fake_request_depth_snapshot)
+    return sent, failures, settings
+
+
+def _rate_limited(retry_after):
+    url = yarl.URL('https://api.binance.com/api/v3/depth')
+    return aiohttp.ClientResponseError(aiohttp.RequestInfo(url, 'GET', {}, url), (), status = 429,
+                                       headers = {'Retry-After': retry_after})
+
+
+@pytest.mark.describe('Snapshot scheduler')
+class TestSnapshotScheduler:
+
+    @pytest.mark.it('keeps the request weight within the budget and reports the time to serve every symbol')
+    @pytest.mark.asyncio
+    async def test_weight_budget(self, monkeypatch, fake_rest):
+        sent, _, _ = fake_rest
+        monkeypatch.setattr(scheduler_module, 'WEIGHT_WINDOW_S', 0.3)
+        # 4 requests of weight 5 per window
+        scheduler = SnapshotScheduler(object(), weight_budget = 20 / 6000, max_in_flight = 10)
+        symbols = [f'SYM{i}USDT' for i in range(10)]
+        results = await asyncio.gather(*(scheduler.fetch(symbol) for symbol in symbols))
+        await scheduler.close()
+
+        assert sorted(symbol for symbol, _ in sent) == sorted(symbols)
+        assert all(snapshot['lastUpdateId'] == last_update_id for snapshot, last_update_id in results)
+        for _, sent_at in sent:
+            assert sum(1 for _, other in sent if sent_at <= other < sent_at + 0.29) <= 4
+        burst = scheduler.bursts[-1]
+        assert (burst.requests, burst.symbols, burst.weight) == (10, 10, 50)
+        assert burst.duration_s >= 0.6
+
+
+    @pytest.mark.it('sends the longest stale, busiest symbols first')
+    @pytest.mark.asyncio
+    async def test_priority(self, fake_rest):
+        sent, _, settings = fake_rest
+        settings['latency'] = 0.05
+        scheduler = SnapshotScheduler(object(), max_in_flight = 1)
+        now = time.monotonic()
+        first = asyncio.create_task(scheduler.fetch('FIRSTUSDT'))
+        await asyncio.sleep(0.01)
+        # Queued while FIRSTUSDT is in flight
+        await asyncio.gather(first,
+                             scheduler.fetch('QUIETUSDT', stale_since = now - 1, traffic = lambda: 0),
+                             scheduler.fetch('BUSYUSDT', stale_since = now - 1, traffic = lambda: 50),
+                             scheduler.fetch('OLDUSDT', stale_since = now - 10, traffic = lambda: 0))
+        await scheduler.close()
+        assert [symbol for symbol, _ in sent] == ['FIRSTUSDT', 'BUSYUSDT', 'OLDUSDT', 'QUIETUSDT']
+
+
+    @pytest.mark.it('pauses every request for Retry-After on 429 and sends the request again')
+    @pytest.mark.asyncio
+    async def test_rate_limited(self, fake_rest):
+        sent, failures, _ = fake_rest
+        failures.append(_rate_limited('0.2'))
+        scheduler = SnapshotScheduler(object(), max_in_flight = 1)
+        started = time.monotonic()
+        await asyncio.gather(scheduler.fetch('BTCUSDT'), scheduler.fetch('ETHUSDT'))
+        await scheduler.close()
+        assert len(sent) == 3 and scheduler.rate_limited == 1
+        assert sent[1][1] - started >= 0.2
+        assert scheduler.bursts[-1].rate_limited_s > 0
+
+
+    @pytest.mark.it('drops a queued request when its caller gives up')
+    @pytest.mark.asyncio
+    async def test_cancelled_while_queued(self, fake_rest):
+        sent, _, settings = fake_rest
+        settings['latency'] = 0.1
+        scheduler = SnapshotScheduler(object(), max_in_flight = 1)
+        first = asyncio.create_task(scheduler.fetch('BTCUSDT'))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.fetch('ETHUSDT'), timeout = 0.02)
+        await first
+        await asyncio.sleep(0.05)
+        await scheduler.close()
+        assert [symbol for symbol, _ in sent] == ['BTCUSDT']
+        assert scheduler.snapshot()['pending'] == 0
@@ -0,0 +1,111 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+import aiohttp
+from order_book.order_book_class import OrderBook
+from order_book.snapshot_server import SnapshotServer, encode_depth, encode_frozen_depth, capture_levels
+
+
+@pytest_asyncio.fixture
+async def order_book():
+    order_book = OrderBook({"lastUpdateId": 100,
+                            "bids": [["113678.85000000", "7.25330000"], ["113678.84000000", "0.77360000"],
+                                     ["113677.94000000", "0.00005000"]],
+                            "asks": [["113678.86000000", "1.93563000"], ["113679.35000000", "0.03677000"]]})
+    await order_book.extract_order_book_prices()
+    return order_book
+
+
+@pytest_asyncio.fixture
+async def server(order_book):
+    server = SnapshotServer(lambda symbol: order_book if symbol == 'BTCUSDT' else None, port = 0)
+    await server.start()
+    yield server, f'http://127.0.0.1:{server.port}'
+    await server.stop()
+
+
+@pytest.mark.describe('Depth encoding')
+class TestEncodeDepth:
+
+    @pytest.mark.it('encodes the best levels first in the Binance /api/v3/depth shape')
+    @pytest.mark.asyncio
+    async def test_encode(self, order_book):
+        body = json.loads(encode_depth(*capture_levels(order_book, 2)))
+        assert body == {"lastUpdateId": 100,
+                        "bids": [["113678.85000000", "7.25330000"], ["113678.84000000", "0.77360000"]],
+                        "asks": [["113678.86000000", "1.93563000"], ["113679.35000000", "0.03677000"]]}
+
+
+    @pytest.mark.it('encodes a copy-on-write snapshot the same way')
+    @pytest.mark.asyncio
+    async def test_encode_frozen(self, order_book):
+        assert encode_frozen_depth(order_book.take_snapshot(), 2) == encode_depth(*capture_levels(order_book, 2))
+
+
+@pytest.mark.describe('Snapshot server')
+class TestSnapshotServer:
+
+    @pytest.mark.it('serves the book at the requested depth and encodes identical requests once per update ID')
+    @pytest.mark.asyncio
+    async def test_depth_endpoint_and_cache(self, server, order_book):
+        server, url = server
+        async with aiohttp.ClientSession() as session:
+            responses = await asyncio.gather(*(session.get(f'{url}/api/v3/depth?symbol=btcusdt&limit=2') for _ in range(10)))
+            bodies = [await response.json() for response in responses]
+            assert all(response.status == 200 for response in responses)
+            assert all(body == bodies[0] for body in bodies)
+            assert len(bodies[0]['bids']) == 2 and bodies[0]['lastUpdateId'] == 100
+            assert (server.cache.hits, server.cache.misses) == (9, 1)
+
+            await order_book.update_order_book({"U": 101, "u": 102, "b": [], "a": [["113678.86000000", "0"]]})
+            await order_book.update_price_lists({"U": 101, "u": 102, "b": [], "a": [["113678.86000000", "0"]]})
+            async with session.get(f'{url}/api/v3/depth?symbol=BTCUSDT&limit=2') as response:
+                body = await response.json()
+            assert body['lastUpdateId'] == 102
+            assert body['asks'][0] == ["113679.35000000", "0.03677000"]
+            assert server.cache.misses == 2
+
+            async with session.get(f'{url}/stats') as response:
+                stats = await response.json()
+            assert stats['requests'] == 11
+            assert stats['cache_hit_rate'] == pytest.approx(9 / 11)
+            assert stats['latency_p99_ms'] > 0
+
+
+    @pytest.mark.it('serves deep requests of a book with copy-on-write snapshots from a snapshot')
+    @pytest.mark.asyncio
+    async def test_deep_from_snapshot(self, server, order_book):
+        server, url = server
+        order_book.enable_snapshots()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'{url}/api/v3/depth?symbol=BTCUSDT&limit=1000') as response:
+                body = await response.json()
+        assert body == json.loads(encode_depth(*capture_levels(order_book, 1000)))
+        assert order_book.cow_ladders.snapshot()['freezes'] == 1
+
+
+    @pytest.mark.it('rejects invalid limits and answers 503 before a book is available')
+    @pytest.mark.asyncio
+    async def test_errors(self, server):
+        server, url = server
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'{url}/api/v3/depth?symbol=BTCUSDT&limit=0') as response:
+                assert response.status == 400
+            async with session.get(f'{url}/api/v3/depth?symbol=BTCUSDT&limit=abc') as response:
+                assert response.status == 400
+            async with session.get(f'{url}/api/v3/depth?symbol=ETHUSDT') as response:
+                assert response.status == 503
+        assert server.snapshot()['errors'] == 3
+
+
+    @pytest.mark.it('answers snapshot requests over the websocket')
+    @pytest.mark.asyncio
+    async def test_websocket(self, server):
+        server, url = server
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f'{url}/ws') as websocket:
+                await websocket.send_str(json.dumps({'symbol': 'BTCUSDT', 'limit': 1}))
+                body = json.loads(await websocket.receive_str())
+        assert body['bids'] == [["113678.85000000", "7.25330000"]]
+        assert server.snapshot()['requests'] == 1
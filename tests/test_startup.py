@@ -0,0 +1,115 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+import threading
+import time
+import websockets
+# Imported the way main.py sees them (src/ on sys.path, see conftest.py), so that
+# monkeypatching affects the modules the startup actually uses
+from order_book import startup as startup_module
+from order_book import orchestrator as orchestrator_module
+from order_book.order_book_class import OrderBook
+from wb_sockets import syncing as syncing_module
+
+
+@pytest_asyncio.fixture
+async def stand_in_server():
+    """
+    Local stand-in for the Binance stream: confirms the subscription after a delay (slow handshake)
+    and then sends a continuous stream of depth updates starting at U=100.
+    """
+    async def handler(websocket):
+        await websocket.recv()
+        await asyncio.sleep(0.1)
+        await websocket.send(json.dumps({"result": None, "id": 1}))
+        first_update_id = 100
+        try:
+            while True:
+                await websocket.send(json.dumps({"e": "depthUpdate", "E": 1753786825814, "s": "BTCUSDT",
+                                                 "U": first_update_id, "u": first_update_id + 4,
+                                                 "b": [["113678.80000000", "1.00000000"]], "a": []}))
+                first_update_id += 5
+                await asyncio.sleep(0.01)
+        except websockets.ConnectionClosed:
+            pass
+
+    async with websockets.serve(handler, '127.0.0.1', 0) as server:
+        yield f'ws://127.0.0.1:{server.sockets[0].getsockname()[1]}'
+
+
+@pytest.fixture
+def fake_rest(monkeypatch):
+    calls = []
+
+    async def fake_get_order_book(session = None, symbol = 'BTCUSDT'):
+        calls.append(time.perf_counter())
+        await asyncio.sleep(0.15)
+        return {"lastUpdateId": 102,
+                "bids": [["113678.85000000", "7.25330000"]],
+                "asks": [["113678.86000000", "1.93563000"]]}, 102
+
+    async def fake_create_and_save_local_order_book(snapshot, order_book_last_update_id):
+        order_book = OrderBook(snapshot)
+        await order_book.extract_order_book_prices()
+        return order_book
+
+    monkeypatch.setattr(startup_module, 'get_order_book', fake_get_order_book)
+    monkeypatch.setattr(syncing_module, 'get_order_book', fake_get_order_book)
+    monkeypatch.setattr(orchestrator_module, 'create_and_save_local_order_book', fake_create_and_save_local_order_book)
+    return calls
+
+
+@pytest.mark.describe('Concurrent startup')
+class TestConcurrentStartup:
+
+    @pytest.mark.it('requests the snapshot while subscribing and reports the cold-start timings')
+    @pytest.mark.asyncio
+    async def test_overlaps_snapshot_and_subscription(self, stand_in_server, fake_rest):
+        started_at = time.perf_counter()
+        async with startup_module.concurrent_startup(stand_in_server, session = object()) as started:
+            timings = started.timings
+            assert isinstance(started.order_book, OrderBook)
+            assert not started.ws_ingestion_task.done()
+
+        # The only snapshot request went out before the subscription was confirmed
+        assert len(fake_rest) == 1
+        assert (fake_rest[0] - started_at) * 1000 < timings.subscribed_ms
+        assert timings.connected_ms <= timings.subscribed_ms <= timings.first_valid_book_ms
+        # Snapshot (150 ms) and subscription (100 ms) overlapped instead of adding up
+        assert timings.first_valid_book_ms < 250
+        assert started.ws_ingestion_task.cancelled()
+
+
+    @pytest.mark.it('runs the processing on a dedicated thread fed through a ring')
+    @pytest.mark.asyncio
+    async def test_threaded_processing(self, stand_in_server, fake_rest):
+        async with startup_module.concurrent_startup(stand_in_server, session = object(),
+                                                     threaded_processing = True) as started:
+            await asyncio.sleep(0.2)
+            assert not started.ws_processing_task.done()
+            assert started.order_book.last_update_id > 102
+            assert any(thread.name == 'ws-processing' for thread in threading.enumerate())
+        assert started.ws_processing_task.cancelled()
+
+
+    @pytest.mark.it('opens the redundant connections concurrently')
+    @pytest.mark.asyncio
+    async def test_concurrent_connections(self, stand_in_server, fake_rest):
+        class SlowHandshake:
+            # 100 ms before every connection is open
+            def __init__(self, uri):
+                self.connection = websockets.connect(uri)
+
+            async def __aenter__(self):
+                await asyncio.sleep(0.1)
+                return await self.connection.__aenter__()
+
+            async def __aexit__(self, *args):
+                return await self.connection.__aexit__(*args)
+
+        async with startup_module.concurrent_startup(stand_in_server, session = object(), connections = 3,
+                                                     connect = SlowHandshake) as started:
+            timings = started.timings
+            assert len(started.websockets) == 3
+        assert timings.connected_ms < 200
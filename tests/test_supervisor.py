@@ -0,0 +1,142 @@
+import pytest
+import asyncio
+import random
+import time
+# Imported the way main.py sees them (src/ on sys.path, see conftest.py), so that
+# monkeypatching startup affects the module the supervisor actually uses
+from order_book import startup as startup_module
+from order_book.supervisor import BookSupervisor, StreamStalledException, backoff_delay
+from utils.metrics import PipelineMetrics
+
+
+class FakeWebSocket:
+    def __init__(self, ping_latency = 0.001):
+        self.ping_latency = ping_latency
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def ping(self):
+        async def _pong():
+            await asyncio.sleep(self.ping_latency)
+            return self.ping_latency
+        return asyncio.ensure_future(_pong())
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    """
+    Replaces subscribing and syncing with fakes: every session gets a new book object,
+    and its ingestion 'receives' frames for `frames_for` seconds and then goes silent.
+    """
+    state = {'sessions': 0, 'frames_for': 0.2}
+
+    async def fake_subscriber(websocket):
+        return None
+
+    async def fake_get_order_book(session):
+        return {'lastUpdateId': 1, 'bids': [], 'asks': []}, 1
+
+    async def fake_orchestrator(websocket, metrics, profiler, session = None, prefetched_snapshot = None, threaded = False):
+        state['sessions'] += 1
+        book = {'session': state['sessions']}
+
+        async def ingestion():
+            started = time.monotonic()
+            while True:
+                if time.monotonic() - started < state['frames_for']:
+                    metrics.stamp('{}')
+                await asyncio.sleep(0.01)
+
+        async def processing():
+            while True:
+                await asyncio.sleep(1)
+
+        return asyncio.create_task(ingestion()), asyncio.create_task(processing()), book
+
+    monkeypatch.setattr(startup_module, 'run_the_subscriber', fake_subscriber)
+    monkeypatch.setattr(startup_module, 'orchestrator', fake_orchestrator)
+    monkeypatch.setattr(startup_module, 'get_order_book', fake_get_order_book)
+    return state
+
+
+@pytest.mark.describe('Reconnect backoff')
+class TestBackoffDelay:
+
+    @pytest.mark.it('grows exponentially up to the cap and is jittered')
+    def test_backoff_delay(self):
+        rng = random.Random(1)
+        for attempt in range(10):
+            delays = [backoff_delay(attempt, base=0.5, cap=8, rng=rng) for _ in range(200)]
+            assert 0 <= min(delays)
+            assert max(delays) <= min(8, 0.5 * 2 ** attempt)
+            assert len(set(delays)) > 1
+
+
+@pytest.mark.describe('Long-running supervisor')
+class TestBookSupervisor:
+
+    @pytest.mark.it('reconnects after a silent stall and keeps the previous book until the new one is ready')
+    @pytest.mark.asyncio
+    async def test_reconnects_after_stall(self, fake_session):
+        supervisor = BookSupervisor('ws://fake', PipelineMetrics(), stall_timeout_ms=100, ping_interval=0,
+                                    backoff_base=0.01, backoff_cap=0.02, check_interval=0.01,
+                                    connect=lambda uri: FakeWebSocket())
+        task = asyncio.create_task(supervisor.run())
+        await asyncio.sleep(0.05)
+        assert supervisor.order_book == {'session': 1}
+
+        await asyncio.sleep(0.4)
+        stats = supervisor.snapshot()
+        assert stats['stalls'] >= 1
+        assert stats['reconnects'] >= 1
+        assert stats['downtime_s'] > 0
+        assert supervisor.order_book['session'] >= 2
+
+        supervisor.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+    @pytest.mark.it('treats a ping slower than the threshold as a stall')
+    @pytest.mark.asyncio
+    async def test_slow_ping(self, fake_session):
+        fake_session['frames_for'] = 10
+        supervisor = BookSupervisor('ws://fake', PipelineMetrics(), ping_interval=0.01, max_ping_latency_ms=20,
+                                    backoff_base=0.01, backoff_cap=0.02, check_interval=0.01,
+                                    connect=lambda uri: FakeWebSocket(ping_latency=0.5))
+        task = asyncio.create_task(supervisor.run())
+        await asyncio.sleep(0.2)
+        supervisor.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert supervisor.stalls >= 1
+
+
+    @pytest.mark.it('records the ping latency of a healthy connection')
+    @pytest.mark.asyncio
+    async def test_healthy_ping(self, fake_session):
+        fake_session['frames_for'] = 10
+        supervisor = BookSupervisor('ws://fake', PipelineMetrics(), ping_interval=0.01, check_interval=0.01,
+                                    connect=lambda uri: FakeWebSocket(ping_latency=0.001))
+        task = asyncio.create_task(supervisor.run())
+        await asyncio.sleep(0.1)
+        supervisor.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert supervisor.stalls == 0
+        assert supervisor.last_ping_latency_ms == pytest.approx(1)
+
+
+    @pytest.mark.it('reports a cancelled pipeline task as a stall')
+    @pytest.mark.asyncio
+    async def test_cancelled_task(self):
+        supervisor = BookSupervisor('ws://fake', PipelineMetrics(), ping_interval=0, check_interval=0.01)
+        task = asyncio.create_task(asyncio.sleep(10), name='ws_processing')
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        with pytest.raises(StreamStalledException, match='ws_processing was cancelled'):
+            await supervisor._watch([], [task])
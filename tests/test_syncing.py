@@ -1,5 +1,8 @@
 from unittest.mock import AsyncMock, patch
-from src.wb_sockets.syncing import get_order_book
+from collections import deque
+from src.wb_sockets.syncing import get_order_book, fetch_order_book_snapshot
+import asyncio
+import json
 import pytest
 
 
@@ -30,3 +33,33 @@ class TestGetOrderBook:
         assert order_book_last_update_id == 75310524787
         fake_response.raise_for_status.assert_called_once()
 
+
+
+@pytest.mark.describe('Snapshot validation with a prefetched request')
+class TestFetchOrderBookSnapshot:
+
+    @staticmethod
+    def _buffer(first_update_id):
+        return deque([json.dumps({"e": "depthUpdate", "U": first_update_id, "u": first_update_id + 5, "b": [], "a": []})])
+
+    @pytest.mark.it('uses the prefetched snapshot when it is recent enough')
+    @pytest.mark.asyncio
+    async def test_uses_prefetched_snapshot(self):
+        prefetched = asyncio.get_running_loop().create_future()
+        prefetched.set_result(({"lastUpdateId": 105}, 105))
+        with patch('src.wb_sockets.syncing.get_order_book') as fake_get_order_book:
+            snapshot, order_book_last_update_id = await fetch_order_book_snapshot(self._buffer(100), prefetched=prefetched)
+        assert order_book_last_update_id == 105
+        fake_get_order_book.assert_not_called()
+
+
+    @pytest.mark.it('requests a new snapshot when the prefetched one is older than the stream')
+    @pytest.mark.asyncio
+    async def test_refetches_stale_snapshot(self):
+        prefetched = asyncio.get_running_loop().create_future()
+        prefetched.set_result(({"lastUpdateId": 90}, 90))
+        session = object()
+        with patch('src.wb_sockets.syncing.get_order_book', new=AsyncMock(return_value=({"lastUpdateId": 110}, 110))) as fake_get_order_book:
+            snapshot, order_book_last_update_id = await fetch_order_book_snapshot(self._buffer(100), session, prefetched)
+        assert order_book_last_update_id == 110
+        fake_get_order_book.assert_awaited_once_with(session, 'BTCUSDT')
@@ -0,0 +1,121 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+import threading
+import time
+from wb_sockets.threaded_processing import SpscRing, ws_threaded_processing
+from wb_sockets.processing import MissingMessageInIngestedStream
+from order_book.order_book_class import OrderBook
+
+
+@pytest_asyncio.fixture
+async def order_book():
+    order_book = OrderBook({"lastUpdateId": 99,
+                            "bids": [[f"{100 - i}.00000000", "1.00000000"] for i in range(1, 11)],
+                            "asks": [[f"{100 + i}.00000000", "1.00000000"] for i in range(1, 11)]})
+    await order_book.extract_order_book_prices()
+    return order_book
+
+
+def _frame(update_id, bid_price = 95, qty = "2.00000000"):
+    return json.dumps({"e": "depthUpdate", "E": 1753786825814, "s": "BTCUSDT", "U": update_id, "u": update_id,
+                       "b": [[f"{bid_price}.00000000", qty]], "a": []})
+
+
+class RecordingFeed:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, message, order_book):
+        self.published.append((threading.current_thread().name, message['u']))
+
+
+@pytest.mark.describe('Single-producer single-consumer ring')
+class TestSpscRing:
+
+    @pytest.mark.it('behaves like the buffer deque for the syncing and processing code')
+    def test_deque_methods(self):
+        ring = SpscRing(4)
+        for frame in ('a', 'b', 'c'):
+            assert ring.append(frame)
+        assert len(ring) == 3 and ring[0] == 'a' and ring[-1] == 'c' and list(ring) == ['a', 'b', 'c']
+        assert ring.popleft() == 'a'
+        ring.appendleft('a')
+        assert list(ring) == ['a', 'b', 'c'] and ring[1] == 'b'
+        assert ring.append('d') and ring.append('e')
+        # Full: the put back frame lives on the consumer side, the ring holds b, c, d, e
+        assert not ring.append('f') and ring.dropped == 1
+        assert [ring.popleft() for _ in range(5)] == ['a', 'b', 'c', 'd', 'e']
+        with pytest.raises(IndexError):
+            ring.popleft()
+        with pytest.raises(IndexError):
+            ring[0]
+        ring.append('g')
+        ring.clear()
+        assert not ring and list(ring) == []
+        with pytest.raises(ValueError):
+            SpscRing(6)
+
+
+    @pytest.mark.it('hands frames from one thread to another in order')
+    def test_concurrent_order(self):
+        ring = SpscRing(256)
+        count = 20000
+        received = []
+
+        def produce():
+            sent = 0
+            while sent < count:
+                if ring.append(sent):
+                    sent += 1
+                else:
+                    time.sleep(0)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        while len(received) < count:
+            if ring:
+                received.append(ring.popleft())
+            else:
+                time.sleep(0)
+        producer.join()
+        assert received == list(range(count))
+
+
+@pytest.mark.describe('Processing on a dedicated thread')
+class TestWsThreadedProcessing:
+
+    @pytest.mark.it('applies the updates on its thread and publishes the feed back on the event loop')
+    @pytest.mark.asyncio
+    async def test_applies_on_thread(self, order_book):
+        applied_on = set()
+        order_book.add_level_listener(lambda book, bids, asks: applied_on.add(threading.current_thread().name))
+        ring = SpscRing(64)
+        feed = RecordingFeed()
+        task = asyncio.create_task(ws_threaded_processing(order_book, ring, feed = feed))
+        for update_id in range(100, 110):
+            ring.append(_frame(update_id, 95, f"{update_id}.00000000"))
+        await asyncio.sleep(0.5)
+
+        # ws_processing keeps the last frame until the next one arrives
+        assert order_book.last_update_id == 108 and order_book.ob_bids[95.0] == 108.0
+        assert applied_on == {'ws-processing'}
+        assert feed.published == [(threading.current_thread().name, update_id) for update_id in range(100, 109)]
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not any(thread.name == 'ws-processing' for thread in threading.enumerate())
+
+
+    @pytest.mark.it('ends with the continuity error of the processing')
+    @pytest.mark.asyncio
+    async def test_gap(self, order_book):
+        ring = SpscRing(64)
+        for update_id in (100, 101, 200, 201, 202, 203):
+            ring.append(_frame(update_id))
+        task = asyncio.create_task(ws_threaded_processing(order_book, ring))
+        with pytest.raises(MissingMessageInIngestedStream):
+            await asyncio.wait_for(task, timeout = 5)
+        assert order_book.last_update_id == 100
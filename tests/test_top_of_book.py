@@ -0,0 +1,80 @@
+import pytest
+import multiprocessing
+import os
+from types import SimpleNamespace
+from order_book.order_book_class import OrderBook
+from order_book.top_of_book import TopOfBookPublisher, TopOfBookReader
+
+
+def _segment(prefix):
+    # Unique per test run, so parallel or interrupted runs don't collide
+    return f'{prefix}_{os.getpid()}'
+
+
+def _hammer(name, depth, iterations):
+    # Runs in a separate process: every publish writes levels whose quantities equal the update ID,
+    # so a torn read shows up as quantities that don't match last_update_id
+    publisher = TopOfBookPublisher('TEST', depth, name = name)
+    book = SimpleNamespace(ob_bids_prices = [float(price) for price in range(1, depth + 1)],
+                           ob_asks_prices = [float(price) for price in range(100, 100 + depth)])
+    for update_id in range(1, iterations + 1):
+        book.ob_bids = dict.fromkeys(book.ob_bids_prices, float(update_id))
+        book.ob_asks = dict.fromkeys(book.ob_asks_prices, float(update_id))
+        book.last_update_id = update_id
+        publisher.publish(book)
+    publisher.close(unlink = False)
+
+
+@pytest.fixture
+def order_book():
+    return OrderBook({"lastUpdateId": 100,
+                      "bids": [["113678.85000000", "7.25330000"], ["113678.84000000", "0.77360000"]],
+                      "asks": [["113678.86000000", "1.93563000"], ["113900.35000000", "0.13677000"]]})
+
+
+@pytest.mark.describe('Shared-memory top of book')
+class TestTopOfBook:
+
+    @pytest.mark.it('publishes the best levels first with the last update ID')
+    @pytest.mark.asyncio
+    async def test_round_trip(self, order_book):
+        await order_book.extract_order_book_prices()
+        await order_book.update_order_book({"U": 101, "u": 105, "b": [["113678.80000000", "1.00000000"]], "a": []})
+        await order_book.update_price_lists({"U": 101, "u": 105, "b": [["113678.80000000", "1.00000000"]], "a": []})
+        publisher = TopOfBookPublisher('BTCUSDT', depth = 5, name = _segment('lob_test_round_trip'))
+        try:
+            publisher.publish(order_book)
+            reader = TopOfBookReader('BTCUSDT', name = publisher.name)
+            top = reader.read()
+            assert top.last_update_id == 105
+            assert top.bids == [(113678.85, 7.2533), (113678.84, 0.7736), (113678.8, 1.0)]
+            assert top.asks == [(113678.86, 1.93563), (113900.35, 0.13677)]
+            assert reader.best_bid_ask() == (105, 113678.85, 7.2533, 113678.86, 1.93563)
+            assert reader.staleness_ns() >= 0
+            reader.close()
+        finally:
+            publisher.close()
+
+
+    @pytest.mark.it('never returns a torn copy while another process keeps publishing')
+    def test_consistent_reads_under_contention(self):
+        name, depth = _segment('lob_test_contention'), 20
+        setup = TopOfBookPublisher('TEST', depth, name = name)
+        reader = TopOfBookReader('TEST', name = name)
+        writer = multiprocessing.get_context('spawn').Process(target = _hammer, args = (name, depth, 200000))
+        writer.start()
+        try:
+            reads = 0
+            while writer.is_alive() or reads == 0:
+                top = reader.read()
+                quantities = {qty for _, qty in top.bids + top.asks}
+                assert quantities <= {float(top.last_update_id)}
+                best = reader.best_bid_ask()
+                assert best.bid_qty == best.ask_qty == float(best.last_update_id) or best.last_update_id == 0
+                reads += 1
+            writer.join()
+            assert writer.exitcode == 0
+            assert reader.read().last_update_id == 200000
+        finally:
+            reader.close()
+            setup.close()